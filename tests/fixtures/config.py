@@ -23,7 +23,11 @@ def create_mock_config() -> Dict[str, Any]:
             "picnic_dinner": {
                 "emoji": "🥪",
                 "text": "a picnic dinner",
-                "response": "Alex will go shopping on his way home for a picnic dinner!"
+                "response": "Alex will go shopping on his way home for a picnic dinner!",
+                "shopping": [
+                    {"item": "sandwiches", "per_head": 1, "fixed": 1},
+                    {"item": "crisps", "unit": "bags", "per_head": 0.5}
+                ]
             },
             "pub_dinner": {
                 "emoji": "🍺", 
@@ -41,6 +45,80 @@ def create_mock_config() -> Dict[str, Any]:
         "messages": {
             "confirmation_request": "Alex is at the office! React with your availability:\n🏠 Free for all activities\n🏢 Busy evening, lunch only\n🕒 Busy all day\n🚗 Going home\n❓ Unsure\n\nThen confirm with 👍",
             "lunch_reminder": "Lunch reminder! It's {lunch_time} time.",
-            "evening_reminder": "Evening plans: {evening_plans}"
-        }
+            "evening_reminder": "Evening plans: {evening_plans}",
+            "participants": "Coming: {names}",
+            "shopping_list": "Shopping list:\n{items}"
+        },
+        "intake": {
+            "workers": 2,
+            "max_size": 10,
+            "overflow_timeout": 0.1
+        },
+        "backfill": {
+            "enabled": True,
+            "page_size": 2,
+            "batch_size": 2
+        },
+        "retention": {
+            "enabled": True,
+            "days": 30,
+            "batch_size": 2,
+            "interval_hours": 24
+        },
+        "members": {
+            "cache_size": 10,
+            "ttl": 3600
+        },
+        "participant_reminders": {
+            "enabled": False,
+            "mode": "dm",
+            "concurrency": 5,
+            "rate": 0
+        },
+        "cluster": {
+            "enabled": False,
+            "instance_id": "test-instance",
+            "reminder_lease": 300,
+            "reminder_batch_size": 20,
+            "leader_lease": 30
+        },
+        "outbox": {
+            "batch_size": 20,
+            "poll_interval": 30,
+            "base_delay": 5,
+            "max_delay": 900,
+            "max_attempts": 8,
+            "lease": 60
+        },
+        "circuit_breaker": {
+            "failure_threshold": 5,
+            "reset_timeout": 30,
+            "call_timeout": 10
+        },
+        "recording": {
+            "enabled": False,
+            "path": "wallingfordbot-recording.ndjson"
+        },
+        "sqlite": {
+            "profile": True,
+            "cache_mb": 16,
+            "mmap_mb": 64
+        },
+        "health": {
+            "probe_interval": 5,
+            "probe_timeout": 2,
+            "stale_after": 180
+        },
+        "profiling": {
+            "max_seconds": 60,
+            "sample_interval_ms": 5,
+            "memory_top": 50
+        },
+        "sessions": {
+            "reaction_window_days": 1
+        },
+        "export": {
+            "chunk_size": 2
+        },
+        "tenants": []
     }
\ No newline at end of file
@@ -3,9 +3,11 @@ from datetime import datetime
 from typing import Dict, Any
 from mautrix.types import (
     ReactionEvent, EventID, RoomID, UserID, EventContent, EventType,
-    RelationType, ReactionEventContent, RelatesTo
+    RelationType, ReactionEventContent, RelatesTo, RedactionEvent, RedactionEventContent
 )
 
+from wallingfordbot.repository import Session
+
 
 def create_mock_reaction_event(
     sender: str = "@testuser:example.com",
@@ -35,6 +37,45 @@ def create_mock_reaction_event(
     )
 
 
+def create_raw_reaction(
+    sender: str = "@testuser:example.com",
+    emoji: str = "🍽️",
+    target_event_id: str = "$event123:example.com",
+    timestamp: int = 1000
+) -> Dict[str, Any]:
+    """Create a reaction in client-server API JSON form, as returned by /relations."""
+    return {
+        "type": "m.reaction",
+        "event_id": f"${uuid.uuid4().hex}:example.com",
+        "sender": sender,
+        "origin_server_ts": timestamp,
+        "content": {
+            "m.relates_to": {
+                "rel_type": "m.annotation",
+                "event_id": target_event_id,
+                "key": emoji
+            }
+        }
+    }
+
+
+def create_mock_redaction_event(
+    sender: str = "@testuser:example.com",
+    room_id: str = "!grouproom:example.com",
+    redacts: str = "$reaction123:example.com"
+) -> RedactionEvent:
+    """Create a mock redaction event for testing."""
+    return RedactionEvent(
+        event_id=EventID(f"${uuid.uuid4().hex}:example.com"),
+        room_id=RoomID(room_id),
+        sender=UserID(sender),
+        timestamp=int(datetime.now().timestamp() * 1000),
+        content=RedactionEventContent(),
+        redacts=EventID(redacts),
+        type=EventType.ROOM_REDACTION
+    )
+
+
 def create_mock_session_data(
     session_id: str = None,
     date: str = None,
@@ -42,7 +83,9 @@ def create_mock_session_data(
     confirmed: bool = False,
     group_message_id: str = None,
     lunch_reminder_sent: bool = False,
-    evening_reminder_sent: bool = False
+    evening_reminder_sent: bool = False,
+    tenant_id: str = "default",
+    confirmation_event_id: str = None
 ) -> Dict[str, Any]:
     """Create mock workflow session data."""
     if session_id is None:
@@ -52,16 +95,23 @@ def create_mock_session_data(
     
     return {
         'id': session_id,
+        'tenant_id': tenant_id,
         'date': date,
         'alex_confirmation': alex_confirmation,
         'confirmed': confirmed,
         'group_message_id': group_message_id,
         'created_at': datetime.now(),
         'lunch_reminder_sent': lunch_reminder_sent,
-        'evening_reminder_sent': evening_reminder_sent
+        'evening_reminder_sent': evening_reminder_sent,
+        'confirmation_event_id': confirmation_event_id
     }
 
 
+def create_mock_session(**kwargs) -> Session:
+    """Create a mock workflow session record, as the repository returns it."""
+    return Session.from_row(create_mock_session_data(**kwargs))
+
+
 def create_mock_activity_reaction(
     session_id: str,
     user_id: str = "@testuser:example.com",
@@ -75,6 +125,7 @@ def create_mock_activity_reaction(
         'user_id': user_id,
         'activity': activity,
         'emoji': emoji,
+        'event_id': f"${uuid.uuid4().hex}:example.com",
         'created_at': datetime.now()
     }
 
@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from wallingfordbot.backfill import ReactionBackfill
+from tests.fixtures.matrix_events import create_raw_reaction
+
+
+@pytest.fixture
+def backfill():
+    client = MagicMock()
+    client.api.request = AsyncMock()
+    return ReactionBackfill(client, AsyncMock(), MagicMock(), page_size=2)
+
+
+class TestReactionBackfill:
+
+    @pytest.mark.asyncio
+    async def test_pages_until_exhausted(self, backfill):
+        backfill.client.api.request.side_effect = [
+            {"chunk": [create_raw_reaction(emoji="3", timestamp=3000),
+                       create_raw_reaction(emoji="2", timestamp=2000)],
+             "next_batch": "page2"},
+            {"chunk": [create_raw_reaction(emoji="1", timestamp=1000)]},
+        ]
+        
+        reactions = await backfill.fetch_reactions("!grouproom:example.com", "$event123:example.com")
+        
+        assert [r.content.relates_to.key for r in reactions] == ["1", "2", "3"]
+        assert str(reactions[0].room_id) == "!grouproom:example.com"
+        second_query = backfill.client.api.request.call_args_list[1][1]["query_params"]
+        assert second_query["from"] == "page2"
+        assert second_query["dir"] == "b"
+
+    @pytest.mark.asyncio
+    async def test_stops_at_checkpoint(self, backfill):
+        backfill.client.api.request.return_value = {
+            "chunk": [create_raw_reaction(emoji="new", timestamp=3000),
+                      create_raw_reaction(emoji="seen", timestamp=2000)],
+            "next_batch": "page2",
+        }
+        
+        reactions = await backfill.fetch_reactions(
+            "!grouproom:example.com", "$event123:example.com", since_ts=2000
+        )
+        
+        assert [r.content.relates_to.key for r in reactions] == ["new"]
+        backfill.client.api.request.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_load_checkpoints_queries_requested_events(self, backfill):
+        backfill.database.fetch.return_value = [{"event_id": "$a", "last_ts": 10}]
+        
+        assert await backfill.load_checkpoints(["$a", "$c"]) == {"$a": 10}
+        args = backfill.database.fetch.call_args[0]
+        assert "WHERE event_id IN ($1, $2," in args[0]
+        assert args[1:3] == ("$a", "$c") and set(args[3:]) == {None}
+        assert await backfill.load_checkpoints([]) == {}
+        backfill.database.fetch.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_save_checkpoint_upserts(self, backfill):
+        await backfill.save_checkpoint("$a", 10)
+        
+        sql, event_id, last_ts = backfill.database.execute.call_args[0]
+        assert "ON CONFLICT (event_id) DO UPDATE" in sql
+        assert (event_id, last_ts) == ("$a", 10)
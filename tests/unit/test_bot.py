@@ -1,46 +1,206 @@
+import json
 import pytest
 import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime, timedelta
+from dataclasses import replace
 
-from mautrix.types import EventType, RelationType, UserID, RoomID, EventID
+from mautrix.types import (
+    EventType, MemberStateEventContent, Membership, RelationType, UserID, RoomID, EventID
+)
+from mautrix.util.async_db import Database
+from aiohttp.test_utils import make_mocked_request
 from aiohttp.web import Request, Response
 
 from wallingfordbot.bot import WallingfordBot
+from wallingfordbot.clock import VirtualClock
 from wallingfordbot.config import Config
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.repository import Reaction, Session, TrackedEvent
+from wallingfordbot.tenants import Tenant, TenantRouter
 from tests.fixtures.matrix_events import (
     create_mock_reaction_event, 
-    create_mock_session_data,
-    create_mock_activity_reaction,
-    create_mock_reminder_data
+    create_mock_redaction_event,
+    create_raw_reaction,
+    create_mock_session,
 )
 from tests.fixtures.config import create_mock_config
 
 
 @pytest.fixture
-def mock_bot():
-    """Create a mock WallingfordBot instance."""
-    with patch('wallingfordbot.bot.WallingfordBot.__init__', return_value=None):
-        bot = WallingfordBot.__new__(WallingfordBot)
-        bot.database = AsyncMock()
-        bot.client = AsyncMock()
-        bot.client.mxid = UserID("@wallingfordbot:example.com")
-        bot.log = MagicMock()
-        bot.reminder_task = None
-        
-        # Mock config
-        bot.config = MagicMock()
-        mock_config_data = create_mock_config()
-        bot.config.alex_private_room = mock_config_data["rooms"]["alex_private"]
-        bot.config.group_chat_room = mock_config_data["rooms"]["group_chat"]
-        bot.config.alex_user_id = mock_config_data["users"]["alex_user_id"]
-        bot.config.webhook_secret = mock_config_data["homeassistant"]["webhook_secret"]
-        bot.config.activities = mock_config_data["activities"]
-        bot.config.confirmation_emojis = mock_config_data["confirmation_emojis"]
-        bot.config.timing = mock_config_data["timing"]
-        bot.config.messages = mock_config_data["messages"]
-        
-        return bot
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+def make_bot(database, instance_id="test-instance"):
+    """Build a WallingfordBot through setup(), on ``database`` and with a mocked client."""
+    bot = WallingfordBot.__new__(WallingfordBot)
+    bot.database = database
+    bot.client = AsyncMock()
+    bot.client.mxid = UserID("@wallingfordbot:example.com")
+    bot.log = MagicMock()
+    bot.id = "wallingford"
+    bot.reminder_task = None
+    bot.backfill_task = None
+    bot.retention_task = None
+    bot.member_task = None
+    bot.outbox_task = None
+    bot.health_task = None
+    bot.leader_task = None
+    bot.election = None
+    
+    # Mock config
+    bot.config = MagicMock()
+    mock_config_data = create_mock_config()
+    bot.config.alex_private_room = mock_config_data["rooms"]["alex_private"]
+    bot.config.group_chat_room = mock_config_data["rooms"]["group_chat"]
+    bot.config.alex_user_id = mock_config_data["users"]["alex_user_id"]
+    bot.config.webhook_secret = mock_config_data["homeassistant"]["webhook_secret"]
+    bot.config.activities = mock_config_data["activities"]
+    bot.config.confirmation_emojis = mock_config_data["confirmation_emojis"]
+    bot.config.timing = mock_config_data["timing"]
+    bot.config.messages = mock_config_data["messages"]
+    bot.config.intake = mock_config_data["intake"]
+    bot.config.backfill = mock_config_data["backfill"]
+    bot.config.retention = mock_config_data["retention"]
+    bot.config.export = mock_config_data["export"]
+    bot.config.members = mock_config_data["members"]
+    bot.config.participant_reminders = mock_config_data["participant_reminders"]
+    bot.config.cluster = {**mock_config_data["cluster"], "instance_id": instance_id}
+    bot.config.outbox = mock_config_data["outbox"]
+    bot.config.circuit_breaker = mock_config_data["circuit_breaker"]
+    bot.config.recording = mock_config_data["recording"]
+    bot.config.sqlite = mock_config_data["sqlite"]
+    bot.config.health = mock_config_data["health"]
+    bot.config.profiling = mock_config_data["profiling"]
+    bot.config.sessions = mock_config_data["sessions"]
+    bot.config.tenants = [{
+        "id": "default",
+        "user_id": mock_config_data["users"]["alex_user_id"],
+        "private_room": mock_config_data["rooms"]["alex_private"],
+        "group_rooms": [mock_config_data["rooms"]["group_chat"]],
+    }]
+    
+    bot.setup()
+    return bot
+
+
+@pytest.fixture
+def mock_bot(database):
+    return make_bot(database)
+
+
+def no_queries(database):
+    # Every query goes through acquire(), so this fails anything that reaches the database
+    return patch.object(database, "acquire", side_effect=AssertionError("unexpected query"))
+
+
+async def add_session(database, **kwargs) -> Session:
+    session = create_mock_session(**kwargs)
+    await database.execute(
+        "INSERT INTO workflow_session (id, tenant_id, date, alex_confirmation, confirmed, "
+        "group_message_id, confirmation_event_id, lunch_reminder_sent, evening_reminder_sent) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)",
+        session.id, session.tenant_id, session.date, session.alex_confirmation, session.confirmed,
+        session.group_message_id, session.confirmation_event_id, session.lunch_reminder_sent,
+        session.evening_reminder_sent,
+    )
+    return session
+
+
+async def add_tracked_event(database, event_id, session_id, kind, room_id=None) -> None:
+    async with database.acquire() as conn:
+        await conn.execute(
+            "INSERT INTO tracked_event (event_id, session_id, room_id, kind) VALUES ($1, $2, $3, $4)",
+            event_id, session_id, room_id, kind
+        )
+
+
+async def add_requested_session(database, request="$event123:example.com", **kwargs) -> Session:
+    # A session whose confirmation request went out, so Alex's reactions find it
+    session = await add_session(database, confirmation_event_id=request, **kwargs)
+    await add_tracked_event(database, request, session.id, "confirmation", "!alexroom:example.com")
+    return session
+
+
+async def add_announced_session(
+    database, announcement="$event123:example.com", room_id="!grouproom:example.com", **kwargs
+) -> Session:
+    # A session whose group announcement went out, so friends' reactions find it
+    session = await add_session(database, group_message_id=announcement, **kwargs)
+    await add_tracked_event(database, announcement, session.id, "announcement", room_id)
+    return session
+
+
+async def add_reaction(
+    database, session_id, user_id="@testuser:example.com", activity="lunch", emoji="🍽️",
+    event_id=None, target_event_id=None
+) -> Reaction:
+    reaction = Reaction(
+        session_id, user_id, activity, event_id or f"${user_id}-{activity}-{emoji}",
+        emoji, target_event_id
+    )
+    await database.execute(
+        "INSERT INTO activity_reaction (session_id, user_id, activity, emoji, event_id, target_event_id) "
+        "VALUES ($1, $2, $3, $4, $5, $6)",
+        reaction.session_id, reaction.user_id, reaction.activity, reaction.emoji,
+        reaction.event_id, reaction.target_event_id,
+    )
+    return reaction
+
+
+async def add_reminder(database, session_id, reminder_type="lunch", scheduled_time=None) -> int:
+    return await database.fetchval(
+        "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) "
+        "VALUES ($1, $2, $3) RETURNING id",
+        session_id, reminder_type, scheduled_time or datetime.now() - timedelta(minutes=1)
+    )
+
+
+async def scheduled(database):
+    return [
+        row["reminder_type"]
+        for row in await database.fetch("SELECT reminder_type FROM scheduled_reminder ORDER BY id")
+    ]
+
+
+async def stored_reactions(database):
+    return [
+        (row["session_id"], row["user_id"], row["activity"])
+        for row in await database.fetch(
+            "SELECT session_id, user_id, activity FROM activity_reaction ORDER BY id"
+        )
+    ]
+
+
+async def logged(database):
+    # The session log, as (session id, kind, data)
+    return [
+        (row["session_id"], row["kind"], json.loads(row["data"]))
+        for row in await database.fetch("SELECT session_id, kind, data FROM session_event ORDER BY id")
+    ]
+
+
+async def queued(database):
+    # Messages waiting in the outbox
+    return [
+        {
+            "session_id": row["session_id"], "room_id": row["room_id"], "kind": row["kind"],
+            "body": row["body"], "reactions": json.loads(row["reactions"]),
+        }
+        for row in await database.fetch(
+            "SELECT session_id, room_id, kind, body, reactions FROM outbox ORDER BY id"
+        )
+    ]
+
+
+def discard_task(coro):
+    # Stands in for asyncio.create_task, closing the coroutine it would have run
+    coro.close()
+    return MagicMock()
 
 
 class TestWallingfordBot:
@@ -49,16 +209,139 @@ class TestWallingfordBot:
     async def test_start_creates_reminder_task(self, mock_bot):
         mock_bot.config.load_and_update = MagicMock()
         
-        with patch('asyncio.create_task') as mock_create_task:
+        with patch('asyncio.create_task', side_effect=discard_task) as mock_create_task, \
+             patch('wallingfordbot.bot.EventIntake') as mock_intake, \
+             patch.object(WallingfordBot, 'warm_up') as mock_warm_up:
             await mock_bot.start()
             
             mock_bot.config.load_and_update.assert_called_once()
-            mock_create_task.assert_called_once()
+            mock_warm_up.assert_called_once()
+            # Reminder loop, member names, outbox, health probe, reaction backfill and retention
+            assert mock_create_task.call_count == 6
+            mock_intake.return_value.start.assert_called_once()
             assert mock_bot.log.info.called
 
+    @pytest.mark.asyncio
+    async def test_start_survives_warm_up_failure(self, mock_bot):
+        mock_bot.config.load_and_update = MagicMock()
+        
+        with patch('asyncio.create_task', side_effect=discard_task), \
+             patch('wallingfordbot.bot.EventIntake') as mock_intake, \
+             patch.object(WallingfordBot, 'warm_up', side_effect=Exception("DB down")):
+            await mock_bot.start()
+            
+            mock_bot.log.exception.assert_called_once()
+            mock_intake.return_value.start.assert_called_once()
+            assert not mock_bot.state.ready
+
+    @pytest.mark.asyncio
+    async def test_start_in_cluster_mode_reads_state_from_database(self, mock_bot):
+        mock_bot.config.load_and_update = MagicMock()
+        mock_bot.config.cluster = {**mock_bot.config.cluster, "enabled": True}
+        
+        with patch('asyncio.create_task', side_effect=discard_task), \
+             patch('wallingfordbot.bot.EventIntake'), \
+             patch.object(WallingfordBot, 'warm_up') as mock_warm_up:
+            await mock_bot.start()
+            
+            mock_warm_up.assert_not_called()
+            assert not mock_bot.state.ready
+            assert mock_bot.claims.instance_id == "test-instance"
+            # Singleton tasks wait for this instance to win the election
+            assert mock_bot.election.lease == timedelta(seconds=30)
+            assert mock_bot.backfill_task is None
+            assert mock_bot.retention_task is None
+
+    @pytest.mark.asyncio
+    async def test_cluster_instances_announce_a_confirmation_once(self, database):
+        instances = [make_bot(database, "a"), make_bot(database, "b")]
+        mock_bot = instances[0]
+        session = await add_requested_session(
+            database, alex_confirmation="🏠", date=mock_bot.clock.now().strftime("%Y-%m-%d")
+        )
+        event = create_mock_reaction_event(sender="@alex:example.com", emoji="👍")
+        
+        # Both instances see the same 👍 and read the session before either confirms it
+        await asyncio.gather(*[
+            bot.handle_confirmation_reaction(event, bot.tenants.default) for bot in instances
+        ])
+        
+        assert (await mock_bot.sessions.get(session.id)).confirmed
+        assert [row["kind"] for row in await queued(database)] == ["announcement"]
+        assert [kind for _, kind, _ in await logged(database)] == ["confirmed"]
+
+    @pytest.mark.asyncio
+    async def test_leadership_starts_and_stops_singleton_tasks(self, mock_bot):
+        with patch('asyncio.create_task', side_effect=discard_task) as mock_create_task:
+            mock_bot.start_singleton_tasks()
+            mock_bot.start_singleton_tasks()
+            
+            assert mock_create_task.call_count == 2
+            backfill_task = mock_bot.backfill_task
+            retention_task = mock_bot.retention_task
+            
+            mock_bot.stop_singleton_tasks()
+            
+            backfill_task.cancel.assert_called_once()
+            retention_task.cancel.assert_called_once()
+            assert mock_bot.backfill_task is None
+            assert mock_bot.retention_task is None
+
+    @pytest.mark.asyncio
+    async def test_stop_resigns_leadership(self, mock_bot):
+        mock_bot.election = MagicMock()
+        mock_bot.election.is_leader = True
+        mock_bot.election.resign = AsyncMock()
+        mock_bot.leader_task = MagicMock()
+        
+        await mock_bot.stop()
+        
+        mock_bot.leader_task.cancel.assert_called_once()
+        mock_bot.election.resign.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_warm_up_hydrates_state(self, mock_bot):
+        database = mock_bot.database
+        await add_session(
+            database, session_id="s1", alex_confirmation="🏠", confirmed=True,
+            group_message_id="$announce:example.com"
+        )
+        await add_reaction(database, "s1", activity="lunch", event_id="$reaction:example.com")
+        await add_reminder(database, "s1", "lunch", datetime(2030, 1, 1, 12, 0))
+        await add_tracked_event(database, "$climbing:example.com", "s1", "announcement")
+        
+        await mock_bot.warm_up()
+        
+        assert mock_bot.state.ready
+        assert mock_bot.state.get_session("s1").confirmed
+        assert mock_bot.state.tracked_events["$announce:example.com"] == "s1"
+        assert mock_bot.state.tracked_events["$climbing:example.com"] == "s1"
+        assert mock_bot.state.participants("s1", "lunch") == ["@testuser:example.com"]
+        assert mock_bot.state.next_reminder_time() == datetime(2030, 1, 1, 12, 0)
+        assert mock_bot.metrics.get("ready") == 1
+
+    @pytest.mark.asyncio
+    async def test_lookups_served_from_warm_state(self, mock_bot):
+        session = create_mock_session(session_id="s1")
+        mock_bot.state.load([session], [], [])
+        
+        with no_queries(mock_bot.database):
+            assert (await mock_bot.get_session_for_date("default", session.date)).id == "s1"
+            assert (await mock_bot.get_session("s1")).id == "s1"
+            assert await mock_bot.get_sessions(["s1", "missing"]) == {"s1": session}
+            assert await mock_bot.get_reactions("s1") == []
+
+    @pytest.mark.asyncio
+    async def test_check_pending_reminders_skips_query_when_nothing_due(self, mock_bot):
+        mock_bot.state.load([], [], [])
+        mock_bot.state.add_reminder("s1", "lunch", datetime.now() + timedelta(hours=1))
+        
+        with no_queries(mock_bot.database):
+            await mock_bot.check_pending_reminders()
+
     @pytest.mark.asyncio
     async def test_stop_cancels_reminder_task(self, mock_bot):
-        mock_task = AsyncMock()
+        mock_task = MagicMock()
         mock_bot.reminder_task = mock_task
         
         await mock_bot.stop()
@@ -97,7 +380,7 @@ class TestWallingfordBot:
             
             assert response.status == 200
             assert response.text == "OK"
-            mock_start.assert_called_once_with(is_test=False)
+            mock_start.assert_called_once_with(is_test=False, tenant=mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_homeassistant_webhook_test_mode(self, mock_bot):
@@ -109,7 +392,31 @@ class TestWallingfordBot:
             response = await mock_bot.homeassistant_webhook(request)
             
             assert response.status == 200
-            mock_start.assert_called_once_with(is_test=True)
+            mock_start.assert_called_once_with(is_test=True, tenant=mock_bot.tenants.default)
+
+    @pytest.mark.asyncio
+    async def test_homeassistant_webhook_selects_tenant(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.json = AsyncMock(return_value={"tenant": "default"})
+        
+        with patch.object(mock_bot, 'start_office_workflow') as mock_start:
+            response = await mock_bot.homeassistant_webhook(request)
+            
+            assert response.status == 200
+            assert mock_start.call_args[1]['tenant'].id == "default"
+
+    @pytest.mark.asyncio
+    async def test_homeassistant_webhook_unknown_tenant(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.json = AsyncMock(return_value={"tenant": "nobody"})
+        
+        with patch.object(mock_bot, 'start_office_workflow') as mock_start:
+            response = await mock_bot.homeassistant_webhook(request)
+            
+            assert response.status == 404
+            mock_start.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_homeassistant_webhook_exception_handling(self, mock_bot):
@@ -125,18 +432,29 @@ class TestWallingfordBot:
 
     @pytest.mark.asyncio
     async def test_start_office_workflow_new_session(self, mock_bot):
-        mock_bot.database.fetchrow.return_value = None
-        
         with patch.object(mock_bot, 'send_confirmation_request') as mock_send:
             await mock_bot.start_office_workflow()
             
-            mock_bot.database.execute.assert_called()
+            today = datetime.now().strftime("%Y-%m-%d")
+            assert await mock_bot.sessions.for_date("default", today)
             mock_send.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_start_office_workflow_keys_session_by_tenant(self, mock_bot):
+        with patch.object(mock_bot, 'send_confirmation_request') as mock_send:
+            await mock_bot.start_office_workflow()
+            
+            today = datetime.now().strftime("%Y-%m-%d")
+            session = await mock_bot.sessions.for_date("default", today)
+            assert session.tenant_id == "default"
+            assert await logged(mock_bot.database) == [
+                (session.id, "webhook_received", {"tenant_id": "default", "date": today, "test": False})
+            ]
+            assert mock_send.call_args[0][1] is mock_bot.tenants.default
+
     @pytest.mark.asyncio
     async def test_start_office_workflow_existing_confirmed_session(self, mock_bot):
-        session_data = create_mock_session_data(confirmed=True)
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_session(mock_bot.database, confirmed=True)
         
         with patch.object(mock_bot, 'send_confirmation_request') as mock_send:
             await mock_bot.start_office_workflow()
@@ -145,8 +463,7 @@ class TestWallingfordBot:
 
     @pytest.mark.asyncio
     async def test_start_office_workflow_existing_unconfirmed_session(self, mock_bot):
-        session_data = create_mock_session_data(confirmed=False)
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_session(mock_bot.database, confirmed=False)
         
         with patch.object(mock_bot, 'send_confirmation_request') as mock_send:
             await mock_bot.start_office_workflow()
@@ -155,42 +472,64 @@ class TestWallingfordBot:
 
     @pytest.mark.asyncio
     async def test_start_office_workflow_test_mode_clears_existing(self, mock_bot):
-        mock_bot.database.fetchrow.return_value = None
+        old = await add_session(mock_bot.database, confirmed=True)
+        await add_reaction(mock_bot.database, old.id)
+        await mock_bot.stats.record(mock_bot.database, [
+            ("default", "@testuser:example.com", "lunch", old.date, 1)
+        ])
         
         with patch.object(mock_bot, 'send_confirmation_request') as mock_send:
             await mock_bot.start_office_workflow(is_test=True)
             
-            # Should call execute 4 times: 3 deletes + 1 insert
-            assert mock_bot.database.execute.call_count >= 4
+            # The session goes with its reactions, and they stop counting
+            assert await mock_bot.sessions.get(old.id) is None
+            assert await stored_reactions(mock_bot.database) == []
+            assert (await mock_bot.stats.summary("default"))["friends"] == {}
+            assert (await mock_bot.sessions.for_date("default", old.date)).id != old.id
             mock_send.assert_called_once()
 
     @pytest.mark.asyncio
-    async def test_send_confirmation_request(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
-        
-        await mock_bot.send_confirmation_request("test-session")
+    async def test_test_mode_keeps_state_until_the_purge_commits(self, mock_bot):
+        mock_bot.clock = VirtualClock(datetime(2024, 1, 3, 9, 0))
+        session = await add_session(mock_bot.database, session_id="s1", date="2024-01-03", confirmed=True)
+        mock_bot.state.load([session], [], [])
+        
+        with patch.object(mock_bot, 'send_confirmation_request', side_effect=Exception("DB down")):
+            with pytest.raises(Exception):
+                await mock_bot.start_office_workflow(is_test=True)
+        # Rolled back, so the session is still there
+        assert await mock_bot.sessions.get("s1")
+        assert mock_bot.state.session_for_date("default", "2024-01-03").id == "s1"
+        
+        with patch.object(mock_bot, 'send_confirmation_request'):
+            await mock_bot.start_office_workflow(is_test=True)
         
-        mock_bot.client.send_text.assert_called_once()
-        # Should react with confirmation emojis + thumbs up
-        expected_reactions = len(mock_bot.config.confirmation_emojis) + 1
-        assert mock_bot.client.react.call_count == expected_reactions
+        assert mock_bot.state.session_for_date("default", "2024-01-03").id != "s1"
 
     @pytest.mark.asyncio
-    async def test_send_confirmation_request_send_failure(self, mock_bot):
-        mock_bot.client.send_text.side_effect = Exception("Send failed")
+    async def test_send_confirmation_request(self, mock_bot):
+        await add_session(mock_bot.database, session_id="test-session")
         
-        await mock_bot.send_confirmation_request("test-session")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.send_confirmation_request("test-session", mock_bot.tenants.default, conn)
         
-        mock_bot.log.exception.assert_called_once()
+        assert await queued(mock_bot.database) == [{
+            "session_id": "test-session", "room_id": "!alexroom:example.com",
+            "kind": "confirmation_request", "body": mock_bot.config.messages["confirmation_request"],
+            # Should react with confirmation emojis + thumbs up
+            "reactions": [*mock_bot.config.confirmation_emojis, "👍"],
+        }]
 
     @pytest.mark.asyncio
-    async def test_send_confirmation_request_react_failure(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
-        mock_bot.client.react.side_effect = Exception("React failed")
-        
-        await mock_bot.send_confirmation_request("test-session")
-        
-        mock_bot.log.exception.assert_called_once()
+    async def test_start_office_workflow_queues_request_with_session(self, mock_bot):
+        with patch.object(mock_bot.outbox, 'wake') as mock_wake:
+            await mock_bot.start_office_workflow()
+            
+            today = datetime.now().strftime("%Y-%m-%d")
+            session = await mock_bot.sessions.for_date("default", today)
+            [message] = await queued(mock_bot.database)
+            assert (message["session_id"], message["kind"]) == (session.id, "confirmation_request")
+            mock_wake.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_handle_reaction_ignores_non_annotation(self, mock_bot):
@@ -205,12 +544,389 @@ class TestWallingfordBot:
 
     @pytest.mark.asyncio
     async def test_handle_reaction_event_decorator(self, mock_bot):
-        event = create_mock_reaction_event()
+        event = create_mock_reaction_event(room_id="!grouproom:example.com")
         
-        with patch.object(mock_bot, 'handle_reaction') as mock_handle:
+        with patch.object(mock_bot.intake, 'submit') as mock_submit:
             await mock_bot.handle_reaction_event(event)
             
-            mock_handle.assert_called_once_with(event)
+            mock_submit.assert_called_once_with(event)
+
+    @pytest.mark.asyncio
+    async def test_handle_reaction_event_drops_unlisted_rooms(self, mock_bot):
+        event = create_mock_reaction_event(room_id="!busyroom:example.com")
+        mock_bot.log.reset_mock()
+        
+        with patch.object(mock_bot.intake, 'submit') as mock_submit:
+            await mock_bot.handle_reaction_event(event)
+            
+            mock_submit.assert_not_called()
+            mock_bot.log.info.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_redaction_event_drops_unlisted_rooms(self, mock_bot):
+        event = create_mock_redaction_event(room_id="!busyroom:example.com")
+        
+        with patch.object(mock_bot.intake, 'submit') as mock_submit:
+            await mock_bot.handle_redaction_event(event)
+            
+            mock_submit.assert_not_called()
+
+    def test_on_external_config_update_recompiles_allowlist(self, mock_bot):
+        mock_bot.config.load_and_update = MagicMock()
+        mock_bot.config.tenants = [{
+            "id": "other",
+            "user_id": "@other:example.com",
+            "private_room": "!otherprivate:example.com",
+            "group_rooms": ["!newroom:example.com"],
+        }]
+        
+        mock_bot.on_external_config_update()
+        
+        mock_bot.config.load_and_update.assert_called_once()
+        assert mock_bot.room_allowlist == frozenset({
+            RoomID("!otherprivate:example.com"), RoomID("!newroom:example.com")
+        })
+        assert mock_bot.tenants.get("other").user_id == "@other:example.com"
+
+    @pytest.mark.asyncio
+    async def test_handle_redaction_event_decorator(self, mock_bot):
+        event = create_mock_redaction_event()
+        
+        with patch.object(mock_bot.intake, 'submit') as mock_submit:
+            await mock_bot.handle_redaction_event(event)
+            
+            mock_submit.assert_called_once_with(event)
+
+    @pytest.mark.asyncio
+    async def test_dispatch_queued_event_routes_by_type(self, mock_bot):
+        reaction = create_mock_reaction_event()
+        redaction = create_mock_redaction_event()
+        
+        with patch.object(mock_bot, 'handle_reaction') as mock_reaction, \
+             patch.object(mock_bot, 'handle_redaction') as mock_redaction:
+            await mock_bot.dispatch_queued_event(reaction)
+            await mock_bot.dispatch_queued_event(redaction)
+            
+            mock_reaction.assert_called_once_with(reaction)
+            mock_redaction.assert_called_once_with(redaction)
+
+    def test_is_relevant_event(self, mock_bot):
+        # Before the state is loaded, and in cluster mode, every listed room's events count
+        assert mock_bot.is_relevant_event(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        assert mock_bot.is_relevant_event(create_mock_reaction_event(room_id="!alexroom:example.com"))
+        assert not mock_bot.is_relevant_event(create_mock_reaction_event(room_id="!other:example.com"))
+        assert not mock_bot.is_relevant_event(create_mock_reaction_event(
+            sender="@wallingfordbot:example.com",
+            room_id="!grouproom:example.com"
+        ))
+
+    def test_is_relevant_event_targets_known_session_messages(self, mock_bot):
+        mock_bot.state.load([], [], [], [TrackedEvent("$announce:example.com", "s1", "!grouproom:example.com")])
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "lunch", "$reaction123:example.com")
+        
+        assert mock_bot.is_relevant_event(create_mock_reaction_event(
+            room_id="!grouproom:example.com", target_event_id="$announce:example.com"
+        ))
+        assert not mock_bot.is_relevant_event(create_mock_reaction_event(
+            room_id="!grouproom:example.com", target_event_id="$chatter:example.com"
+        ))
+        assert mock_bot.is_relevant_event(create_mock_redaction_event(redacts="$reaction123:example.com"))
+        assert not mock_bot.is_relevant_event(create_mock_redaction_event(redacts="$message:example.com"))
+
+    @pytest.mark.asyncio
+    async def test_handle_redaction_removes_reaction(self, mock_bot):
+        database = mock_bot.database
+        await add_session(database, session_id="s1", date="2024-01-03")
+        await add_reaction(database, "s1", "@bob:example.com", "lunch", event_id="$reaction:example.com")
+        await mock_bot.stats.record(database, [("default", "@bob:example.com", "lunch", "2024-01-03", 1)])
+        event = create_mock_redaction_event(redacts="$reaction:example.com")
+        
+        await mock_bot.handle_redaction(event)
+        
+        assert await stored_reactions(database) == []
+        assert await logged(database) == [
+            ("s1", "reaction_removed", {"event_id": "$reaction:example.com"})
+        ]
+        assert (await mock_bot.stats.summary("default"))["friends"] == {}
+        assert await mock_bot.stats.etag("default") == '"default-2"'
+
+    @pytest.mark.asyncio
+    async def test_handle_redaction_ignores_unknown_reaction(self, mock_bot):
+        await mock_bot.handle_redaction(create_mock_redaction_event(redacts="$other:example.com"))
+        
+        assert await logged(mock_bot.database) == []
+        assert await mock_bot.stats.etag("default") == '"default-0"'
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, mock_bot):
+        mock_bot.metrics.inc("intake_shed_total", reason="irrelevant")
+        
+        response = await mock_bot.metrics_endpoint(MagicMock(spec=Request))
+        
+        assert response.status == 200
+        assert 'wallingfordbot_intake_shed_total{reason="irrelevant"} 1.0' in response.text
+
+    @pytest.mark.asyncio
+    async def test_ready_endpoint_reports_cached_state(self, mock_bot):
+        mock_bot.state.load([], [], [])
+        mock_bot.state.add_reminder("s1", "lunch", datetime(2030, 1, 1, 12, 0))
+        mock_bot.reminder_task = MagicMock()
+        mock_bot.reminder_task.done.return_value = False
+        mock_bot.health.heartbeat("reminder")
+        mock_bot.health.db_ok = True
+        mock_bot.health.db_latency = 0.002
+        mock_bot.health.checked_at = datetime.now()
+        
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        # Answered without touching the database
+        with no_queries(mock_bot.database):
+            response = await mock_bot.ready_endpoint(request)
+        
+        assert response.status == 200
+        body = json.loads(response.text)
+        assert body["status"] == "ok"
+        assert body["database"]["latency_ms"] == 2.0
+        assert body["next_reminder"] == "2030-01-01T12:00:00"
+        assert body["tasks"]["reminder"] == "running"
+        assert body["caches"]["pending_reminders"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ready_endpoint_lists_problems(self, mock_bot):
+        mock_bot.reminder_task = MagicMock()
+        mock_bot.reminder_task.done.return_value = True
+        mock_bot.reminder_task.cancelled.return_value = False
+        mock_bot.reminder_task.exception.return_value = RuntimeError("boom")
+        
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        
+        ready = await mock_bot.ready_endpoint(request)
+        health = await mock_bot.health_endpoint(request)
+        
+        assert ready.status == 503
+        assert json.loads(ready.text)["problems"] == [
+            "warm-up has not finished", "database not probed yet", "reminder loop is not running"
+        ]
+        assert health.status == 503
+        assert json.loads(health.text)["tasks"]["reminder"] == "failed"
+
+    @pytest.mark.asyncio
+    async def test_health_endpoints_show_only_status_without_token(self, mock_bot):
+        mock_bot.reminder_task = MagicMock()
+        mock_bot.reminder_task.done.return_value = False
+        mock_bot.health.record_error("outbox", RuntimeError("password authentication failed"))
+        
+        for headers in ({}, {"Authorization": "Bearer wrong"}):
+            request = MagicMock(spec=Request)
+            request.headers = headers
+            health = await mock_bot.health_endpoint(request)
+            ready = await mock_bot.ready_endpoint(request)
+            
+            assert (health.status, json.loads(health.text)) == (200, {"status": "ok"})
+            assert (ready.status, json.loads(ready.text)) == (503, {"status": "unavailable"})
+
+    @pytest.mark.asyncio
+    async def test_reminder_loop_stall_makes_instance_unready(self, mock_bot):
+        mock_bot.state.load([], [], [])
+        mock_bot.clock = mock_bot.health.clock = VirtualClock(datetime(2024, 1, 1, 9, 0))
+        mock_bot.health.db_ok = True
+        mock_bot.health.checked_at = mock_bot.clock.now()
+        mock_bot.reminder_task = MagicMock()
+        mock_bot.reminder_task.done.return_value = False
+        mock_bot.health.heartbeat("reminder")
+        
+        assert mock_bot.readiness_problems() == []
+        await mock_bot.clock.advance(181)
+        mock_bot.health.checked_at = mock_bot.clock.now()
+        assert mock_bot.readiness_problems() == ["reminder loop has stalled"]
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_requires_token(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer wrong"}
+        
+        response = await mock_bot.stats_endpoint(request)
+        
+        assert response.status == 401
+
+    @pytest.mark.asyncio
+    async def test_profile_endpoint_requires_token(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer wrong"}
+        
+        response = await mock_bot.profile_endpoint(request)
+        
+        assert response.status == 401
+
+    @pytest.mark.asyncio
+    async def test_profile_endpoint_validates_request(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        
+        for query in ({"kind": "heap"}, {"seconds": "soon"}, {"seconds": "61"}, {"seconds": "0"}):
+            request.query = query
+            assert (await mock_bot.profile_endpoint(request)).status == 400
+
+    @pytest.mark.asyncio
+    async def test_profile_endpoint_returns_collapsed_stacks(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {"kind": "stacks", "seconds": "0.05"}
+        
+        response = await mock_bot.profile_endpoint(request)
+        
+        assert response.status == 200
+        assert 'filename="wallingfordbot.collapsed"' in response.headers["Content-Disposition"]
+        # Nothing else runs, so the loop is sampled waiting for events
+        assert "select" in response.body.decode()
+
+    @pytest.mark.asyncio
+    async def test_profile_endpoint_refuses_concurrent_profiles(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {"kind": "memory", "seconds": "0.01"}
+        mock_bot.profiler.busy = True
+        
+        response = await mock_bot.profile_endpoint(request)
+        
+        assert response.status == 409
+
+    @pytest.mark.asyncio
+    async def test_session_history_endpoint(self, mock_bot):
+        await add_session(mock_bot.database, session_id="s1", date="2024-01-03")
+        mock_bot.session_log.clock = clock = VirtualClock(datetime(2024, 1, 3, 9, 0))
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.session_log.append(
+                conn, "s1", "webhook_received", tenant_id="default", date="2024-01-03", test=False
+            )
+            await clock.advance(300)
+            await mock_bot.session_log.append(conn, "s1", "choice_made", choice="🏠")
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {"id": "s1"}
+        
+        response = await mock_bot.session_history_endpoint(request)
+        
+        assert response.status == 200
+        body = json.loads(response.text)
+        assert body["state"]["session"]["alex_confirmation"] == "🏠"
+        assert body["events"][1] == {"id": 2, "kind": "choice_made", "at": "2024-01-03T09:05:00", "choice": "🏠"}
+        
+        request.query = {"id": "missing"}
+        assert (await mock_bot.session_history_endpoint(request)).status == 404
+        request.query = {}
+        assert (await mock_bot.session_history_endpoint(request)).status == 400
+
+    @pytest.mark.asyncio
+    async def test_session_history_endpoint_falls_back_to_rows(self, mock_bot):
+        # A session from before the log: its webhook was never logged, only later steps
+        await add_session(mock_bot.database, session_id="s1", alex_confirmation="🏠", confirmed=True)
+        await add_reaction(mock_bot.database, "s1", activity="lunch", emoji="🍽️", event_id="$r1")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.session_log.append(conn, "s1", "reminder_sent", reminder_type="lunch")
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {"id": "s1"}
+        
+        response = await mock_bot.session_history_endpoint(request)
+        
+        assert response.status == 200
+        body = json.loads(response.text)
+        assert body["state"]["session"]["confirmed"]
+        assert body["state"]["reactions"] == {"lunch": {"@testuser:example.com": "$r1"}}
+        assert [event["kind"] for event in body["events"]] == ["reminder_sent"]
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_serves_cached_summary_with_etag(self, mock_bot):
+        await mock_bot.stats.record(mock_bot.database, [
+            ("default", "@bob:example.com", "lunch", date, 1)
+            for date in ("2024-01-02", "2024-01-03", "2024-01-04")
+        ])
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {}
+        
+        with patch.object(mock_bot.stats, 'summary', wraps=mock_bot.stats.summary) as mock_summary:
+            response = await mock_bot.stats_endpoint(request)
+            await mock_bot.stats_endpoint(request)
+            
+            assert response.status == 200
+            assert json.loads(response.text)["friends"] == {"@bob:example.com": {"lunch": 3}}
+            # One update, one version
+            assert response.headers["ETag"] == '"default-1"'
+            mock_summary.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_not_modified(self, mock_bot):
+        await mock_bot.stats.record(mock_bot.database, [
+            ("default", "@bob:example.com", "lunch", "2024-01-03", 1)
+        ])
+        request = MagicMock(spec=Request)
+        request.headers = {
+            "Authorization": "Bearer test-secret-123",
+            "If-None-Match": '"default-1"',
+        }
+        request.query = {}
+        
+        with patch.object(mock_bot.stats, 'snapshot') as mock_snapshot:
+            response = await mock_bot.stats_endpoint(request)
+            
+            assert response.status == 304
+            mock_snapshot.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_unknown_tenant(self, mock_bot):
+        request = MagicMock(spec=Request)
+        request.headers = {"Authorization": "Bearer test-secret-123"}
+        request.query = {"tenant": "nobody"}
+        
+        response = await mock_bot.stats_endpoint(request)
+        
+        assert response.status == 404
+
+    @pytest.mark.asyncio
+    async def test_export_endpoint_streams_chunks(self, mock_bot):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+        writer.write_headers = AsyncMock()
+        writer.write_eof = AsyncMock()
+        writer.drain = AsyncMock()
+        request = make_mocked_request(
+            "GET", "/export?format=csv&from=2024-01-01",
+            headers={"Authorization": "Bearer test-secret-123"}, writer=writer
+        )
+        
+        async def chunks(tenant_id, since, until):
+            assert (tenant_id, since, until) == ("default", "2024-01-01", "9999-12-31")
+            yield [{"session_id": "s1"}]
+            yield [{"session_id": "s2"}]
+        
+        with patch('wallingfordbot.bot.HistoryExport') as mock_export:
+            mock_export.return_value.chunks = chunks
+            response = await mock_bot.export_endpoint(request)
+        
+        assert response.status == 200
+        assert response.chunked
+        body = b"".join(call[0][0] for call in writer.write.call_args_list).decode()
+        assert body.splitlines()[0].startswith("session_id,")
+        assert [line.split(",")[0] for line in body.splitlines()[1:]] == ["s1", "s2"]
+
+    @pytest.mark.asyncio
+    async def test_export_endpoint_validates_query(self, mock_bot):
+        headers = {"Authorization": "Bearer test-secret-123"}
+        
+        bad_format = await mock_bot.export_endpoint(
+            make_mocked_request("GET", "/export?format=xml", headers=headers)
+        )
+        bad_date = await mock_bot.export_endpoint(
+            make_mocked_request("GET", "/export?from=yesterday", headers=headers)
+        )
+        unauthorized = await mock_bot.export_endpoint(make_mocked_request("GET", "/export"))
+        
+        assert bad_format.status == 400
+        assert bad_date.status == 400
+        assert unauthorized.status == 401
 
     @pytest.mark.asyncio
     async def test_handle_reaction_alex_confirmation(self, mock_bot):
@@ -222,7 +938,26 @@ class TestWallingfordBot:
         with patch.object(mock_bot, 'handle_confirmation_reaction') as mock_confirm:
             await mock_bot.handle_reaction(event)
             
-            mock_confirm.assert_called_once_with(event)
+            mock_confirm.assert_called_once_with(event, mock_bot.tenants.default)
+
+    @pytest.mark.asyncio
+    async def test_handle_reaction_routes_by_room_to_tenant(self, mock_bot):
+        other = Tenant.from_dict({
+            "id": "other",
+            "user_id": "@other:example.com",
+            "private_room": "!otherprivate:example.com",
+            "group_rooms": ["!othergroup:example.com"],
+        }, mock_bot.config.activities)
+        mock_bot.tenants = TenantRouter([mock_bot.tenants.default, other])
+        event = create_mock_reaction_event(
+            sender="@other:example.com",
+            room_id="!otherprivate:example.com"
+        )
+        
+        with patch.object(mock_bot, 'handle_confirmation_reaction') as mock_confirm:
+            await mock_bot.handle_reaction(event)
+            
+            mock_confirm.assert_called_once_with(event, other)
 
     @pytest.mark.asyncio
     async def test_handle_reaction_activity_reaction(self, mock_bot):
@@ -234,108 +969,161 @@ class TestWallingfordBot:
         with patch.object(mock_bot, 'handle_activity_reaction') as mock_activity:
             await mock_bot.handle_reaction(event)
             
-            mock_activity.assert_called_once_with(event)
+            mock_activity.assert_called_once_with(event, mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_handle_confirmation_reaction_stores_choice(self, mock_bot):
         event = create_mock_reaction_event(emoji="🏠")
-        session_data = create_mock_session_data()
-        mock_bot.database.fetchrow.return_value = session_data
+        session = await add_requested_session(mock_bot.database)
         
-        await mock_bot.handle_confirmation_reaction(event)
+        await mock_bot.handle_confirmation_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_called_once()
-        args = mock_bot.database.execute.call_args[0]
-        assert args[1] == "🏠"  # alex_confirmation
-        assert args[2] == False  # confirmed
+        stored = await mock_bot.sessions.get(session.id)
+        assert (stored.alex_confirmation, stored.confirmed) == ("🏠", False)
+        assert await logged(mock_bot.database) == [
+            (session.id, "choice_made", {"choice": "🏠", "event_id": event.event_id})
+        ]
 
     @pytest.mark.asyncio
     async def test_handle_confirmation_reaction_no_session(self, mock_bot):
         event = create_mock_reaction_event(emoji="🏠")
-        mock_bot.database.fetchrow.return_value = None
         
-        await mock_bot.handle_confirmation_reaction(event)
+        await mock_bot.handle_confirmation_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert await logged(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_handle_confirmation_reaction_invalid_emoji(self, mock_bot):
         event = create_mock_reaction_event(emoji="🌮")  # Not a confirmation emoji
+        session = await add_requested_session(mock_bot.database)
         
-        await mock_bot.handle_confirmation_reaction(event)
+        await mock_bot.handle_confirmation_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert (await mock_bot.sessions.get(session.id)).alex_confirmation is None
+        assert await logged(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_handle_confirmation_reaction_thumbs_up_confirms(self, mock_bot):
         event = create_mock_reaction_event(emoji="👍")
         
         with patch.object(mock_bot, 'confirm_previous_reaction') as mock_confirm:
-            await mock_bot.handle_confirmation_reaction(event)
+            await mock_bot.handle_confirmation_reaction(event, mock_bot.tenants.default)
             
-            mock_confirm.assert_called_once_with(event)
+            mock_confirm.assert_called_once_with(event, mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_confirm_previous_reaction_success(self, mock_bot):
-        session_data = create_mock_session_data(alex_confirmation="🏠")
-        mock_bot.database.fetchrow.return_value = session_data
+        session = await add_requested_session(mock_bot.database, alex_confirmation="🏠")
         
         with patch.object(mock_bot, 'send_group_announcement') as mock_announce, \
-             patch.object(mock_bot, 'schedule_reminders') as mock_schedule:
+             patch.object(mock_bot, 'schedule_reminders', return_value=[]) as mock_schedule:
             
             event = create_mock_reaction_event(emoji="👍")
-            await mock_bot.confirm_previous_reaction(event)
+            await mock_bot.confirm_previous_reaction(event, mock_bot.tenants.default)
             
-            mock_bot.database.execute.assert_called_once()
+            assert (await mock_bot.sessions.get(session.id)).confirmed
+            assert await logged(mock_bot.database) == [
+                (session.id, "confirmed", {"choice": "🏠", "event_id": event.event_id})
+            ]
             mock_announce.assert_called_once()
             mock_schedule.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_late_confirmation_resolves_session_by_request(self, mock_bot):
+        mock_bot.clock = VirtualClock(datetime(2024, 1, 4, 0, 30))
+        session = await add_session(
+            mock_bot.database, session_id="s1", date="2024-01-03", alex_confirmation="🏠",
+            confirmation_event_id="$request:example.com"
+        )
+        mock_bot.state.load([session], [], [])
+        
+        with patch.object(mock_bot, 'send_group_announcement') as mock_announce:
+            event = create_mock_reaction_event(emoji="👍", target_event_id="$request:example.com")
+            await mock_bot.handle_confirmation_reaction(event, mock_bot.tenants.default)
+            
+            mock_announce.assert_called_once()
+            assert mock_bot.state.get_session("s1").confirmed
+            # The day the reminders were for has passed
+            assert mock_bot.state.next_reminder_time() is None
+        
+        other = create_mock_reaction_event(emoji="👍", target_event_id="$elsewhere:example.com")
+        with patch.object(mock_bot, 'confirm_session') as mock_confirm:
+            await mock_bot.handle_confirmation_reaction(other, mock_bot.tenants.default)
+            mock_confirm.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_confirm_session_updates_state_after_commit(self, mock_bot):
+        session = await add_session(mock_bot.database, session_id="s1", alex_confirmation="🏠")
+        mock_bot.state.load([session], [], [])
+        reminder_time = datetime.now() + timedelta(hours=1)
+        
+        with patch.object(mock_bot, 'send_group_announcement'), \
+             patch.object(mock_bot, 'schedule_reminders',
+                          return_value=[("lunch", reminder_time)]) as mock_schedule:
+            await mock_bot.confirm_session(session, mock_bot.tenants.default)
+            
+            # Scheduled in the confirming transaction
+            assert mock_schedule.call_args[1]['conn'] is not None
+            assert mock_bot.state.get_session("s1").confirmed
+            assert mock_bot.state.next_reminder_time() == reminder_time
+
+    @pytest.mark.asyncio
+    async def test_confirm_session_failed_transaction_leaves_state(self, mock_bot):
+        session = await add_session(mock_bot.database, session_id="s1", alex_confirmation="🏠")
+        mock_bot.state.load([session], [], [])
+        
+        with patch.object(mock_bot, 'send_group_announcement') as mock_announce, \
+             patch.object(mock_bot, 'schedule_reminders', side_effect=Exception("Insert failed")):
+            with pytest.raises(Exception):
+                await mock_bot.confirm_session(session, mock_bot.tenants.default)
+            
+            assert not (await mock_bot.sessions.get("s1")).confirmed
+            assert not mock_bot.state.get_session("s1").confirmed
+            assert await logged(mock_bot.database) == []
+            mock_announce.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_confirm_previous_reaction_going_home_no_announcement(self, mock_bot):
-        session_data = create_mock_session_data(alex_confirmation="🚗")
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_requested_session(mock_bot.database, alex_confirmation="🚗")
         
         with patch.object(mock_bot, 'send_group_announcement') as mock_announce:
             event = create_mock_reaction_event(emoji="👍")
-            await mock_bot.confirm_previous_reaction(event)
+            await mock_bot.confirm_previous_reaction(event, mock_bot.tenants.default)
             
             mock_announce.assert_not_called()
+            assert await queued(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_confirm_previous_reaction_no_session(self, mock_bot):
-        mock_bot.database.fetchrow.return_value = None
-        
         event = create_mock_reaction_event(emoji="👍")
-        await mock_bot.confirm_previous_reaction(event)
+        await mock_bot.confirm_previous_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert await logged(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_confirm_previous_reaction_no_confirmation(self, mock_bot):
-        session_data = create_mock_session_data(alex_confirmation=None)
-        mock_bot.database.fetchrow.return_value = session_data
+        session = await add_requested_session(mock_bot.database, alex_confirmation=None)
         
         event = create_mock_reaction_event(emoji="👍")
-        await mock_bot.confirm_previous_reaction(event)
+        await mock_bot.confirm_previous_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert not (await mock_bot.sessions.get(session.id)).confirmed
+        assert await logged(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_ignores_bot_reactions(self, mock_bot):
         event = create_mock_reaction_event(sender="@wallingfordbot:example.com")
         mock_bot.client.mxid = UserID("@wallingfordbot:example.com")
         
-        await mock_bot.handle_activity_reaction(event)
-        
-        mock_bot.database.execute.assert_not_called()
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_wrong_room(self, mock_bot):
         event = create_mock_reaction_event(room_id="!wrongroom:example.com")
         
-        await mock_bot.handle_activity_reaction(event)
-        
-        mock_bot.database.execute.assert_not_called()
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_non_annotation_relation(self, mock_bot):
@@ -344,14 +1132,12 @@ class TestWallingfordBot:
             rel_type=RelationType.REFERENCE
         )
         
-        await mock_bot.handle_activity_reaction(event)
-        
-        mock_bot.database.execute.assert_not_called()
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_stores_valid_reaction(self, mock_bot):
-        session_data = create_mock_session_data(group_message_id="$event123:example.com")
-        mock_bot.database.fetchrow.return_value = session_data
+        session = await add_announced_session(mock_bot.database)
         
         event = create_mock_reaction_event(
             room_id="!grouproom:example.com",
@@ -359,49 +1145,104 @@ class TestWallingfordBot:
             target_event_id="$event123:example.com"
         )
         
-        await mock_bot.handle_activity_reaction(event)
+        with patch.object(mock_bot.outbox, 'wake') as mock_wake:
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
+            
+            # Should store the reaction, count it and queue the response with it
+            assert await stored_reactions(mock_bot.database) == [
+                (session.id, "@testuser:example.com", "lunch")
+            ]
+            assert await mock_bot.stats.etag("default") == '"default-1"'
+            assert await queued(mock_bot.database) == [{
+                "session_id": session.id, "room_id": "!grouproom:example.com", "kind": "text",
+                "body": mock_bot.config.activities["lunch"]["response"], "reactions": [],
+            }]
+            mock_wake.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_handle_activity_reaction_duplicate_is_not_counted_again(self, mock_bot):
+        session = await add_announced_session(mock_bot.database)
         
-        # Should store the reaction and send response
-        assert mock_bot.database.execute.call_count == 1
-        mock_bot.client.send_text.assert_called_once()
+        event = create_mock_reaction_event(
+            room_id="!grouproom:example.com",
+            emoji="🍽️",
+            target_event_id="$event123:example.com"
+        )
+        await add_reaction(mock_bot.database, session.id, event_id=str(event.event_id))
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
+        
+        assert await mock_bot.stats.etag("default") == '"default-0"'
+        assert await logged(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_no_session(self, mock_bot):
-        mock_bot.database.fetchrow.return_value = None
-        
         event = create_mock_reaction_event(room_id="!grouproom:example.com")
-        await mock_bot.handle_activity_reaction(event)
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert await stored_reactions(mock_bot.database) == []
 
     @pytest.mark.asyncio
-    async def test_handle_activity_reaction_no_group_message_id(self, mock_bot):
-        session_data = create_mock_session_data(group_message_id=None)
-        mock_bot.database.fetchrow.return_value = session_data
+    async def test_handle_activity_reaction_ignores_confirmation_request(self, mock_bot):
+        session = create_mock_session(session_id="s1", confirmation_event_id="$request:example.com")
+        mock_bot.state.load([session], [], [])
         
-        event = create_mock_reaction_event(room_id="!grouproom:example.com")
-        await mock_bot.handle_activity_reaction(event)
+        event = create_mock_reaction_event(
+            room_id="!grouproom:example.com", target_event_id="$request:example.com"
+        )
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert mock_bot.state.participants("s1", "lunch") == []
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_wrong_target_event(self, mock_bot):
-        session_data = create_mock_session_data(group_message_id="$different:example.com")
-        mock_bot.database.fetchrow.return_value = session_data
+        session = create_mock_session(session_id="s1", group_message_id="$different:example.com")
+        mock_bot.state.load([session], [], [])
         
         event = create_mock_reaction_event(
             room_id="!grouproom:example.com",
             target_event_id="$event123:example.com"
         )
         
-        await mock_bot.handle_activity_reaction(event)
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
+
+    @pytest.mark.asyncio
+    async def test_handle_activity_reaction_accepts_yesterdays_announcement(self, mock_bot):
+        mock_bot.clock = VirtualClock(datetime(2024, 1, 4, 0, 30))
+        session = await add_session(
+            mock_bot.database, session_id="s1", date="2024-01-03",
+            group_message_id="$announce:example.com"
+        )
+        mock_bot.state.load([session], [], [])
+        
+        event = create_mock_reaction_event(
+            room_id="!grouproom:example.com", target_event_id="$announce:example.com"
+        )
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert mock_bot.state.participants("s1", "lunch") == ["@testuser:example.com"]
+        assert await stored_reactions(mock_bot.database) == [("s1", "@testuser:example.com", "lunch")]
+
+    @pytest.mark.asyncio
+    async def test_handle_activity_reaction_outside_window(self, mock_bot):
+        mock_bot.clock = VirtualClock(datetime(2024, 1, 5, 9, 0))
+        session = create_mock_session(
+            session_id="s1", date="2024-01-03", group_message_id="$announce:example.com"
+        )
+        mock_bot.state.load([session], [], [])
+        
+        event = create_mock_reaction_event(
+            room_id="!grouproom:example.com", target_event_id="$announce:example.com"
+        )
+        with no_queries(mock_bot.database):
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
+        
+        assert mock_bot.state.participants("s1", "lunch") == []
 
     @pytest.mark.asyncio
     async def test_handle_activity_reaction_unknown_emoji(self, mock_bot):
-        session_data = create_mock_session_data(group_message_id="$event123:example.com")
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_announced_session(mock_bot.database)
         
         event = create_mock_reaction_event(
             room_id="!grouproom:example.com",
@@ -409,233 +1250,432 @@ class TestWallingfordBot:
             target_event_id="$event123:example.com"
         )
         
-        await mock_bot.handle_activity_reaction(event)
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.database.execute.assert_not_called()
+        assert await stored_reactions(mock_bot.database) == []
 
     @pytest.mark.asyncio
-    async def test_handle_activity_reaction_send_response_failure(self, mock_bot):
-        session_data = create_mock_session_data(group_message_id="$event123:example.com")
-        mock_bot.database.fetchrow.return_value = session_data
-        mock_bot.client.send_text.side_effect = Exception("Send failed")
+    async def test_handle_activity_reaction_duplicate_gets_no_second_response(self, mock_bot):
+        session = await add_announced_session(mock_bot.database)
         
         event = create_mock_reaction_event(
             room_id="!grouproom:example.com",
             emoji="🍽️",
             target_event_id="$event123:example.com"
         )
+        await add_reaction(mock_bot.database, session.id, event_id=str(event.event_id))
         
-        await mock_bot.handle_activity_reaction(event)
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.log.exception.assert_called_once()
+        assert await queued(mock_bot.database) == []
 
     @pytest.mark.asyncio 
     async def test_send_group_announcement_fully_available(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
-        
-        await mock_bot.send_group_announcement("test-session", "🏠")
+        await add_session(mock_bot.database, session_id="test-session")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.send_group_announcement("test-session", "🏠", mock_bot.tenants.default, conn)
         
-        mock_bot.client.send_text.assert_called_once()
+        [message] = await queued(mock_bot.database)
+        assert message["kind"] == "announcement"
         # Should react with all activity emojis
-        assert mock_bot.client.react.call_count == len(mock_bot.config.activities)
+        assert len(message["reactions"]) == len(mock_bot.config.activities)
 
     @pytest.mark.asyncio
     async def test_send_group_announcement_lunch_only(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
+        await add_session(mock_bot.database, session_id="test-session")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.send_group_announcement("test-session", "🏢", mock_bot.tenants.default, conn)
         
-        await mock_bot.send_group_announcement("test-session", "🏢")
-        
-        mock_bot.client.send_text.assert_called_once()
+        [message] = await queued(mock_bot.database)
         # Should only react with lunch emoji
-        assert mock_bot.client.react.call_count == 1
+        assert message["reactions"] == ["🍽️"]
 
     @pytest.mark.asyncio
     async def test_send_group_announcement_busy_all_day(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
-        
-        await mock_bot.send_group_announcement("test-session", "🕒")
+        await add_session(mock_bot.database, session_id="test-session")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.send_group_announcement("test-session", "🕒", mock_bot.tenants.default, conn)
         
-        mock_bot.client.send_text.assert_called_once()
+        [message] = await queued(mock_bot.database)
         # Should not react with any activity emojis
-        mock_bot.client.react.assert_not_called()
+        assert message["reactions"] == []
 
     @pytest.mark.asyncio
-    async def test_send_group_announcement_send_failure(self, mock_bot):
-        mock_bot.client.send_text.side_effect = Exception("Send failed")
+    async def test_send_group_announcement_fans_out_to_every_group_room(self, mock_bot):
+        mock_bot.config.tenants[0]["group_rooms"] = ["!family:example.com", "!climbing:example.com"]
+        mock_bot.load_tenants()
+        await add_session(mock_bot.database, session_id="test-session")
         
-        await mock_bot.send_group_announcement("test-session", "🏠")
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.send_group_announcement("test-session", "🏢", mock_bot.tenants.default, conn)
         
-        mock_bot.log.exception.assert_called_once()
+        rooms = [message["room_id"] for message in await queued(mock_bot.database)]
+        assert rooms == ["!family:example.com", "!climbing:example.com"]
 
     @pytest.mark.asyncio
-    async def test_send_group_announcement_react_failure(self, mock_bot):
-        mock_bot.client.send_text.return_value = EventID("$event123:example.com")
-        mock_bot.client.react.side_effect = Exception("React failed")
+    async def test_record_delivery_tracks_announcements(self, mock_bot):
+        mock_bot.config.tenants[0]["group_rooms"] = ["!family:example.com", "!climbing:example.com"]
+        mock_bot.load_tenants()
+        session = await add_session(mock_bot.database, session_id="test-session")
+        mock_bot.state.load([session], [], [])
+        family = {"session_id": "test-session", "room_id": "!family:example.com", "kind": "announcement"}
+        climbing = {**family, "room_id": "!climbing:example.com"}
+        
+        # The second room's delivery finishing first doesn't make it the primary message
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.record_delivery(conn, climbing, EventID("$climbing:example.com"))
+            await mock_bot.record_delivery(conn, family, EventID("$family:example.com"))
+        
+        assert (await mock_bot.sessions.get("test-session")).group_message_id == "$family:example.com"
+        tracked = await mock_bot.tracked_events.announcements_since(session.date)
+        assert sorted((t.event_id, t.session_id, t.room_id) for t in tracked) == [
+            ("$climbing:example.com", "test-session", "!climbing:example.com"),
+            ("$family:example.com", "test-session", "!family:example.com"),
+        ]
+        assert [data for _, kind, data in await logged(mock_bot.database)] == [
+            {"event_id": "$climbing:example.com", "room_id": "!climbing:example.com"},
+            {"event_id": "$family:example.com", "room_id": "!family:example.com"},
+        ]
+        assert mock_bot.state.get_session("test-session").group_message_id == "$family:example.com"
+        assert mock_bot.state.tracked_events["$climbing:example.com"] == "test-session"
+
+    @pytest.mark.asyncio
+    async def test_handle_activity_reaction_accepts_any_tracked_announcement(self, mock_bot):
+        mock_bot.config.tenants[0]["group_rooms"] = ["!family:example.com", "!climbing:example.com"]
+        mock_bot.load_tenants()
+        session = await add_session(mock_bot.database, session_id="s1", group_message_id="$family:example.com")
+        mock_bot.state.load([session], [], [], [
+            TrackedEvent("$family:example.com", "s1"),
+            TrackedEvent("$climbing:example.com", "s1"),
+        ])
+        
+        for sender, room_id, target in [
+            ("@bob:example.com", "!family:example.com", "$family:example.com"),
+            ("@carol:example.com", "!climbing:example.com", "$climbing:example.com"),
+        ]:
+            event = create_mock_reaction_event(
+                sender=sender, room_id=room_id, emoji="🍽️", target_event_id=target
+            )
+            await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
+        
+        # Reactions from both rooms land in the same session aggregate
+        assert len(mock_bot.state.participants("s1", "lunch")) == 2
+
+    @pytest.mark.asyncio
+    async def test_handle_activity_reaction_checks_tracked_events_in_database(self, mock_bot):
+        await add_announced_session(
+            mock_bot.database, session_id="s1", announcement="$family:example.com"
+        )
+        await add_tracked_event(mock_bot.database, "$climbing:example.com", "s1", "announcement")
         
-        await mock_bot.send_group_announcement("test-session", "🏠")
+        event = create_mock_reaction_event(
+            room_id="!grouproom:example.com", emoji="🍽️", target_event_id="$climbing:example.com"
+        )
+        await mock_bot.handle_activity_reaction(event, mock_bot.tenants.default)
         
-        mock_bot.log.exception.assert_called_once()
+        assert await stored_reactions(mock_bot.database) == [("s1", "@testuser:example.com", "lunch")]
 
     @pytest.mark.asyncio
     async def test_schedule_reminders_fully_available(self, mock_bot):
-        # Mock datetime to ensure reminder times are in future
-        with patch('wallingfordbot.bot.datetime') as mock_datetime:
-            mock_now = datetime(2023, 1, 1, 9, 0)  # 9 AM
-            mock_datetime.now.return_value = mock_now
-            mock_datetime.replace = datetime.replace
-            
-            await mock_bot.schedule_reminders("test-session", "🏠")
-            
-            # Should schedule both lunch and evening reminders
-            assert mock_bot.database.execute.call_count == 2
+        # Set the clock to ensure reminder times are in future
+        mock_bot.clock = VirtualClock(datetime(2023, 1, 1, 9, 0))  # 9 AM
+        await add_session(mock_bot.database, session_id="test-session")
+        
+        reminders = await mock_bot.schedule_reminders("test-session", "🏠")
+        
+        # Should schedule both lunch and evening reminders
+        assert await scheduled(mock_bot.database) == ["lunch", "evening"]
+        assert [reminder_type for reminder_type, _ in reminders] == ["lunch", "evening"]
 
     @pytest.mark.asyncio
     async def test_schedule_reminders_lunch_only(self, mock_bot):
-        with patch('wallingfordbot.bot.datetime') as mock_datetime:
-            mock_now = datetime(2023, 1, 1, 9, 0)  # 9 AM
-            mock_datetime.now.return_value = mock_now
-            mock_datetime.replace = datetime.replace
-            
-            await mock_bot.schedule_reminders("test-session", "🏢")
-            
-            # Should only schedule lunch reminder
-            assert mock_bot.database.execute.call_count == 1
+        mock_bot.clock = VirtualClock(datetime(2023, 1, 1, 9, 0))  # 9 AM
+        await add_session(mock_bot.database, session_id="test-session")
+        
+        await mock_bot.schedule_reminders("test-session", "🏢")
+        
+        # Should only schedule lunch reminder
+        assert await scheduled(mock_bot.database) == ["lunch"]
 
     @pytest.mark.asyncio
     async def test_schedule_reminders_busy_all_day(self, mock_bot):
+        await add_session(mock_bot.database, session_id="test-session")
+        
         await mock_bot.schedule_reminders("test-session", "🕒")
         
         # Should not schedule any reminders
-        mock_bot.database.execute.assert_not_called()
+        assert await scheduled(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_schedule_reminders_past_lunch_time(self, mock_bot):
-        # Mock datetime to be after lunch time
-        with patch('wallingfordbot.bot.datetime') as mock_datetime:
-            mock_now = datetime(2023, 1, 1, 14, 0)  # 2 PM - after lunch
-            mock_datetime.now.return_value = mock_now
-            mock_datetime.replace = datetime.replace
-            
-            await mock_bot.schedule_reminders("test-session", "🏠")
-            
-            # Should only schedule evening reminder (lunch time passed)
-            assert mock_bot.database.execute.call_count == 1
+        # Set the clock to be after lunch time
+        mock_bot.clock = VirtualClock(datetime(2023, 1, 1, 14, 0))  # 2 PM - after lunch
+        await add_session(mock_bot.database, session_id="test-session")
+        
+        await mock_bot.schedule_reminders("test-session", "🏠")
+        
+        # Should only schedule evening reminder (lunch time passed)
+        assert await scheduled(mock_bot.database) == ["evening"]
 
     @pytest.mark.asyncio
     async def test_schedule_reminders_past_all_times(self, mock_bot):
-        # Mock datetime to be after all reminder times
-        with patch('wallingfordbot.bot.datetime') as mock_datetime:
-            mock_now = datetime(2023, 1, 1, 19, 0)  # 7 PM - after all times
-            mock_datetime.now.return_value = mock_now
-            mock_datetime.replace = datetime.replace
-            
-            await mock_bot.schedule_reminders("test-session", "🏠")
-            
-            # Should not schedule any reminders (all times passed)
-            mock_bot.database.execute.assert_not_called()
+        # Set the clock to be after all reminder times
+        mock_bot.clock = VirtualClock(datetime(2023, 1, 1, 19, 0))  # 7 PM - after all times
+        await add_session(mock_bot.database, session_id="test-session")
+        
+        await mock_bot.schedule_reminders("test-session", "🏠")
+        
+        # Should not schedule any reminders (all times passed)
+        assert await scheduled(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_check_pending_reminders_lunch(self, mock_bot):
-        reminder_data = create_mock_reminder_data("test-session", "lunch")
-        mock_bot.database.fetch.return_value = [reminder_data]
+        session = await add_session(mock_bot.database, session_id="test-session")
+        reminder_id = await add_reminder(mock_bot.database, "test-session", "lunch")
         
         with patch.object(mock_bot, 'send_lunch_reminder') as mock_send:
             await mock_bot.check_pending_reminders()
             
-            mock_send.assert_called_once_with("test-session")
-            mock_bot.database.execute.assert_called_once()
+            mock_send.assert_called_once_with("test-session", session)
+            row = await mock_bot.database.fetchrow(
+                "SELECT sent, claimed_by FROM scheduled_reminder WHERE id = $1", reminder_id
+            )
+            assert (bool(row["sent"]), row["claimed_by"]) == (True, "test-instance")
 
     @pytest.mark.asyncio
     async def test_check_pending_reminders_evening(self, mock_bot):
-        reminder_data = create_mock_reminder_data("test-session", "evening")
-        mock_bot.database.fetch.return_value = [reminder_data]
+        await add_session(mock_bot.database, session_id="test-session")
+        await add_reminder(mock_bot.database, "test-session", "evening")
         
-        with patch.object(mock_bot, 'send_evening_reminder') as mock_send:
+        # The session was deleted after the batch was claimed
+        with patch.object(mock_bot, 'send_evening_reminder') as mock_send, \
+             patch.object(mock_bot, 'get_sessions', return_value={}):
             await mock_bot.check_pending_reminders()
             
-            mock_send.assert_called_once_with("test-session")
+            # It is looked up again, and skipped
+            mock_send.assert_called_once_with("test-session", None)
 
     @pytest.mark.asyncio
     async def test_send_lunch_reminder_with_reactions(self, mock_bot):
-        session_data = create_mock_session_data(lunch_reminder_sent=False)
-        reaction_data = create_mock_activity_reaction("test-session", activity="lunch")
+        await add_session(mock_bot.database, session_id="test-session", lunch_reminder_sent=False)
+        await add_reaction(mock_bot.database, "test-session", activity="lunch")
+        
+        with patch.object(mock_bot.outbox, 'wake') as mock_wake:
+            await mock_bot.send_lunch_reminder("test-session")
+            
+            # The flag and the message are committed together
+            assert (await mock_bot.sessions.get("test-session")).lunch_reminder_sent
+            assert await logged(mock_bot.database) == [
+                ("test-session", "reminder_sent", {"reminder_type": "lunch"})
+            ]
+            [message] = await queued(mock_bot.database)
+            assert message["room_id"] == "!alexroom:example.com"
+            mock_wake.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_reminders_name_participants_from_cache(self, mock_bot):
+        mock_bot.state.load([await add_session(mock_bot.database, session_id="s1")], [], [])
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "lunch", "$r1")
+        mock_bot.state.add_reaction("s1", "@carol:example.com", "lunch", "$r2")
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "pub_dinner", "$r3")
+        mock_bot.members.put(UserID("@bob:example.com"), "Bob")
+        
+        await mock_bot.send_lunch_reminder("s1")
+        await mock_bot.send_evening_reminder("s1")
+        
+        lunch, evening = [message["body"] for message in await queued(mock_bot.database)]
+        assert lunch.endswith("Coming: Bob, carol")
+        assert evening == "Evening plans: to meet at the pub for dinner (Bob)"
+        mock_bot.client.get_joined_members.assert_not_called()
+        mock_bot.client.get_displayname.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_evening_reminder_lists_shopping_for_headcount(self, mock_bot):
+        mock_bot.state.load([await add_session(mock_bot.database, session_id="s1")], [], [])
+        for user in ["@bob:example.com", "@carol:example.com", "@dave:example.com"]:
+            mock_bot.state.add_reaction("s1", user, "picnic_dinner", f"${user}")
+        mock_bot.state.remove_reaction("$@dave:example.com")
         
-        mock_bot.database.fetchrow.return_value = session_data
-        mock_bot.database.fetch.return_value = [reaction_data]
+        await mock_bot.send_evening_reminder("s1")
         
-        await mock_bot.send_lunch_reminder("test-session")
+        # Counted from the state; none of these reactions are in the database
+        [message] = await queued(mock_bot.database)
+        assert message["body"].endswith("Shopping list:\n- 3 sandwiches\n- 1 bags crisps")
+
+    @pytest.mark.asyncio
+    async def test_reminders_reach_participants_when_enabled(self, mock_bot):
+        mock_bot.config.participant_reminders = {**mock_bot.config.participant_reminders, "enabled": True}
+        session = await add_session(mock_bot.database, session_id="s1", group_message_id="$announce")
+        mock_bot.state.load([session], [], [])
+        mock_bot.state.add_reaction("s1", "@alex:example.com", "lunch", "$r1")
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "lunch", "$r2")
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "picnic_dinner", "$r3")
+        
+        with patch.object(mock_bot.notifier, 'notify', return_value=0) as mock_notify:
+            await mock_bot.send_lunch_reminder("s1")
+            await mock_bot.send_evening_reminder("s1")
+        
+        lunch, evening = mock_notify.call_args_list
+        # Alex already gets the reminder in the private room
+        assert list(lunch[0][0]) == ["@bob:example.com"]
+        assert lunch[0][1] == ("!grouproom:example.com", "$announce")
+        assert evening[0][0] == {"@bob:example.com": "See you this evening for a picnic dinner!"}
+
+    @pytest.mark.asyncio
+    async def test_thread_reminders_go_to_the_room_reacted_in(self, mock_bot):
+        mock_bot.config.participant_reminders = {**mock_bot.config.participant_reminders, "enabled": True}
+        mock_bot.notifier.mode = "thread"
+        session = await add_session(mock_bot.database, session_id="s1", group_message_id="$announce")
+        await add_tracked_event(mock_bot.database, "$family", "s1", "announcement", "!family:example.com")
+        await add_reaction(mock_bot.database, "s1", "@carol:example.com", target_event_id="$family")
+        await add_reaction(mock_bot.database, "s1", "@bob:example.com")
+        
+        with patch.object(
+            mock_bot.notifier, 'notify', side_effect=lambda messages, thread: len(messages)
+        ) as mock_notify:
+            await mock_bot.remind_participants(session, mock_bot.tenants.default, {
+                "@bob:example.com": "Lunch!", "@carol:example.com": "Lunch!",
+            })
+        
+        threads = {call[0][1]: list(call[0][0]) for call in mock_notify.call_args_list}
+        # Reactions stored without their announcement fall back to the first group room
+        assert threads == {
+            ("!grouproom:example.com", "$announce"): ["@bob:example.com"],
+            ("!family:example.com", "$family"): ["@carol:example.com"],
+        }
+
+    @pytest.mark.asyncio
+    async def test_participant_reminders_are_opt_in(self, mock_bot):
+        mock_bot.state.load([await add_session(mock_bot.database, session_id="s1")], [], [])
+        mock_bot.state.add_reaction("s1", "@bob:example.com", "lunch", "$r2")
         
-        mock_bot.client.send_text.assert_called_once()
-        mock_bot.database.execute.assert_called_once()
+        with patch.object(mock_bot.notifier, 'notify') as mock_notify:
+            await mock_bot.send_lunch_reminder("s1")
+            
+            assert len(await queued(mock_bot.database)) == 1
+            mock_notify.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_handle_member_event_only_for_configured_rooms(self, mock_bot):
+        event = MagicMock()
+        event.state_key = "@bob:example.com"
+        event.content = MemberStateEventContent(membership=Membership.JOIN, displayname="Bob")
+        event.room_id = RoomID("!elsewhere:example.com")
+        
+        await mock_bot.handle_member_event(event)
+        assert mock_bot.members.get(UserID("@bob:example.com")) is None
+        
+        event.room_id = RoomID("!grouproom:example.com")
+        await mock_bot.handle_member_event(event)
+        assert mock_bot.members.get(UserID("@bob:example.com")) == "Bob"
+
+    @pytest.mark.asyncio
+    async def test_member_loop_populates_configured_rooms(self, mock_bot):
+        mock_bot.client.get_joined_members.return_value = {}
+        
+        with patch('asyncio.sleep', side_effect=asyncio.CancelledError()) as mock_sleep:
+            await mock_bot.member_loop()
+        
+        rooms = {call[0][0] for call in mock_bot.client.get_joined_members.call_args_list}
+        assert rooms == {"!alexroom:example.com", "!grouproom:example.com"}
+        assert mock_sleep.call_args[0][0] == 3600 * 0.9
 
     @pytest.mark.asyncio
     async def test_send_lunch_reminder_no_reactions(self, mock_bot):
-        session_data = create_mock_session_data(lunch_reminder_sent=False)
-        mock_bot.database.fetchrow.return_value = session_data
-        mock_bot.database.fetch.return_value = []
+        await add_session(mock_bot.database, session_id="test-session", lunch_reminder_sent=False)
         
         await mock_bot.send_lunch_reminder("test-session")
         
-        mock_bot.client.send_text.assert_not_called()
+        assert await queued(mock_bot.database) == []
+
+    @pytest.mark.asyncio
+    async def test_participants_from_database_are_listed_once(self, mock_bot):
+        await add_session(mock_bot.database, session_id="s1")
+        await add_reaction(mock_bot.database, "s1", "@bob:example.com", "pub_dinner", "🍺")
+        await add_reaction(mock_bot.database, "s1", "@bob:example.com", "pub_dinner", "🍻")
+        await add_reaction(mock_bot.database, "s1", "@carol:example.com", "pub_dinner", "🍺")
+        await add_reaction(mock_bot.database, "s1", "@bob:example.com", "lunch")
+        
+        assert await mock_bot.get_participants_by_activity("s1") == {
+            "pub_dinner": ["@bob:example.com", "@carol:example.com"],
+            "lunch": ["@bob:example.com"],
+        }
 
     @pytest.mark.asyncio
     async def test_send_evening_reminder_with_activities(self, mock_bot):
-        session_data = create_mock_session_data(evening_reminder_sent=False)
-        reaction_data = create_mock_activity_reaction("test-session", activity="pub_dinner")
-        
-        mock_bot.database.fetchrow.return_value = session_data
-        mock_bot.database.fetch.return_value = [reaction_data]
+        await add_session(mock_bot.database, session_id="test-session", evening_reminder_sent=False)
+        await add_reaction(mock_bot.database, "test-session", activity="pub_dinner", emoji="🍺")
         
         await mock_bot.send_evening_reminder("test-session")
         
-        mock_bot.client.send_text.assert_called_once()
-        mock_bot.database.execute.assert_called_once()
+        assert len(await queued(mock_bot.database)) == 1
+        assert (await mock_bot.sessions.get("test-session")).evening_reminder_sent
+
+    @pytest.mark.asyncio
+    async def test_reminder_marked_sent_meanwhile_is_not_repeated(self, mock_bot):
+        stale = create_mock_session(session_id="test-session", lunch_reminder_sent=False)
+        # Another caller set the flag after this one read the session
+        await add_session(mock_bot.database, session_id="test-session", lunch_reminder_sent=True)
+        await add_reaction(mock_bot.database, "test-session", activity="lunch")
+        
+        with patch.object(mock_bot.notifier, 'notify') as mock_notify:
+            await mock_bot.send_lunch_reminder("test-session", stale)
+            
+            assert await queued(mock_bot.database) == []
+            assert await logged(mock_bot.database) == []
+            mock_notify.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_send_lunch_reminder_already_sent(self, mock_bot):
-        session_data = create_mock_session_data(lunch_reminder_sent=True)
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_session(mock_bot.database, session_id="test-session", lunch_reminder_sent=True)
+        await add_reaction(mock_bot.database, "test-session", activity="lunch")
+        await add_reaction(mock_bot.database, "test-session", activity="pub_dinner", emoji="🍺")
         
         await mock_bot.send_lunch_reminder("test-session")
         
-        mock_bot.client.send_text.assert_not_called()
+        assert await queued(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_send_evening_reminder_already_sent(self, mock_bot):
-        session_data = create_mock_session_data(evening_reminder_sent=True)
-        mock_bot.database.fetchrow.return_value = session_data
+        await add_session(mock_bot.database, session_id="test-session", evening_reminder_sent=True)
+        await add_reaction(mock_bot.database, "test-session", activity="lunch")
+        await add_reaction(mock_bot.database, "test-session", activity="pub_dinner", emoji="🍺")
         
         await mock_bot.send_evening_reminder("test-session")
         
-        mock_bot.client.send_text.assert_not_called()
+        assert await queued(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_send_evening_reminder_no_activities(self, mock_bot):
-        session_data = create_mock_session_data(evening_reminder_sent=False)
-        mock_bot.database.fetchrow.return_value = session_data
-        mock_bot.database.fetch.return_value = []  # No evening activities
+        await add_session(mock_bot.database, session_id="test-session", evening_reminder_sent=False)
+        # Lunch is not an evening activity
+        await add_reaction(mock_bot.database, "test-session", activity="lunch")
         
         await mock_bot.send_evening_reminder("test-session")
         
-        mock_bot.client.send_text.assert_not_called()
+        assert await queued(mock_bot.database) == []
 
     @pytest.mark.asyncio
     async def test_check_pending_reminders_no_reminders(self, mock_bot):
-        mock_bot.database.fetch.return_value = []
-        
-        await mock_bot.check_pending_reminders()
-        
-        mock_bot.database.execute.assert_not_called()
+        with patch.object(mock_bot, 'get_sessions') as mock_get_sessions:
+            await mock_bot.check_pending_reminders()
+            
+            mock_get_sessions.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_check_pending_reminders_exception_handling(self, mock_bot):
-        reminder_data = create_mock_reminder_data("test-session", "lunch")
-        mock_bot.database.fetch.return_value = [reminder_data]
+        await add_session(mock_bot.database, session_id="test-session")
+        reminder_id = await add_reminder(mock_bot.database, "test-session", "lunch")
         
         with patch.object(mock_bot, 'send_lunch_reminder', side_effect=Exception("Reminder failed")):
             await mock_bot.check_pending_reminders()
             
             mock_bot.log.exception.assert_called_once()
+            # The claim is released so the next check retries it
+            row = await mock_bot.database.fetchrow(
+                "SELECT sent, claimed_by FROM scheduled_reminder WHERE id = $1", reminder_id
+            )
+            assert (bool(row["sent"]), row["claimed_by"]) == (False, None)
 
     @pytest.mark.asyncio
     async def test_reminder_loop_cancellation(self, mock_bot):
@@ -663,6 +1703,171 @@ class TestWallingfordBot:
             await mock_bot.reminder_loop()
             
             mock_bot.log.exception.assert_called()
+            assert mock_bot.health.errors["reminder"] == "Exception: Test error"
+            assert mock_bot.metrics.get("loop_errors_total", loop="reminder") == 2
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_retention_task(self, mock_bot):
+        mock_task = MagicMock()
+        mock_bot.retention_task = mock_task
+        
+        await mock_bot.stop()
+        
+        mock_task.cancel.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_retention_loop_runs_job_and_survives_errors(self, mock_bot):
+        sleeps = []
+        
+        async def mock_sleep(duration):
+            sleeps.append(duration)
+            if len(sleeps) > 2:
+                raise asyncio.CancelledError()
+        
+        with patch('asyncio.sleep', side_effect=mock_sleep), \
+             patch.object(mock_bot, 'run_retention', side_effect=[Exception("DB down"), 3]) as mock_run:
+            await mock_bot.retention_loop()
+            
+            assert mock_run.call_count == 2
+            assert sleeps[0] == 24 * 3600
+            mock_bot.log.exception.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_run_retention_uses_config(self, mock_bot):
+        with patch('wallingfordbot.bot.RetentionJob') as mock_job:
+            mock_job.return_value.run = AsyncMock(return_value=0)
+            
+            await mock_bot.run_retention()
+            
+            assert mock_job.call_args[1] == {
+                "days": 30, "reaction_window_days": 1, "batch_size": 2, "clock": mock_bot.clock,
+            }
+
+    @pytest.mark.asyncio
+    async def test_record_delivery_tracks_confirmation_request(self, mock_bot):
+        await add_session(mock_bot.database, session_id="test-session")
+        message = {"session_id": "test-session", "room_id": "!alexroom:example.com",
+                   "kind": "confirmation_request"}
+        
+        async with mock_bot.database.acquire() as conn:
+            await mock_bot.record_delivery(conn, message, EventID("$confirm:example.com"))
+        
+        session = await mock_bot.sessions.get("test-session")
+        assert session.confirmation_event_id == "$confirm:example.com"
+        # Reactions to the request find the session through it
+        assert await mock_bot.tracked_events.session_for("$confirm:example.com", "confirmation") == session
+        assert await logged(mock_bot.database) == [
+            ("test-session", "confirmation_requested", {"event_id": "$confirm:example.com"})
+        ]
+
+    @pytest.mark.asyncio
+    async def test_backfill_inserts_missed_activity_reactions(self, mock_bot):
+        session = await add_announced_session(
+            mock_bot.database, announcement="$announce:example.com", room_id=None,
+            session_id="s1", alex_confirmation="🏠", confirmed=True,
+            confirmation_event_id="$confirm:example.com"
+        )
+        mock_bot.client.api.request.return_value = {"chunk": [
+            create_raw_reaction(emoji="🍺", target_event_id="$announce:example.com", timestamp=3000),
+            create_raw_reaction(sender="@wallingfordbot:example.com", emoji="🍺",
+                                target_event_id="$announce:example.com", timestamp=2000),
+            create_raw_reaction(emoji="🌮", target_event_id="$announce:example.com", timestamp=1000),
+        ]}
+        mock_bot.state.load([session], [], [])
+        
+        await mock_bot.backfill_reactions()
+        
+        # Confirmed sessions only need their group announcement backfilled
+        mock_bot.client.api.request.assert_called_once()
+        assert await stored_reactions(mock_bot.database) == [("s1", "@testuser:example.com", "pub_dinner")]
+        assert [kind for _, kind, _ in await logged(mock_bot.database)] == ["reaction_added"]
+        assert await mock_bot.stats.etag("default") == '"default-1"'
+        assert mock_bot.state.participants("s1", "pub_dinner") == ["@testuser:example.com"]
+        checkpoint = await mock_bot.database.fetchval(
+            "SELECT last_ts FROM backfill_checkpoint WHERE event_id = $1", "$announce:example.com"
+        )
+        assert checkpoint == 3000
+        assert await queued(mock_bot.database) == []
+
+    @pytest.mark.asyncio
+    async def test_backfill_counts_only_reactions_it_inserts(self, mock_bot):
+        await add_announced_session(
+            mock_bot.database, announcement="$announce:example.com", room_id=None,
+            session_id="s1", alex_confirmation="🏠", confirmed=True
+        )
+        seen = create_raw_reaction(emoji="🍺", target_event_id="$announce:example.com", timestamp=2000)
+        await add_reaction(
+            mock_bot.database, "s1", activity="pub_dinner", emoji="🍺", event_id=seen["event_id"]
+        )
+        mock_bot.client.api.request.return_value = {"chunk": [
+            create_raw_reaction(sender="@bob:example.com", emoji="🍺",
+                                target_event_id="$announce:example.com", timestamp=3000),
+            seen,
+        ]}
+        
+        await mock_bot.backfill_reactions()
+        
+        assert mock_bot.metrics.get("backfill_reactions_total") == 1
+
+    @pytest.mark.asyncio
+    async def test_backfill_applies_missed_confirmation(self, mock_bot):
+        await add_session(mock_bot.database, session_id="s1", confirmation_event_id="$confirm:example.com")
+        mock_bot.client.api.request.return_value = {"chunk": [
+            create_raw_reaction(sender="@alex:example.com", emoji="👍",
+                                target_event_id="$confirm:example.com", timestamp=2000),
+            create_raw_reaction(sender="@alex:example.com", emoji="🏢",
+                                target_event_id="$confirm:example.com", timestamp=1000),
+        ]}
+        
+        with patch.object(mock_bot, 'confirm_session') as mock_confirm:
+            await mock_bot.backfill_reactions()
+            
+            mock_confirm.assert_called_once()
+            assert mock_confirm.call_args[0][0].alex_confirmation == "🏢"
+
+    @pytest.mark.asyncio
+    async def test_backfill_skips_confirmation_seen_live(self, mock_bot):
+        mock_bot.clock = VirtualClock(datetime(2024, 1, 3, 9, 0))
+        session = await add_session(
+            mock_bot.database, session_id="s1", date="2024-01-03",
+            confirmation_event_id="$confirm:example.com"
+        )
+        await add_tracked_event(mock_bot.database, "$confirm:example.com", "s1", "confirmation")
+        choice = create_mock_reaction_event(
+            sender="@alex:example.com", emoji="🏠", target_event_id="$confirm:example.com"
+        )
+        thumbs_up = create_mock_reaction_event(
+            sender="@alex:example.com", emoji="👍", target_event_id="$confirm:example.com"
+        )
+        await mock_bot.handle_confirmation_reaction(choice, mock_bot.tenants.default)
+        await mock_bot.handle_confirmation_reaction(thumbs_up, mock_bot.tenants.default)
+        # The backfill started before the reactions arrived, so it still sees them as missed
+        mock_bot.client.api.request.return_value = {"chunk": [
+            {**create_raw_reaction(sender="@alex:example.com", emoji="👍",
+                                   target_event_id="$confirm:example.com", timestamp=2000),
+             "event_id": thumbs_up.event_id},
+            {**create_raw_reaction(sender="@alex:example.com", emoji="🏠",
+                                   target_event_id="$confirm:example.com", timestamp=1000),
+             "event_id": choice.event_id},
+        ]}
+        
+        with patch.object(mock_bot.sessions, 'since', return_value=[session]):
+            await mock_bot.backfill_reactions()
+        
+        assert (await mock_bot.sessions.get("s1")).confirmed
+        assert [row["kind"] for row in await queued(mock_bot.database)] == ["announcement"]
+        assert await scheduled(mock_bot.database) == ["lunch", "evening"]
+        # Confirming again, as a replayed 👍 would, changes nothing
+        await mock_bot.confirm_session(replace(session, alex_confirmation="🏠"), mock_bot.tenants.default)
+        assert [row["kind"] for row in await queued(mock_bot.database)] == ["announcement"]
+        assert await scheduled(mock_bot.database) == ["lunch", "evening"]
+
+    @pytest.mark.asyncio
+    async def test_backfill_failure_is_logged(self, mock_bot):
+        with patch.object(mock_bot.sessions, 'since', side_effect=Exception("DB down")):
+            await mock_bot.backfill_reactions()
+        
+        mock_bot.log.exception.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_get_config_class(self):
@@ -670,4 +1875,4 @@ class TestWallingfordBot:
 
     def test_get_db_upgrade_table(self):
         from wallingfordbot.db import upgrade_table
-        assert WallingfordBot.get_db_upgrade_table() == upgrade_table
\ No newline at end of file
+        assert WallingfordBot.get_db_upgrade_table() == upgrade_table
@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.errors import MForbidden, MLimitExceeded
+
+from wallingfordbot.breaker import CircuitBreaker, CircuitOpenError, GuardedClient
+from wallingfordbot.metrics import Metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(clock, **kwargs):
+    return CircuitBreaker(Metrics(), MagicMock(), clock=clock, **kwargs)
+
+
+async def failing():
+    raise ConnectionError("Homeserver down")
+
+
+async def succeeding():
+    return "$event:example.com"
+
+
+class TestCircuitBreaker:
+
+    @pytest.mark.asyncio
+    async def test_opens_after_consecutive_failures_and_fails_fast(self):
+        breaker = make_breaker(FakeClock(), failure_threshold=2)
+        call = AsyncMock()
+        
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await breaker.call(failing)
+        with pytest.raises(CircuitOpenError) as exc_info:
+            await breaker.call(call)
+        
+        call.assert_not_called()
+        assert exc_info.value.retry_after == 30
+        assert breaker.metrics.get("circuit_state") == 2
+        assert breaker.metrics.get("circuit_opened_total") == 1
+        assert breaker.metrics.get("circuit_rejected_total") == 1
+
+    @pytest.mark.asyncio
+    async def test_success_resets_the_failure_count(self):
+        breaker = make_breaker(FakeClock(), failure_threshold=2)
+        
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+        await breaker.call(succeeding)
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+        
+        assert breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_count(self):
+        breaker = make_breaker(FakeClock(), failure_threshold=1)
+        
+        async def forbidden():
+            raise MForbidden(403, "Not in room")
+        
+        with pytest.raises(MForbidden):
+            await breaker.call(forbidden)
+        assert breaker.state == "closed"
+        
+        async def rate_limited():
+            raise MLimitExceeded(429, "Slow down")
+        
+        with pytest.raises(MLimitExceeded):
+            await breaker.call(rate_limited)
+        assert breaker.state == "open"
+
+    @pytest.mark.asyncio
+    async def test_half_open_trial_closes_or_reopens(self):
+        clock = FakeClock()
+        breaker = make_breaker(clock, failure_threshold=1, reset_timeout=10)
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+        
+        clock.now = 11
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+        assert breaker.state == "open"
+        
+        clock.now = 22
+        assert await breaker.call(succeeding) == "$event:example.com"
+        assert breaker.state == "closed"
+        assert breaker.metrics.get("circuit_state") == 0
+
+    @pytest.mark.asyncio
+    async def test_half_open_lets_one_trial_through(self):
+        clock = FakeClock()
+        breaker = make_breaker(clock, failure_threshold=1, reset_timeout=10)
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+        clock.now = 11
+        release = asyncio.Event()
+        
+        async def slow():
+            await release.wait()
+        
+        trial = asyncio.create_task(breaker.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(succeeding)
+        release.set()
+        await trial
+        
+        assert breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_slow_calls_time_out_as_failures(self):
+        breaker = make_breaker(FakeClock(), failure_threshold=1, call_timeout=0.01)
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(asyncio.sleep, 1)
+        
+        assert breaker.state == "open"
+
+    @pytest.mark.asyncio
+    async def test_guarded_client_only_wraps_sends(self):
+        client = MagicMock()
+        client.send_text = AsyncMock(side_effect=ConnectionError("Homeserver down"))
+        client.mxid = "@wallingfordbot:example.com"
+        guarded = GuardedClient(client, make_breaker(FakeClock(), failure_threshold=1))
+        
+        with pytest.raises(ConnectionError):
+            await guarded.send_text(room_id="!room:example.com", text="Hello")
+        with pytest.raises(CircuitOpenError):
+            await guarded.react(room_id="!room:example.com", event_id="$event", key="👍")
+        
+        client.react.assert_not_called()
+        assert guarded.mxid == "@wallingfordbot:example.com"
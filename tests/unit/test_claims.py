@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.util.async_db import Database, Scheme
+
+from wallingfordbot.claims import ReminderClaims
+from wallingfordbot.db import upgrade_table
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    await db.execute("INSERT INTO workflow_session (id, date) VALUES ('s1', '2024-01-01')")
+    for reminder_type, minutes in [("lunch", -30), ("evening", -1), ("later", 60)]:
+        await db.execute(
+            "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) VALUES ('s1', $1, $2)",
+            reminder_type, NOW + timedelta(minutes=minutes)
+        )
+    yield db
+    await db.stop()
+
+
+class TestReminderClaims:
+
+    @pytest.mark.asyncio
+    async def test_instances_never_claim_the_same_reminder(self, database):
+        first = ReminderClaims(database, "a", batch_size=1)
+        second = ReminderClaims(database, "b", batch_size=1)
+        
+        claimed = await asyncio.gather(first.claim_due(NOW), second.claim_due(NOW), first.claim_due(NOW))
+        
+        types = [row['reminder_type'] for rows in claimed for row in rows]
+        assert sorted(types) == ["evening", "lunch"]
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_is_taken_over(self, database):
+        dead = ReminderClaims(database, "dead", lease_seconds=60)
+        survivor = ReminderClaims(database, "survivor", lease_seconds=60)
+        await dead.claim_due(NOW)
+        
+        assert await survivor.claim_due(NOW + timedelta(seconds=30)) == []
+        taken_over = await survivor.claim_due(NOW + timedelta(seconds=61))
+        
+        assert len(taken_over) == 2
+
+    @pytest.mark.asyncio
+    async def test_only_the_owner_marks_sent_or_releases(self, database):
+        owner = ReminderClaims(database, "owner")
+        other = ReminderClaims(database, "other")
+        lunch, evening = await owner.claim_due(NOW)
+        
+        await other.mark_sent(lunch['id'])
+        await other.release(evening['id'])
+        assert await other.claim_due(NOW) == []
+        
+        await owner.mark_sent(lunch['id'])
+        await owner.release(evening['id'])
+        
+        assert [row['reminder_type'] for row in await other.claim_due(NOW)] == ["evening"]
+
+    @pytest.mark.asyncio
+    async def test_postgres_skips_locked_rows(self):
+        database = MagicMock()
+        database.scheme = Scheme.POSTGRES
+        database.fetch = AsyncMock(return_value=[])
+        
+        await ReminderClaims(database, "a").claim_due(NOW)
+        
+        assert "FOR UPDATE SKIP LOCKED" in database.fetch.call_args[0][0]
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+
+from wallingfordbot.clock import VirtualClock, drain_ready
+
+START = datetime(2024, 1, 1, 9, 0)
+
+
+class TestVirtualClock:
+
+    @pytest.mark.asyncio
+    async def test_time_only_moves_when_advanced(self):
+        clock = VirtualClock(START)
+        
+        await clock.advance(90)
+        
+        assert clock.now() == START + timedelta(seconds=90)
+
+    @pytest.mark.asyncio
+    async def test_sleepers_wake_in_deadline_order_at_their_deadline(self):
+        clock = VirtualClock(START)
+        woke = []
+        
+        async def sleeper(name, seconds):
+            await clock.sleep(seconds)
+            woke.append((name, clock.now()))
+        
+        tasks = [asyncio.create_task(sleeper("late", 120)), asyncio.create_task(sleeper("early", 60))]
+        await asyncio.sleep(0)
+        await clock.advance(90)
+        
+        assert woke == [("early", START + timedelta(seconds=60))]
+        await clock.advance(30)
+        assert woke[1] == ("late", START + timedelta(seconds=120))
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_loop_runs_once_per_simulated_interval(self):
+        clock = VirtualClock(START)
+        ticks = []
+        
+        async def loop():
+            while True:
+                await clock.sleep(60)
+                ticks.append(clock.now())
+        
+        task = asyncio.create_task(loop())
+        await asyncio.sleep(0)
+        await clock.advance(3600)
+        task.cancel()
+        
+        assert len(ticks) == 60
+        assert ticks[-1] == START + timedelta(hours=1)
+
+    @pytest.mark.asyncio
+    async def test_monotonic_time_follows_the_clock(self):
+        clock = VirtualClock(START)
+        
+        await clock.advance(90)
+        
+        assert clock.monotonic() == 90
+
+    @pytest.mark.asyncio
+    async def test_woken_task_runs_its_hand_offs_before_time_moves_on(self):
+        clock = VirtualClock(START)
+        queue = asyncio.Queue()
+        seen = []
+        
+        async def producer():
+            await clock.sleep(60)
+            await queue.put("reminder")
+        
+        async def consumer():
+            seen.append((await queue.get(), clock.now()))
+        
+        tasks = [asyncio.create_task(producer()), asyncio.create_task(consumer())]
+        await drain_ready()
+        await clock.advance(120)
+        
+        # The consumer ran while the clock still read the producer's deadline
+        assert seen == [("reminder", START + timedelta(seconds=60))]
+        await asyncio.gather(*tasks)
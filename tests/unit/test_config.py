@@ -22,7 +22,11 @@ class TestConfig:
         
         expected_calls = [
             "rooms", "users", "homeassistant", "activities", 
-            "confirmation_emojis", "timing", "messages"
+            "confirmation_emojis", "timing", "messages", "intake",
+            "backfill", "tenants", "retention", "export", "members",
+            "participant_reminders", "cluster", "outbox",
+            "circuit_breaker", "recording", "sqlite", "health", "profiling",
+            "sessions"
         ]
         
         assert helper.copy.call_count == len(expected_calls)
@@ -57,4 +61,32 @@ class TestConfig:
         
         messages = config.messages
         assert "confirmation_request" in messages
-        assert "lunch_reminder" in messages
\ No newline at end of file
+        assert "lunch_reminder" in messages
+        
+        assert config.intake["workers"] == 2
+        assert config.backfill["enabled"] is True
+
+    def test_tenants_default_to_single_household(self):
+        config = Config(MagicMock(), MagicMock(), MagicMock())
+        config._data = create_mock_config()
+        
+        assert config.tenants == [{
+            "id": "default",
+            "user_id": "@alex:example.com",
+            "private_room": "!alexroom:example.com",
+            "group_rooms": ["!grouproom:example.com"],
+        }]
+
+    def test_default_household_announces_to_every_group_chat(self):
+        config = Config(MagicMock(), MagicMock(), MagicMock())
+        config._data = create_mock_config()
+        config._data["rooms"]["group_chats"] = ["!family:example.com", "!climbing:example.com"]
+        
+        assert config.tenants[0]["group_rooms"] == ["!family:example.com", "!climbing:example.com"]
+
+    def test_explicit_tenants(self):
+        config = Config(MagicMock(), MagicMock(), MagicMock())
+        config._data = create_mock_config()
+        config._data["tenants"] = [{"id": "bob", "user_id": "@bob:example.com"}]
+        
+        assert [tenant["id"] for tenant in config.tenants] == ["bob"]
\ No newline at end of file
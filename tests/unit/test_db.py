@@ -1,13 +1,19 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from mautrix.util.async_db import Connection, Scheme
+from mautrix.util.async_db import Connection, Database, Scheme
 
 from wallingfordbot.db import (
     upgrade_table,
     create_workflow_session_table,
     create_activity_reaction_table, 
-    create_scheduled_reminder_table
+    create_scheduled_reminder_table,
+    add_activity_reaction_event_id,
+    add_backfill_tracking,
+    add_session_foreign_keys,
+    add_session_tenant,
+    add_tracked_event,
+    create_participation_rollup_table
 )
 
 
@@ -79,6 +85,101 @@ class TestDatabaseMigrations:
         assert "CREATE TABLE scheduled_reminder" in sql
         assert "AUTOINCREMENT" in sql
 
+    @pytest.mark.asyncio
+    async def test_add_activity_reaction_event_id(self):
+        conn = AsyncMock(spec=Connection)
+        
+        await add_activity_reaction_event_id(conn, Scheme.POSTGRES)
+        
+        statements = [call[0][0] for call in conn.execute.call_args_list]
+        assert "ALTER TABLE activity_reaction ADD COLUMN event_id TEXT" in statements
+        assert any("activity_reaction_event_id_idx" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_add_backfill_tracking(self):
+        conn = AsyncMock(spec=Connection)
+        
+        await add_backfill_tracking(conn, Scheme.SQLITE)
+        
+        statements = [call[0][0] for call in conn.execute.call_args_list]
+        assert any("ADD COLUMN confirmation_event_id TEXT" in sql for sql in statements)
+        assert any("CREATE UNIQUE INDEX activity_reaction_event_id_idx" in sql for sql in statements)
+        assert any("CREATE TABLE backfill_checkpoint" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_add_session_foreign_keys_postgres(self):
+        conn = AsyncMock(spec=Connection)
+        
+        await add_session_foreign_keys(conn, Scheme.POSTGRES)
+        
+        statements = [call[0][0] for call in conn.execute.call_args_list]
+        assert sum("ON DELETE CASCADE" in sql for sql in statements) == 2
+        assert any("activity_reaction_session_id_idx" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_session_delete_cascades_on_sqlite(self, tmp_path):
+        db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+        await db.start()
+        try:
+            await db.execute("INSERT INTO workflow_session (id, date) VALUES ('s1', '2024-01-01')")
+            await db.execute(
+                "INSERT INTO activity_reaction (session_id, user_id, activity, emoji, event_id) "
+                "VALUES ('s1', '@bob:example.com', 'lunch', '🍽️', '$r1')"
+            )
+            await db.execute(
+                "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) "
+                "VALUES ('s1', 'lunch', '2024-01-01 12:00:00')"
+            )
+            
+            await db.execute(
+                "INSERT INTO tracked_event (event_id, session_id, room_id, kind) "
+                "VALUES ('$a1', 's1', '!family:example.com', 'announcement')"
+            )
+            
+            await db.execute("DELETE FROM workflow_session WHERE date = '2024-01-01'")
+            
+            assert await db.fetchval("SELECT COUNT(*) FROM activity_reaction") == 0
+            assert await db.fetchval("SELECT COUNT(*) FROM scheduled_reminder") == 0
+            assert await db.fetchval("SELECT COUNT(*) FROM tracked_event") == 0
+        finally:
+            await db.stop()
+
+    @pytest.mark.asyncio
+    async def test_add_session_tenant(self):
+        conn = AsyncMock(spec=Connection)
+        
+        await add_session_tenant(conn, Scheme.POSTGRES)
+        
+        statements = [call[0][0] for call in conn.execute.call_args_list]
+        assert any("ADD COLUMN tenant_id TEXT NOT NULL DEFAULT 'default'" in sql for sql in statements)
+        assert any("(tenant_id, date)" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_add_tracked_event_copies_existing_announcements(self):
+        conn = AsyncMock(spec=Connection)
+        
+        await add_tracked_event(conn, Scheme.SQLITE)
+        
+        statements = [call[0][0] for call in conn.execute.call_args_list]
+        assert any("CREATE TABLE tracked_event" in sql for sql in statements)
+        assert any("ON DELETE CASCADE" in sql for sql in statements)
+        assert any("SELECT group_message_id" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_create_participation_rollup_table_seeds_history(self):
+        conn = AsyncMock(spec=Connection)
+        conn.fetch.side_effect = [
+            [{"tenant_id": "default", "date": "2024-02-07", "user_id": "@bob:example.com",
+              "activity": "lunch"}],
+            [{"tenant_id": "default", "date": "2024-02-01", "activity": "lunch",
+              "participants": '["@bob:example.com"]'}],
+        ]
+        
+        await create_participation_rollup_table(conn, Scheme.SQLITE)
+        
+        rows = conn.executemany.call_args[0][1]
+        assert ("default", "@bob:example.com", "lunch", "month", "2024-02", 2) in rows
+
     def test_upgrade_table_registration(self):
         """Test that all migrations are properly registered."""
-        assert len(upgrade_table.upgrades) == 3
\ No newline at end of file
+        assert len(upgrade_table.upgrades) == 19
\ No newline at end of file
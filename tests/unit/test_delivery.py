@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.types import EventID, RelationType, RoomID, UserID
+
+from wallingfordbot.clock import VirtualClock, drain_ready
+from wallingfordbot.delivery import ParticipantNotifier, RateLimiter
+from wallingfordbot.members import MemberCache
+from wallingfordbot.metrics import Metrics
+
+
+@pytest.fixture
+def notifier():
+    client = MagicMock()
+    client.send_text = AsyncMock()
+    client.send_message = AsyncMock()
+    client.create_room = AsyncMock(side_effect=lambda **kwargs: RoomID(f"!dm-{kwargs['invitees'][0]}"))
+    database = MagicMock()
+    database.fetchval = AsyncMock(return_value=None)
+    database.execute = AsyncMock()
+    members = MemberCache(client, MagicMock())
+    return ParticipantNotifier(client, database, members, Metrics(), MagicMock(), rate=0)
+
+
+class TestRateLimiter:
+
+    @pytest.mark.asyncio
+    async def test_spaces_out_starts(self):
+        clock = VirtualClock(datetime(2024, 1, 1, 9, 0))
+        limiter = RateLimiter(rate=10, clock=clock)
+        started = []
+        
+        async def start():
+            await limiter.wait()
+            started.append(clock.monotonic())
+        
+        tasks = [asyncio.create_task(start()) for _ in range(3)]
+        await drain_ready()
+        assert started == [0]
+        await clock.advance(0.2)
+        await asyncio.gather(*tasks)
+        
+        assert started == pytest.approx([0, 0.1, 0.2])
+
+
+class TestParticipantNotifier:
+
+    @pytest.mark.asyncio
+    async def test_dms_every_participant_concurrently(self, notifier):
+        in_flight = 0
+        peak = 0
+        
+        async def send_text(room_id, text):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+        notifier.client.send_text.side_effect = send_text
+        users = [UserID(f"@friend{i}:example.com") for i in range(12)]
+        
+        delivered = await notifier.notify({user_id: "Lunch at 12:30!" for user_id in users})
+        
+        assert delivered == 12
+        # Bounded by the default concurrency of 5
+        assert peak == 5
+        assert notifier.metrics.get("participant_reminders_sent_total") == 12
+
+    @pytest.mark.asyncio
+    async def test_dm_rooms_are_created_once_and_cached(self, notifier):
+        user_id = UserID("@bob:example.com")
+        
+        rooms = await asyncio.gather(notifier.dm_room(user_id), notifier.dm_room(user_id))
+        await notifier.dm_room(user_id)
+        
+        assert rooms == ["!dm-@bob:example.com"] * 2
+        notifier.client.create_room.assert_called_once()
+        notifier.database.fetchval.assert_called_once()
+        assert "dm_room" in notifier.database.execute.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_known_dm_room_is_loaded_from_database(self, notifier):
+        notifier.database.fetchval.return_value = "!existing:example.com"
+        
+        assert await notifier.dm_room(UserID("@bob:example.com")) == "!existing:example.com"
+        notifier.client.create_room.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_thread_mode_mentions_under_announcement(self, notifier):
+        notifier.mode = "thread"
+        notifier.members.put(UserID("@bob:example.com"), "Bob")
+        
+        await notifier.notify(
+            {UserID("@bob:example.com"): "Lunch at 12:30!"},
+            thread=(RoomID("!grouproom:example.com"), EventID("$announce:example.com")),
+        )
+        
+        room_id, content = notifier.client.send_message.call_args[0]
+        assert room_id == "!grouproom:example.com"
+        assert content.body == "Bob: Lunch at 12:30!"
+        assert content.relates_to.rel_type == RelationType.THREAD
+        assert content.serialize()["m.mentions"] == {"user_ids": ["@bob:example.com"]}
+        notifier.client.create_room.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_failures_are_counted_not_raised(self, notifier):
+        notifier.client.send_text.side_effect = [None, Exception("Forbidden")]
+        
+        delivered = await notifier.notify({
+            UserID("@bob:example.com"): "hi", UserID("@carol:example.com"): "hi"
+        })
+        
+        assert delivered == 1
+        assert notifier.metrics.get("participant_reminders_failed_total") == 1
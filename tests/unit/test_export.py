@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.util.async_db import Database, Scheme
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.export import COLUMNS, HistoryExport, format_csv, format_ndjson
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    for session_id, date, users in [
+        ("s1", "2024-01-01", ["@bob:example.com", "@carol:example.com", "@dave:example.com"]),
+        ("s2", "2024-01-02", []),
+        ("s3", "2024-01-03", ["@bob:example.com"]),
+    ]:
+        await db.execute(
+            "INSERT INTO workflow_session (id, date, confirmed) VALUES ($1, $2, TRUE)",
+            session_id, date
+        )
+        for user_id in users:
+            await db.execute(
+                "INSERT INTO activity_reaction (session_id, user_id, activity, emoji, event_id) "
+                "VALUES ($1, $2, 'lunch', '🍽️', $3)",
+                session_id, user_id, f"${session_id}{user_id}"
+            )
+    await db.execute("INSERT INTO workflow_session (id, tenant_id, date) VALUES ('x1', 'other', '2024-01-01')")
+    yield db
+    await db.stop()
+
+
+async def collect(export, *args):
+    return [chunk async for chunk in export.chunks(*args)]
+
+
+class TestHistoryExport:
+
+    @pytest.mark.asyncio
+    async def test_pages_through_every_row_once(self, database):
+        export = HistoryExport(database, chunk_size=2)
+        
+        chunks = await collect(export, "default", "0001-01-01", "9999-12-31")
+        
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        rows = [row for chunk in chunks for row in chunk]
+        assert [(row["session_id"], row["user_id"]) for row in rows] == [
+            ("s1", "@bob:example.com"), ("s1", "@carol:example.com"), ("s1", "@dave:example.com"),
+            ("s2", None), ("s3", "@bob:example.com"),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_filters_by_date_range(self, database):
+        export = HistoryExport(database, chunk_size=10)
+        
+        chunks = await collect(export, "default", "2024-01-02", "2024-01-03")
+        
+        assert [row["session_id"] for row in chunks[0]] == ["s2", "s3"]
+
+    @pytest.mark.asyncio
+    async def test_postgres_uses_server_side_cursor(self):
+        cursor = MagicMock()
+        cursor.fetch = AsyncMock(side_effect=[[("s1",) + (None,) * 9], []])
+        conn = MagicMock()
+        conn.wrapped.cursor = AsyncMock(return_value=cursor)
+        conn.transaction.return_value.__aenter__ = AsyncMock()
+        conn.transaction.return_value.__aexit__ = AsyncMock(return_value=False)
+        database = MagicMock()
+        database.scheme = Scheme.POSTGRES
+        database.acquire.return_value.__aenter__ = AsyncMock(return_value=conn)
+        database.acquire.return_value.__aexit__ = AsyncMock(return_value=False)
+        
+        chunks = await collect(HistoryExport(database, chunk_size=100), "default", "a", "b")
+        
+        assert chunks == [[dict.fromkeys(COLUMNS) | {"session_id": "s1"}]]
+        cursor.fetch.assert_called_with(100)
+
+    def test_formats(self):
+        row = dict.fromkeys(COLUMNS) | {"session_id": "s1", "confirmed": True}
+        
+        assert json.loads(format_ndjson([row]))["session_id"] == "s1"
+        parsed = list(csv.DictReader(io.StringIO((format_csv([], header=True) + format_csv([row])).decode())))
+        assert parsed[0]["session_id"] == "s1"
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.clock import VirtualClock
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.health import HealthMonitor, isoformat, task_state
+from wallingfordbot.metrics import Metrics
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    await db.execute("INSERT INTO workflow_session (id, date) VALUES ('s1', '2024-01-01')")
+    await db.execute(
+        "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) VALUES ('s1', 'lunch', $1)",
+        NOW
+    )
+    yield db
+    await db.stop()
+
+
+class TestHealthMonitor:
+
+    @pytest.mark.asyncio
+    async def test_probe_caches_database_state(self, database):
+        clock = VirtualClock(NOW)
+        metrics = Metrics()
+        monitor = HealthMonitor(database, metrics, MagicMock(), interval=5, clock=clock)
+        assert not monitor.database_healthy
+        
+        await monitor.probe()
+        
+        assert monitor.database_healthy
+        assert monitor.outbox_pending == 0
+        assert isoformat(monitor.next_reminder).startswith("2024-01-01")
+        assert monitor.database_report()["latency_ms"] >= 0
+        assert metrics.get("db_up") == 1
+        # Without fresh probes the last result stops counting
+        await clock.advance(16)
+        assert not monitor.database_healthy
+
+    @pytest.mark.asyncio
+    async def test_failed_probe(self):
+        database = MagicMock()
+        database.acquire.side_effect = ConnectionError("refused")
+        metrics = Metrics()
+        monitor = HealthMonitor(database, metrics, MagicMock(), clock=VirtualClock(NOW))
+        
+        await monitor.probe()
+        
+        assert not monitor.database_healthy
+        assert monitor.database_report()["error"] == "ConnectionError: refused"
+        assert metrics.get("db_up") == 0
+
+    @pytest.mark.asyncio
+    async def test_heartbeats_go_stale(self):
+        clock = VirtualClock(NOW)
+        monitor = HealthMonitor(MagicMock(), Metrics(), MagicMock(), stale_after=180, clock=clock)
+        assert monitor.is_stalled("reminder")
+        
+        monitor.heartbeat("reminder")
+        await clock.advance(120)
+        assert not monitor.is_stalled("reminder")
+        
+        await clock.advance(120)
+        assert monitor.is_stalled("reminder")
+        assert monitor.heartbeat_age("reminder") == 240
+
+    @pytest.mark.asyncio
+    async def test_task_state(self):
+        async def fail():
+            raise RuntimeError("boom")
+        
+        failed = asyncio.create_task(fail())
+        running = asyncio.create_task(asyncio.sleep(10))
+        await asyncio.sleep(0)
+        
+        assert task_state(None) == "not_started"
+        assert task_state(running) == "running"
+        assert task_state(failed) == "failed"
+        running.cancel()
+        await asyncio.sleep(0)
+        assert task_state(running) == "cancelled"
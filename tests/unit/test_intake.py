@@ -0,0 +1,143 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+
+from wallingfordbot.intake import EventIntake
+from wallingfordbot.metrics import Metrics
+from tests.fixtures.matrix_events import create_mock_reaction_event
+
+
+def make_intake(handler, workers=1, max_size=2, overflow_timeout=0.05, relevant_rooms=None):
+    if relevant_rooms is None:
+        relevant_rooms = {"!grouproom:example.com"}
+    return EventIntake(
+        handler=handler,
+        is_relevant=lambda event: str(event.room_id) in relevant_rooms,
+        metrics=Metrics(),
+        log=MagicMock(),
+        workers=workers,
+        max_size=max_size,
+        overflow_timeout=overflow_timeout,
+    )
+
+
+async def noop(event):
+    pass
+
+
+class TestEventIntake:
+
+    @pytest.mark.asyncio
+    async def test_events_processed_in_order_per_room(self):
+        handled = []
+        
+        async def handler(event):
+            await asyncio.sleep(0)
+            handled.append(event.content.relates_to.key)
+        
+        intake = make_intake(handler, workers=3, max_size=30)
+        intake.start()
+        for emoji in ["1", "2", "3", "4"]:
+            await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com", emoji=emoji))
+        
+        while intake.depth or len(handled) < 4:
+            await asyncio.sleep(0.001)
+        await intake.stop()
+        
+        assert handled == ["1", "2", "3", "4"]
+        assert intake.metrics.get("intake_lag_seconds") == 4
+
+    @pytest.mark.asyncio
+    async def test_full_queue_sheds_irrelevant_events(self):
+        intake = make_intake(noop, max_size=1)
+        
+        assert await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        assert not await intake.submit(create_mock_reaction_event(room_id="!other:example.com"))
+        
+        assert intake.metrics.get("intake_shed_total", reason="irrelevant") == 1
+        assert intake.depth == 1
+
+    @pytest.mark.asyncio
+    async def test_relevant_event_evicts_queued_irrelevant_event(self):
+        intake = make_intake(noop, max_size=1)
+        
+        await intake.submit(create_mock_reaction_event(room_id="!other:example.com"))
+        relevant = create_mock_reaction_event(room_id="!grouproom:example.com")
+        
+        # Both rooms land on the single shard, so the irrelevant event gets evicted
+        assert await intake.submit(relevant)
+        
+        assert intake.metrics.get("intake_shed_total", reason="evicted") == 1
+        assert intake.depth == 1
+
+    @pytest.mark.asyncio
+    async def test_relevant_event_dropped_after_overflow_timeout(self):
+        intake = make_intake(noop, max_size=1, overflow_timeout=0.01)
+        
+        await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        assert not await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        
+        assert intake.metrics.get("intake_shed_total", reason="overflow") == 1
+        intake.log.warning.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_relevant_event_waits_for_space(self):
+        intake = make_intake(noop, max_size=1, overflow_timeout=1)
+        
+        await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        waiter = asyncio.create_task(
+            intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        )
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        
+        intake.start()
+        assert await waiter
+        await intake.stop()
+
+    @pytest.mark.asyncio
+    async def test_waiters_take_freed_space_one_at_a_time(self):
+        release = asyncio.Event()
+        
+        async def handler(event):
+            await release.wait()
+        
+        intake = make_intake(handler, max_size=1, overflow_timeout=1)
+        await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        waiters = [
+            asyncio.create_task(intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com")))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        
+        # The worker takes the first event, freeing one slot for three waiters
+        intake.start()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        
+        assert intake.depth == 1
+        assert sum(waiter.done() for waiter in waiters) == 1
+        await intake.stop()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_handler_errors_do_not_kill_worker(self):
+        handled = []
+        
+        async def handler(event):
+            handled.append(event)
+            if len(handled) == 1:
+                raise Exception("Handler failed")
+        
+        intake = make_intake(handler)
+        intake.start()
+        await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        await intake.submit(create_mock_reaction_event(room_id="!grouproom:example.com"))
+        
+        while len(handled) < 2:
+            await asyncio.sleep(0.001)
+        await intake.stop()
+        
+        intake.log.exception.assert_called_once()
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.leader import LeaderElection
+from wallingfordbot.metrics import Metrics
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+def make_election(database, instance_id, metrics=None):
+    return LeaderElection(
+        database, instance_id, metrics or Metrics(), MagicMock(),
+        on_elected=MagicMock(), on_deposed=MagicMock(), lease_seconds=30,
+    )
+
+
+class TestLeaderElection:
+
+    @pytest.mark.asyncio
+    async def test_only_one_instance_wins(self, database):
+        first = make_election(database, "a")
+        second = make_election(database, "b")
+        
+        won = await asyncio.gather(first.campaign(NOW), second.campaign(NOW))
+        
+        assert sorted(won) == [False, True]
+
+    @pytest.mark.asyncio
+    async def test_leader_renews_and_others_take_over_after_expiry(self, database):
+        first = make_election(database, "a")
+        second = make_election(database, "b")
+        
+        assert await first.campaign(NOW)
+        assert await first.campaign(NOW + timedelta(seconds=20))
+        assert not await second.campaign(NOW + timedelta(seconds=40))
+        assert await second.campaign(NOW + timedelta(seconds=51))
+        assert not await first.campaign(NOW + timedelta(seconds=52))
+
+    @pytest.mark.asyncio
+    async def test_resign_hands_over_immediately(self, database):
+        first = make_election(database, "a")
+        second = make_election(database, "b")
+        await first.campaign(NOW)
+        
+        await first.resign()
+        
+        assert await second.campaign(NOW)
+
+    def test_leadership_changes_fire_callbacks_and_metrics(self, database):
+        metrics = Metrics()
+        election = make_election(database, "a", metrics)
+        
+        election._set_leader(True)
+        election._set_leader(True)
+        election._set_leader(False)
+        
+        election.on_elected.assert_called_once()
+        election.on_deposed.assert_called_once()
+        assert metrics.get("leader") == 0
+        assert metrics.get("leader_changes_total") == 2
+
+    @pytest.mark.asyncio
+    async def test_run_steps_down_when_the_database_fails(self, database):
+        election = make_election(database, "a")
+        election.is_leader = True
+        await database.execute("DROP TABLE leader_lease")
+        
+        with patch('asyncio.sleep', side_effect=asyncio.CancelledError()), \
+             pytest.raises(asyncio.CancelledError):
+            await election.run()
+        
+        election.log.exception.assert_called_once()
+        election.on_deposed.assert_called_once()
+        assert not election.is_leader
@@ -0,0 +1,72 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.types import Member, MemberStateEventContent, Membership, UserID
+
+from wallingfordbot.clock import VirtualClock
+from wallingfordbot.members import MemberCache
+
+
+def member_event(user_id: str, membership: Membership, displayname: str = None):
+    event = MagicMock()
+    event.state_key = user_id
+    event.content = MemberStateEventContent(membership=membership, displayname=displayname)
+    return event
+
+
+class TestMemberCache:
+
+    def test_falls_back_to_localpart(self):
+        cache = MemberCache(MagicMock(), MagicMock())
+        
+        assert cache.name(UserID("@bob:example.com")) == "bob"
+
+    def test_least_recently_used_name_is_evicted(self):
+        cache = MemberCache(MagicMock(), MagicMock(), max_size=2)
+        cache.put(UserID("@bob:example.com"), "Bob")
+        cache.put(UserID("@carol:example.com"), "Carol")
+        cache.get(UserID("@bob:example.com"))
+        
+        cache.put(UserID("@dave:example.com"), "Dave")
+        
+        assert cache.get(UserID("@carol:example.com")) is None
+        assert cache.names([UserID("@bob:example.com"), UserID("@dave:example.com")]) == ["Bob", "Dave"]
+
+    @pytest.mark.asyncio
+    async def test_names_expire(self):
+        clock = VirtualClock(datetime(2024, 1, 1, 9, 0))
+        cache = MemberCache(MagicMock(), MagicMock(), ttl=10, clock=clock)
+        cache.put(UserID("@bob:example.com"), "Bob")
+        
+        await clock.advance(10)
+        assert cache.get(UserID("@bob:example.com")) == "Bob"
+        await clock.advance(1)
+        assert cache.get(UserID("@bob:example.com")) is None
+        assert len(cache) == 0
+
+    def test_member_events_update_names(self):
+        cache = MemberCache(MagicMock(), MagicMock())
+        
+        cache.handle_member_event(member_event("@bob:example.com", Membership.JOIN, "Bob"))
+        assert cache.name(UserID("@bob:example.com")) == "Bob"
+        cache.handle_member_event(member_event("@bob:example.com", Membership.JOIN, "Robert"))
+        assert cache.name(UserID("@bob:example.com")) == "Robert"
+        cache.handle_member_event(member_event("@bob:example.com", Membership.LEAVE))
+        assert cache.get(UserID("@bob:example.com")) is None
+
+    @pytest.mark.asyncio
+    async def test_populate_loads_rooms_in_bulk(self):
+        client = MagicMock()
+        client.get_joined_members = AsyncMock(side_effect=[
+            {UserID("@bob:example.com"): Member(displayname="Bob")},
+            Exception("Not in room"),
+        ])
+        log = MagicMock()
+        cache = MemberCache(client, log)
+        
+        loaded = await cache.populate(["!family:example.com", "!gone:example.com"])
+        
+        assert loaded == 1
+        assert cache.name(UserID("@bob:example.com")) == "Bob"
+        log.warning.assert_called_once()
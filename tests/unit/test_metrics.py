@@ -0,0 +1,39 @@
+from wallingfordbot.metrics import Metrics
+
+
+class TestMetrics:
+
+    def test_counters_accumulate_per_label_set(self):
+        metrics = Metrics()
+        
+        metrics.inc("shed_total", reason="irrelevant")
+        metrics.inc("shed_total", reason="irrelevant")
+        metrics.inc("shed_total", reason="overflow")
+        
+        assert metrics.get("shed_total", reason="irrelevant") == 2
+        assert metrics.get("shed_total", reason="overflow") == 1
+        assert metrics.get("shed_total", reason="evicted") == 0
+
+    def test_gauge_keeps_last_value(self):
+        metrics = Metrics()
+        
+        metrics.set("queue_depth", 5)
+        metrics.set("queue_depth", 3)
+        
+        assert metrics.get("queue_depth") == 3
+
+    def test_render_prometheus_text(self):
+        metrics = Metrics()
+        metrics.inc("events_total")
+        metrics.set("queue_depth", 2)
+        metrics.observe("lag_seconds", 0.5)
+        metrics.observe("lag_seconds", 1.5)
+        
+        text = metrics.render()
+        
+        assert "# TYPE wallingfordbot_events_total counter" in text
+        assert "wallingfordbot_events_total 1.0" in text
+        assert "wallingfordbot_queue_depth 2" in text
+        assert "wallingfordbot_lag_seconds_count 2" in text
+        assert "wallingfordbot_lag_seconds_sum 2.0" in text
+        assert "wallingfordbot_lag_seconds_max 1.5" in text
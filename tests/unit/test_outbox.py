@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.errors import MForbidden
+from mautrix.types import EventID
+from mautrix.util.async_db import Database
+
+from wallingfordbot.breaker import CircuitOpenError
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.metrics import Metrics
+from wallingfordbot.outbox import Outbox
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    await db.execute("INSERT INTO workflow_session (id, date) VALUES ('s1', '2024-01-01')")
+    yield db
+    await db.stop()
+
+
+def make_outbox(database, instance_id="a", **kwargs):
+    client = AsyncMock()
+    client.send_text.return_value = EventID("$sent:example.com")
+    return Outbox(database, client, Metrics(), MagicMock(), instance_id, **kwargs)
+
+
+async def enqueue(outbox, room_id="!room:example.com", body="Hello", **kwargs):
+    async with outbox.database.acquire() as conn, conn.transaction():
+        await outbox.enqueue(conn, room_id, body, session_id="s1", **kwargs)
+
+
+async def status(database):
+    return [
+        (row['status'], row['attempts'])
+        for row in await database.fetch("SELECT status, attempts FROM outbox ORDER BY id")
+    ]
+
+
+class TestOutbox:
+
+    @pytest.mark.asyncio
+    async def test_delivers_and_records_outcome(self, database):
+        on_delivered = AsyncMock()
+        outbox = make_outbox(database, on_delivered=on_delivered)
+        await enqueue(outbox, kind="announcement", reactions=["🍽️"])
+
+        assert await outbox.drain(datetime.now()) == 1
+
+        outbox.client.send_text.assert_awaited_once()
+        txn_id = outbox.client.send_text.call_args.kwargs["txn_id"]
+        assert txn_id.startswith("wallingfordbot-") and txn_id != "wallingfordbot-outbox-1"
+        outbox.client.react.assert_awaited_once()
+        assert await status(database) == [("sent", 0)]
+        assert await database.fetchval("SELECT event_id FROM outbox") == "$sent:example.com"
+        message = on_delivered.call_args[0][1]
+        assert message['kind'] == "announcement"
+        assert outbox.metrics.get("outbox_sent_total", kind="announcement") == 1
+        assert await outbox.drain(datetime.now()) == 0
+
+    @pytest.mark.asyncio
+    async def test_rolled_back_transaction_sends_nothing(self, database):
+        outbox = make_outbox(database)
+
+        with pytest.raises(RuntimeError):
+            async with database.acquire() as conn, conn.transaction():
+                await outbox.enqueue(conn, "!room:example.com", "Hello", session_id="s1")
+                raise RuntimeError("state change failed")
+
+        assert await outbox.drain(datetime.now()) == 0
+
+    @pytest.mark.asyncio
+    async def test_failures_back_off_then_park(self, database):
+        outbox = make_outbox(database, base_delay=10, max_attempts=2)
+        outbox.client.send_text.side_effect = Exception("Homeserver down")
+        await enqueue(outbox)
+
+        await outbox.drain(datetime.now())
+
+        assert await status(database) == [("pending", 1)]
+        # Not retried before the backoff has passed
+        assert await outbox.drain(datetime.now()) == 0
+        assert await outbox.drain(datetime.now() + timedelta(seconds=11)) == 1
+        assert await status(database) == [("parked", 2)]
+        assert await database.fetchval("SELECT last_error FROM outbox") == "Homeserver down"
+        assert outbox.metrics.get("outbox_failures_total", kind="text") == 1
+        assert outbox.metrics.get("outbox_parked_total", kind="text") == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_reuse_a_txn_id_unique_to_the_instance(self, database):
+        outbox = make_outbox(database, txn_prefix="wallingfordbot-office")
+        outbox.client.send_text.side_effect = [Exception("Homeserver down"), EventID("$sent:example.com")]
+        await enqueue(outbox, tenant_id="alex")
+        await enqueue(outbox, room_id="!other:example.com", tenant_id="alex")
+
+        await outbox.drain(datetime.now())
+        await outbox.drain(datetime.now() + timedelta(seconds=10))
+
+        txn_ids = [call.kwargs["txn_id"] for call in outbox.client.send_text.call_args_list]
+        # The failed first message is retried under the ID it was first sent with
+        assert txn_ids[0] == txn_ids[2]
+        assert len(set(txn_ids)) == 2
+        assert all(txn_id.startswith("wallingfordbot-office-alex-") for txn_id in txn_ids)
+
+    @pytest.mark.asyncio
+    async def test_rejected_message_is_parked_at_once(self, database):
+        outbox = make_outbox(database)
+        outbox.client.send_text.side_effect = MForbidden(403, "Not in room")
+        await enqueue(outbox)
+
+        await outbox.drain(datetime.now())
+
+        assert await status(database) == [("parked", 1)]
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_defers_without_using_an_attempt(self, database):
+        outbox = make_outbox(database)
+        outbox.client.send_text.side_effect = CircuitOpenError(20)
+        await enqueue(outbox)
+
+        await outbox.drain(datetime.now())
+
+        assert await status(database) == [("pending", 0)]
+        assert await outbox.drain(datetime.now() + timedelta(seconds=10)) == 0
+        assert await outbox.drain(datetime.now() + timedelta(seconds=21)) == 1
+
+    @pytest.mark.asyncio
+    async def test_reaction_failure_still_counts_as_delivered(self, database):
+        outbox = make_outbox(database)
+        outbox.client.react.side_effect = Exception("React failed")
+        await enqueue(outbox, reactions=["🍽️"])
+
+        await outbox.drain(datetime.now())
+
+        assert await status(database) == [("sent", 0)]
+        outbox.log.exception.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_instances_never_claim_the_same_message(self, database):
+        first = make_outbox(database, "a", batch_size=1)
+        second = make_outbox(database, "b", batch_size=1)
+        await enqueue(first, body="one")
+        await enqueue(first, body="two")
+
+        now = datetime.now()
+        claimed = await asyncio.gather(first.claim(now), second.claim(now))
+
+        assert sorted(row['body'] for rows in claimed for row in rows) == ["one", "two"]
+
+    @pytest.mark.asyncio
+    async def test_messages_to_one_room_keep_their_order(self, database):
+        outbox = make_outbox(database)
+        for body in ["one", "two", "three"]:
+            await enqueue(outbox, body=body)
+        await enqueue(outbox, room_id="!other:example.com", body="elsewhere")
+
+        await outbox.drain(datetime.now())
+
+        sent = [call.kwargs["text"] for call in outbox.client.send_text.call_args_list
+                if call.kwargs["room_id"] == "!room:example.com"]
+        assert sent == ["one", "two", "three"]
@@ -0,0 +1,79 @@
+import asyncio
+import marshal
+import pstats
+import pytest
+import tracemalloc
+from collections import Counter
+
+from wallingfordbot.profiling import Profiler, ProfilerBusy, format_collapsed
+
+
+async def busy_work(seconds):
+    # Blocks the event loop, like a slow handler would
+    await asyncio.sleep(0.01)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        sum(i * i for i in range(1000))
+
+
+class TestProfiler:
+
+    @pytest.mark.asyncio
+    async def test_cpu_profile_loads_into_pstats(self, tmp_path):
+        profiler = Profiler()
+        
+        try:
+            data, _ = await asyncio.gather(profiler.cpu_profile(0.05), busy_work(0.04))
+        except ProfilerBusy:
+            pytest.skip("Another profiler is active, as under coverage")
+        
+        path = tmp_path / "profile.pstats"
+        path.write_bytes(data)
+        stats = pstats.Stats(str(path))
+        assert any(name == "busy_work" for _, _, name in stats.stats)
+        assert not profiler.busy
+
+    @pytest.mark.asyncio
+    async def test_sample_stacks_sees_the_event_loop(self):
+        profiler = Profiler(sample_interval=0.001)
+        
+        collapsed, _ = await asyncio.gather(profiler.sample_stacks(0.05), busy_work(0.04))
+        
+        lines = collapsed.splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert any("busy_work" in line for line in lines)
+
+    @pytest.mark.asyncio
+    async def test_memory_diff_leaves_tracing_as_it_was(self):
+        profiler = Profiler(memory_top=5)
+        kept = []
+        
+        async def allocate():
+            await asyncio.sleep(0.01)
+            kept.extend(bytearray(1024) for _ in range(100))
+        
+        report, _ = await asyncio.gather(profiler.memory_diff(0.05), allocate())
+        
+        assert report.startswith("Traced memory:")
+        assert "test_profiling.py" in report
+        assert not tracemalloc.is_tracing()
+
+    @pytest.mark.asyncio
+    async def test_one_profile_at_a_time(self):
+        profiler = Profiler()
+        
+        running = asyncio.create_task(profiler.memory_diff(0.05))
+        await asyncio.sleep(0)
+        
+        with pytest.raises(ProfilerBusy):
+            await profiler.sample_stacks(0.01)
+        await running
+        assert not profiler.busy
+
+    def test_format_collapsed(self):
+        counts = Counter({"main;handle": 3, "main;idle": 7})
+        
+        assert format_collapsed(counts) == "main;idle 7\nmain;handle 3\n"
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from wallingfordbot.clock import VirtualClock
+from wallingfordbot.recording import EventRecorder, read_recording
+
+AT = datetime(2024, 1, 1, 9, 0)
+
+
+class TestEventRecorder:
+
+    def test_records_round_trip(self, tmp_path):
+        path = str(tmp_path / "recording.ndjson")
+        recorder = EventRecorder(path)
+        
+        recorder.record("webhook", {"tenant": "default"}, AT, 0.0123456789)
+        recorder.record("reaction", {"content": {"m.relates_to": {"key": "🍽️"}}}, AT)
+        
+        records = list(read_recording(path))
+        assert records[0] == {"at": AT, "kind": "webhook", "latency": 0.012346, "data": {"tenant": "default"}}
+        assert records[1]["data"]["content"]["m.relates_to"]["key"] == "🍽️"
+        recorder.close()
+
+    def test_appends_to_an_existing_recording(self, tmp_path):
+        path = str(tmp_path / "recording.ndjson")
+        for _ in range(2):
+            recorder = EventRecorder(path)
+            recorder.record("webhook", {}, AT)
+            recorder.close()
+        
+        assert len(list(read_recording(path))) == 2
+
+    def test_stamps_records_with_its_clock(self, tmp_path):
+        path = str(tmp_path / "recording.ndjson")
+        recorder = EventRecorder(path, VirtualClock(AT))
+        
+        recorder.record("delivered", {"event_id": "$announce:example.com"})
+        recorder.close()
+        
+        assert next(read_recording(path))["at"] == AT
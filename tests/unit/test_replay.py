@@ -0,0 +1,58 @@
+import pytest
+from datetime import date
+from pathlib import Path
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.recording import EventRecorder, read_recording
+from wallingfordbot.replay import Replay, delivered_event_ids, latency_summary
+from wallingfordbot.simulation import DaySimulation, load_config
+
+BASE_CONFIG = str(Path(__file__).parents[2] / "base-config.yaml")
+DAY = date(2024, 3, 6)
+
+
+async def start_database(path):
+    db = Database.create(f"sqlite:{path}", upgrade_table=upgrade_table)
+    await db.start()
+    return db
+
+
+class TestReplay:
+
+    @pytest.mark.asyncio
+    async def test_replays_a_recorded_day(self, tmp_path):
+        # Record a simulated day as if it were production
+        database = await start_database(tmp_path / "original.db")
+        original = await DaySimulation.create(load_config(BASE_CONFIG), database, DAY)
+        original.bot.recorder = EventRecorder(str(tmp_path / "recording.ndjson"), original.clock)
+        await original.run(reactions={"@bob:example.com": ["lunch", "picnic_dinner"]})
+        original.bot.recorder.close()
+        await database.stop()
+        
+        records = list(read_recording(str(tmp_path / "recording.ndjson")))
+        database = await start_database(tmp_path / "replay.db")
+        replay = Replay(
+            await DaySimulation.create(
+                load_config(BASE_CONFIG), database, DAY, event_ids=delivered_event_ids(records)
+            ),
+            speed=0,
+        )
+        report = await replay.run(records)
+        await database.stop()
+        
+        # Arrival, Alex's choice and thumbs up, then Bob's two reactions
+        assert report["events"] == 5
+        assert report["latency"]["reaction"]["replay"]["count"] == 4
+        assert report["replay_throughput"] > 0
+        # The recorded event IDs were handed out again, so Bob's reactions were accepted
+        replayed = [message.text for message in replay.simulation.client.sent]
+        assert replayed == [message.text for message in original.client.sent[:len(replayed)]]
+        assert "Great! Alex will join for lunch at 12:30." in replayed
+
+    def test_latency_summary(self):
+        summary = latency_summary([0.4, 0.1, 0.3, 0.2])
+        
+        assert summary == {"count": 4, "p50": 0.3, "p95": 0.4, "max": 0.4}
+        assert latency_summary([])["count"] == 0
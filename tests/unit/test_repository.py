@@ -0,0 +1,120 @@
+import dataclasses
+import pytest
+from datetime import datetime
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.repository import (
+    IN_CHUNK_SIZE, Reaction, ReactionRepository, Reminder, ReminderRepository, Session, SessionRepository,
+    TrackedEvent, TrackedEventRepository
+)
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    async with db.acquire() as conn:
+        sessions = SessionRepository(db)
+        await sessions.insert(conn, Session("s1", "default", "2024-01-01"))
+        await sessions.insert(conn, Session("s2", "default", "2024-01-02"))
+    yield db
+    await db.stop()
+
+
+class TestRepository:
+
+    @pytest.mark.asyncio
+    async def test_sessions_round_trip(self, database):
+        sessions = SessionRepository(database)
+        
+        await sessions.set_choice("s1", "🏠", confirmed=True)
+        async with database.acquire() as conn:
+            assert await sessions.set_group_message(conn, "s1", "$first")
+            assert not await sessions.set_group_message(conn, "s1", "$second")
+            assert await sessions.mark_reminder_sent(conn, "s1", "lunch")
+            assert not await sessions.mark_reminder_sent(conn, "s1", "lunch")
+        
+        session = await sessions.get("s1")
+        assert session == Session(
+            "s1", "default", "2024-01-01", "🏠", True, "$first", None, True, False
+        )
+        assert await sessions.for_date("default", "2024-01-02") == Session("s2", "default", "2024-01-02")
+        assert await sessions.get("missing") is None
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            session.confirmed = False
+
+    @pytest.mark.asyncio
+    async def test_get_many_is_one_query(self, database):
+        sessions = SessionRepository(database)
+        
+        found = await sessions.get_many(["s2", "s1", "s2", "missing"])
+        
+        assert sorted(found) == ["s1", "s2"]
+        assert await sessions.get_many([]) == {}
+        # More IDs than fit in one chunk take another query with the same text
+        found = await sessions.get_many(["s1"] + [f"missing{n}" for n in range(IN_CHUNK_SIZE)] + ["s2"])
+        assert sorted(found) == ["s1", "s2"]
+
+    @pytest.mark.asyncio
+    async def test_insert_many_reactions(self, database):
+        reactions = ReactionRepository(database)
+        rows = [
+            Reaction("s1", "@bob:example.com", "lunch", "$r1", "🍽️"),
+            Reaction("s1", "@carol:example.com", "pub_dinner", "$r2", "🍺"),
+        ]
+        
+        async with database.acquire() as conn:
+            await reactions.insert_many(conn, rows)
+            # Reactions are unique by event ID
+            assert not await reactions.insert(conn, rows[0])
+            assert await reactions.existing(conn, ["$r1", "$r3"]) == {"$r1"}
+            assert await reactions.by_event(conn, "$r2") == (
+                await reactions.for_date(conn, "default", "2024-01-01")
+            )[1]
+            await reactions.delete(conn, "$r1")
+        
+        assert await reactions.for_session("s1") == [
+            Reaction("s1", "@carol:example.com", "pub_dinner", "$r2")
+        ]
+
+    @pytest.mark.asyncio
+    async def test_reaction_threads_follow_the_announcement_reacted_to(self, database):
+        reactions = ReactionRepository(database)
+        tracked_events = TrackedEventRepository(database)
+        
+        async with database.acquire() as conn:
+            await tracked_events.insert(conn, TrackedEvent("$a", "s1", "!climbing:example.com"), kind="announcement")
+            await tracked_events.insert(conn, TrackedEvent("$b", "s1", "!family:example.com"), kind="announcement")
+            await reactions.insert_many(conn, [
+                Reaction("s1", "@bob:example.com", "lunch", "$r1", "🍽️", "$a"),
+                Reaction("s1", "@carol:example.com", "lunch", "$r2", "🍽️", "$b"),
+                Reaction("s1", "@carol:example.com", "pub_dinner", "$r3", "🍺", "$a"),
+                Reaction("s1", "@dave:example.com", "lunch", "$r4", "🍽️"),
+            ])
+        
+        assert await reactions.threads("s1") == {
+            "@bob:example.com": ("!climbing:example.com", "$a"),
+            "@carol:example.com": ("!family:example.com", "$b"),
+        }
+
+    @pytest.mark.asyncio
+    async def test_reminders_and_tracked_events(self, database):
+        reminders = ReminderRepository(database)
+        tracked_events = TrackedEventRepository(database)
+        
+        await reminders.insert_many([
+            Reminder("s1", "lunch", datetime(2024, 1, 1, 12, 0)),
+            Reminder("s1", "evening", datetime(2024, 1, 1, 17, 0)),
+        ])
+        async with database.acquire() as conn:
+            await tracked_events.insert(conn, TrackedEvent("$a", "s2", "!family:example.com"), kind="announcement")
+        
+        assert [r.reminder_type for r in await reminders.pending()] == ["lunch", "evening"]
+        assert await tracked_events.announcements_since("2024-01-02") == [
+            TrackedEvent("$a", "s2", "!family:example.com")
+        ]
+        assert (await tracked_events.session_for("$a", "announcement")).id == "s2"
+        assert await tracked_events.session_for("$a", "confirmation") is None
+        assert await tracked_events.session_for("$missing", "announcement") is None
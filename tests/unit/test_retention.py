@@ -0,0 +1,126 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from mautrix.util.async_db import Database, Scheme
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.metrics import Metrics
+from wallingfordbot.retention import RetentionJob
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+async def add_session(db: Database, session_id: str, date: str, reactions=()) -> None:
+    await db.execute(
+        "INSERT INTO workflow_session (id, date, confirmation_event_id) VALUES ($1, $2, $3)",
+        session_id, date, f"$confirm-{session_id}"
+    )
+    await db.execute(
+        "INSERT INTO backfill_checkpoint (event_id, last_ts) VALUES ($1, 1000)",
+        f"$confirm-{session_id}"
+    )
+    for i, (user_id, activity) in enumerate(reactions):
+        await db.execute(
+            "INSERT INTO activity_reaction (session_id, user_id, activity, emoji, event_id) "
+            "VALUES ($1, $2, $3, '🍽️', $4)",
+            session_id, user_id, activity, f"${session_id}-{i}"
+        )
+
+
+class TestRetentionJob:
+
+    @pytest.mark.asyncio
+    async def test_archives_old_sessions_in_batches(self, database):
+        await add_session(database, "old1", days_ago(40), [
+            ("@bob:example.com", "lunch"), ("@carol:example.com", "lunch"),
+        ])
+        await add_session(database, "old2", days_ago(35), [("@bob:example.com", "pub_dinner")])
+        await add_session(database, "old3", days_ago(31))
+        await add_session(database, "recent", days_ago(1), [("@bob:example.com", "lunch")])
+        metrics = Metrics()
+        job = RetentionJob(database, metrics, MagicMock(), days=30, batch_size=2, pause=0)
+        
+        archived = await job.run()
+        
+        assert archived == 3
+        assert metrics.get("retention_sessions_archived_total") == 3
+        assert await database.fetchval("SELECT COUNT(*) FROM workflow_session") == 1
+        assert await database.fetchval("SELECT COUNT(*) FROM activity_reaction") == 1
+        assert await database.fetchval("SELECT COUNT(*) FROM backfill_checkpoint") == 1
+        lunch = await database.fetchrow(
+            "SELECT * FROM daily_summary WHERE date = $1 AND activity = 'lunch'", days_ago(40)
+        )
+        assert lunch['reaction_count'] == 2
+        assert lunch['participant_count'] == 2
+        assert json.loads(lunch['participants']) == ["@bob:example.com", "@carol:example.com"]
+        assert await database.fetchval("SELECT COUNT(*) FROM daily_summary") == 2
+
+    @pytest.mark.asyncio
+    async def test_nothing_to_archive(self, database):
+        await add_session(database, "recent", days_ago(0))
+        job = RetentionJob(database, Metrics(), MagicMock(), days=30)
+        
+        assert await job.run() == 0
+        assert await database.fetchval("SELECT COUNT(*) FROM workflow_session") == 1
+
+    @pytest.mark.asyncio
+    async def test_vacuums_only_when_enough_pages_are_free(self, database):
+        for n in range(40):
+            await add_session(database, f"old{n}", days_ago(40 + n), [
+                (f"@{'friend' * 50}{i}:example.com", "lunch") for i in range(20)
+            ])
+        await add_session(database, "recent", days_ago(1))
+        
+        kept = RetentionJob(database, Metrics(), MagicMock(), days=30, pause=0, vacuum_ratio=1)
+        assert await kept.run() == 40
+        assert await database.fetchval("PRAGMA freelist_count") > 0
+        
+        vacuumed = RetentionJob(database, Metrics(), MagicMock(), days=30, pause=0, vacuum_ratio=0.1)
+        await vacuumed._compact()
+        assert await database.fetchval("PRAGMA freelist_count") == 0
+
+    @pytest.mark.asyncio
+    async def test_analyzes_only_its_own_tables(self):
+        database = MagicMock()
+        database.scheme = Scheme.POSTGRES
+        database.execute = AsyncMock()
+        
+        await RetentionJob(database, Metrics(), MagicMock())._compact()
+        
+        statements = [call[0][0] for call in database.execute.call_args_list]
+        assert "ANALYZE workflow_session" in statements
+        assert all(statement.startswith("ANALYZE ") for statement in statements)
+
+    def test_keeps_yesterday_for_runtime_state(self):
+        job = RetentionJob(MagicMock(), Metrics(), MagicMock(), days=0)
+        
+        assert job.days == 2
+
+    def test_never_archives_sessions_that_accept_reactions(self):
+        job = RetentionJob(MagicMock(), Metrics(), MagicMock(), days=3, reaction_window_days=7)
+        
+        assert job.days == 8
+
+    def test_summarise_groups_by_tenant_date_and_activity(self):
+        rows = RetentionJob.summarise([
+            {"tenant_id": "a", "date": "2024-01-01", "activity": "lunch", "user_id": "@bob"},
+            {"tenant_id": "a", "date": "2024-01-01", "activity": "lunch", "user_id": "@bob"},
+            {"tenant_id": "b", "date": "2024-01-01", "activity": "lunch", "user_id": "@bob"},
+        ])
+        
+        assert sorted(rows) == [
+            ("a", "2024-01-01", "lunch", 2, 1, '["@bob"]'),
+            ("b", "2024-01-01", "lunch", 1, 1, '["@bob"]'),
+        ]
@@ -0,0 +1,83 @@
+import pytest
+from datetime import datetime
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.clock import VirtualClock
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.repository import Session, SessionRepository
+from wallingfordbot.session_log import (
+    ANNOUNCED, CHOICE_MADE, CONFIRMATION_REQUESTED, CONFIRMED, REACTION_ADDED, REACTION_REMOVED,
+    REMINDER_SENT, WEBHOOK_RECEIVED, SessionEvent, SessionLog, fold
+)
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    async with db.acquire() as conn:
+        await SessionRepository(db).insert(conn, Session("s1", "default", "2024-01-03"))
+    yield db
+    await db.stop()
+
+
+@pytest.fixture
+def session_log(database):
+    return SessionLog(database, clock=VirtualClock(datetime(2024, 1, 3, 9, 0)))
+
+
+async def append_workflow(session_log):
+    async with session_log.database.acquire() as conn:
+        await session_log.append(conn, "s1", WEBHOOK_RECEIVED, tenant_id="default", date="2024-01-03")
+        await session_log.append(conn, "s1", CONFIRMATION_REQUESTED, event_id="$request")
+        await session_log.append(conn, "s1", CHOICE_MADE, choice="🏢")
+        await session_log.append(conn, "s1", CHOICE_MADE, choice="🏠")
+        await session_log.append(conn, "s1", CONFIRMED, choice="🏠")
+        await session_log.append(conn, "s1", ANNOUNCED, event_id="$family", room_id="!family")
+        await session_log.append(conn, "s1", ANNOUNCED, event_id="$climbing", room_id="!climbing")
+        await session_log.append_many(conn, [
+            ("s1", REACTION_ADDED, {"user_id": "@bob", "activity": "lunch", "event_id": "$r1"}),
+            ("s1", REACTION_ADDED, {"user_id": "@eve", "activity": "lunch", "event_id": "$r2"}),
+        ])
+        await session_log.append(conn, "s1", REACTION_REMOVED, event_id="$r1")
+        await session_log.append(conn, "s1", REMINDER_SENT, reminder_type="lunch")
+
+
+class TestSessionLog:
+
+    @pytest.mark.asyncio
+    async def test_load_folds_the_log(self, session_log):
+        await append_workflow(session_log)
+        
+        view = await session_log.load("s1")
+        
+        assert view.session == Session(
+            "s1", "default", "2024-01-03", "🏠", True, "$family", "$request", True, False
+        )
+        assert view.reactions == {"lunch": {"@eve": "$r2"}}
+        assert view.announcements == {"$family": "!family", "$climbing": "!climbing"}
+        assert view.last_event_id == 11
+        assert await session_log.load("missing") is None
+
+    @pytest.mark.asyncio
+    async def test_events_keep_history(self, session_log):
+        await append_workflow(session_log)
+        
+        events = await session_log.events("s1")
+        
+        assert [e.data["choice"] for e in events if e.kind == CHOICE_MADE] == ["🏢", "🏠"]
+        assert events[0].data == {"tenant_id": "default", "date": "2024-01-03"}
+
+    def test_fold_skips_events_before_the_session_started(self):
+        events = [
+            SessionEvent(1, "s1", CHOICE_MADE, {"choice": "🏢"}),
+            SessionEvent(2, "s1", WEBHOOK_RECEIVED, {"tenant_id": "default", "date": "2024-01-03"}),
+            SessionEvent(3, "s1", CHOICE_MADE, {"choice": "🏠"}),
+        ]
+        
+        view = fold(None, events)
+        
+        assert view.session.alex_confirmation == "🏠"
+        assert view.last_event_id == 3
+        assert fold(None, events[:1]) is None
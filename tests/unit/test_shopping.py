@@ -0,0 +1,26 @@
+from wallingfordbot.shopping import shopping_list
+
+ACTIVITIES = {
+    "picnic_dinner": {"shopping": [
+        {"item": "sandwiches", "per_head": 1, "fixed": 1},
+        {"item": "crisps", "unit": "bags", "per_head": 0.5},
+    ]},
+    "pub_dinner": {},
+    "evening_walk": {"shopping": [{"item": "crisps", "unit": "bags", "fixed": 1, "per_head": 0}]},
+}
+
+
+class TestShoppingList:
+
+    def test_quantities_follow_headcounts(self):
+        assert shopping_list(ACTIVITIES, {"picnic_dinner": 3, "pub_dinner": 2}) == [
+            "4 sandwiches", "2 bags crisps"
+        ]
+
+    def test_items_shared_between_activities_are_added(self):
+        assert shopping_list(ACTIVITIES, {"picnic_dinner": 1, "evening_walk": 1}) == [
+            "2 sandwiches", "2 bags crisps"
+        ]
+
+    def test_activities_nobody_chose_need_nothing(self):
+        assert shopping_list(ACTIVITIES, {"picnic_dinner": 0, "unknown": 4}) == []
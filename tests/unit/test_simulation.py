@@ -0,0 +1,54 @@
+import time
+import pytest
+from datetime import date
+from pathlib import Path
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.simulation import DaySimulation, load_config
+
+BASE_CONFIG = Path(__file__).parents[2] / "base-config.yaml"
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+class TestDaySimulation:
+
+    @pytest.mark.asyncio
+    async def test_full_day_runs_in_well_under_a_second(self, database):
+        config = load_config(str(BASE_CONFIG))
+        started = time.monotonic()
+        
+        simulation = await DaySimulation.create(config, database, date(2024, 3, 6))
+        messages = await simulation.run(reactions={
+            "@bob:example.com": ["lunch", "picnic_dinner"],
+            "@carol:example.com": ["picnic_dinner"],
+        })
+        
+        assert time.monotonic() - started < 1
+        timeline = [(f"{message.time:%H:%M}", message.text.split("\n")[0]) for message in messages]
+        assert timeline[0][0] == "09:00"
+        assert timeline[1][0] == "09:01"
+        assert timeline[1][1].startswith("Alex is here and free for activities!")
+        assert ("12:00", "Don't forget about lunch at 12:30!") in timeline
+        lunch = next(message for message in messages if message.time.hour == 12)
+        assert lunch.text.endswith("Coming: bob")
+        evening = messages[-1]
+        assert f"{evening.time:%H:%M}" == "17:00"
+        assert evening.text.endswith("Shopping list:\n- 3 sandwiches\n- 1 bags crisps")
+
+    @pytest.mark.asyncio
+    async def test_going_home_sends_no_announcement_or_reminders(self, database):
+        config = load_config(str(BASE_CONFIG))
+        
+        simulation = await DaySimulation.create(config, database, date(2024, 3, 6))
+        messages = await simulation.run(confirmation="🚗", reactions={"@bob:example.com": ["lunch"]})
+        
+        assert len(messages) == 1
@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import MagicMock
+
+from mautrix.util.async_db import Database, Scheme
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.sqlite import apply_profile, profile_pragmas, reaction_storm
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+class TestSQLiteProfile:
+
+    @pytest.mark.asyncio
+    async def test_mautrix_defaults_already_cover_the_journal(self, database):
+        assert await database.fetchval("PRAGMA journal_mode") == "wal"
+        assert await database.fetchval("PRAGMA synchronous") == 1
+        assert await database.fetchval("PRAGMA busy_timeout") == 5000
+
+    @pytest.mark.asyncio
+    async def test_applies_profile_to_the_plugin_connection(self, database):
+        effective = await apply_profile(database, MagicMock(), cache_mb=8, mmap_mb=0)
+        
+        assert effective == {"cache_size": -8192, "temp_store": 2, "mmap_size": 0}
+        # Like maubot's plugin databases, this one has a single connection
+        assert await database.fetchval("PRAGMA cache_size") == -8192
+
+    @pytest.mark.asyncio
+    async def test_init_commands_profile_every_connection(self, tmp_path):
+        database = Database.create(
+            f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table,
+            db_args={"min_size": 2, "init_commands": profile_pragmas(cache_mb=8)},
+        )
+        await database.start()
+        try:
+            async with database.acquire_direct() as first, database.acquire_direct() as second:
+                for conn in (first, second):
+                    assert await conn.fetchval("PRAGMA cache_size") == -8192
+                    # mautrix still adds its own pragmas alongside
+                    assert await conn.fetchval("PRAGMA journal_mode") == "wal"
+        finally:
+            await database.stop()
+
+    @pytest.mark.asyncio
+    async def test_leaves_postgres_untouched(self):
+        database = MagicMock()
+        database.scheme = Scheme.POSTGRES
+        
+        assert await apply_profile(database, MagicMock()) == {}
+        database.acquire.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reaction_storm_writes_every_reaction(self, database):
+        await apply_profile(database, MagicMock())
+        
+        assert await reaction_storm(database, 20) > 0
+        assert await database.fetchval("SELECT COUNT(*) FROM activity_reaction") == 20
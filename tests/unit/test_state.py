@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from wallingfordbot.repository import Reaction, TrackedEvent
+from wallingfordbot.state import RuntimeState
+from tests.fixtures.matrix_events import create_mock_session
+
+
+class TestRuntimeState:
+
+    def test_not_ready_until_loaded(self):
+        state = RuntimeState()
+        assert not state.ready
+        
+        state.load([], [], [])
+        
+        assert state.ready
+
+    def test_session_lookup_and_update(self):
+        state = RuntimeState()
+        state.load([create_mock_session(session_id="s1", date="2024-01-01")], [], [])
+        
+        state.update_session("s1", group_message_id="$announce:example.com", confirmed=True)
+        
+        assert state.session_for_date("default", "2024-01-01").confirmed
+        assert state.tracked_events["$announce:example.com"] == "s1"
+        assert state.session_for_date("default", "2024-01-02") is None
+        assert state.session_for_date("other", "2024-01-01") is None
+
+    def test_reaction_aggregates_follow_redactions(self):
+        state = RuntimeState()
+        state.add_reaction("s1", "@bob:example.com", "lunch", "$r1")
+        state.add_reaction("s1", "@carol:example.com", "lunch", "$r2")
+        
+        state.remove_reaction("$r1")
+        state.remove_reaction("$unknown")
+        
+        assert state.participants("s1", "lunch") == ["@carol:example.com"]
+        assert state.activity_participants("s1") == {"lunch": ["@carol:example.com"]}
+        assert state.reaction_rows("s1") == [Reaction("s1", "@carol:example.com", "lunch", "$r2")]
+
+    def test_prune_drops_old_sessions_and_their_state(self):
+        state = RuntimeState()
+        state.load([
+            create_mock_session(session_id="old", date="2024-01-01",
+                                group_message_id="$old"),
+            create_mock_session(session_id="new", date="2024-01-03"),
+        ], [], [])
+        state.add_reaction("old", "@bob:example.com", "lunch", "$r1")
+        state.add_reminder("old", "lunch", datetime(2024, 1, 1, 12, 0))
+        
+        state.prune("2024-01-02")
+        
+        assert state.get_session("old") is None
+        assert state.get_session("new") is not None
+        assert "$old" not in state.tracked_events
+        assert "$r1" not in state.reaction_index
+        assert state.next_reminder_time() is None
+
+    def test_drop_sessions_for_date(self):
+        state = RuntimeState()
+        state.load([create_mock_session(session_id="s1", date="2024-01-01")], [], [])
+        
+        state.drop_sessions_for_date("default", "2024-01-01")
+        
+        assert state.session_for_date("default", "2024-01-01") is None
+
+    def test_load_tracks_every_announcement(self):
+        state = RuntimeState()
+        state.load(
+            [create_mock_session(session_id="s1", group_message_id="$family")], [], [],
+            [TrackedEvent("$family", "s1"), TrackedEvent("$climbing", "s1")]
+        )
+        
+        assert state.tracked_events == {"$family": "s1", "$climbing": "s1"}
+        
+        state.prune("9999-01-01")
+        
+        assert state.tracked_events == {}
+
+    def test_update_replaces_the_session(self):
+        state = RuntimeState()
+        state.load([create_mock_session(session_id="s1")], [], [])
+        before = state.get_session("s1")
+        
+        state.update_session("s1", alex_confirmation="🏠")
+        
+        assert before.alex_confirmation is None
+        assert state.get_session("s1").alex_confirmation == "🏠"
@@ -0,0 +1,88 @@
+import pytest
+
+from mautrix.util.async_db import Database
+
+from wallingfordbot.db import upgrade_table
+from wallingfordbot.stats import ParticipationStats, buckets, rollup_rows
+
+
+@pytest.fixture
+async def database(tmp_path):
+    db = Database.create(f"sqlite:{tmp_path}/test.db", upgrade_table=upgrade_table)
+    await db.start()
+    yield db
+    await db.stop()
+
+
+class TestParticipationStats:
+
+    def test_buckets(self):
+        # 2024-12-30 belongs to the first ISO week of 2025
+        assert buckets("2024-12-30") == [("week", "2025-W01"), ("month", "2024-12")]
+
+    def test_rollup_rows_net_out_changes(self):
+        rows = rollup_rows([
+            ("default", "@bob", "lunch", "2024-01-03", 1),
+            ("default", "@bob", "lunch", "2024-01-04", 1),
+            ("default", "@bob", "lunch", "2024-01-04", -1),
+        ])
+        
+        assert sorted(rows) == [
+            ("default", "@bob", "lunch", "month", "2024-01", 1),
+            ("default", "@bob", "lunch", "week", "2024-W01", 1),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_record_and_summarise(self, database):
+        stats = ParticipationStats(database)
+        async with database.acquire() as conn:
+            await stats.record(conn, [
+                ("default", "@bob:example.com", "lunch", "2024-01-03", 1),
+                ("default", "@bob:example.com", "lunch", "2024-02-07", 1),
+                ("default", "@carol:example.com", "pub_dinner", "2024-02-07", 1),
+                ("other", "@dave:example.com", "lunch", "2024-02-07", 1),
+            ])
+            await stats.record(conn, [("default", "@carol:example.com", "pub_dinner", "2024-02-07", -1)])
+        
+        summary = await stats.summary("default")
+        
+        assert summary["friends"] == {"@bob:example.com": {"lunch": 2}}
+        assert summary["monthly"] == {"2024-01": {"lunch": 1}, "2024-02": {"lunch": 1}}
+        assert list(summary["weekly"]) == ["2024-W01", "2024-W06"]
+
+    @pytest.mark.asyncio
+    async def test_snapshot_is_cached_until_an_update(self, database):
+        stats = ParticipationStats(database)
+        
+        etag, body = await stats.snapshot("default")
+        assert await stats.snapshot("default") == (etag, body)
+        
+        async with database.acquire() as conn, conn.transaction():
+            await stats.record(conn, [("default", "@bob:example.com", "lunch", "2024-01-03", 1)])
+        new_etag, new_body = await stats.snapshot("default")
+        
+        assert new_etag != etag
+        assert "@bob:example.com" in new_body
+        # Other households keep their ETag
+        assert await stats.etag("other") == '"other-0"'
+
+    @pytest.mark.asyncio
+    async def test_instances_agree_on_the_etag(self, database):
+        first, second = ParticipationStats(database), ParticipationStats(database)
+        
+        async with database.acquire() as conn, conn.transaction():
+            await first.record(conn, [("default", "@bob:example.com", "lunch", "2024-01-03", 1)])
+        
+        assert await second.etag("default") == await first.etag("default") == '"default-1"'
+        assert (await second.snapshot("default"))[1] == (await first.snapshot("default"))[1]
+
+    @pytest.mark.asyncio
+    async def test_rolled_back_update_keeps_the_etag(self, database):
+        stats = ParticipationStats(database)
+        
+        with pytest.raises(RuntimeError):
+            async with database.acquire() as conn, conn.transaction():
+                await stats.record(conn, [("default", "@bob:example.com", "lunch", "2024-01-03", 1)])
+                raise RuntimeError("reaction insert failed")
+        
+        assert await stats.etag("default") == '"default-0"'
@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock
+
+from mautrix.types import RoomID
+
+from wallingfordbot.tenants import Tenant, TenantRouter
+from tests.fixtures.config import create_mock_config
+
+
+def make_tenant(tenant_id, private_room, group_rooms, **extra):
+    return Tenant.from_dict({
+        "id": tenant_id,
+        "user_id": f"@{tenant_id}:example.com",
+        "private_room": private_room,
+        "group_rooms": group_rooms,
+        **extra,
+    }, create_mock_config()["activities"])
+
+
+class TestTenant:
+
+    def test_from_dict_defaults(self):
+        tenant = make_tenant("alex", "!private:example.com", ["!group:example.com"])
+        
+        assert tenant.name == "Alex"
+        assert tenant.group_room == RoomID("!group:example.com")
+        assert tenant.rooms == (RoomID("!private:example.com"), RoomID("!group:example.com"))
+        assert tenant.activity_for_emoji("🍺") == "pub_dinner"
+        assert tenant.activity_for_emoji("🌮") is None
+
+    def test_activities_override(self):
+        tenant = make_tenant(
+            "bob", "!private:example.com", ["!group:example.com"],
+            name="Bob", activities={"lunch": {"emoji": "🥗", "text": "salad"}}
+        )
+        
+        assert tenant.name == "Bob"
+        assert tenant.activity_for_emoji("🥗") == "lunch"
+        assert tenant.activity_for_emoji("🍽️") is None
+
+
+class TestTenantRouter:
+
+    def test_routes_rooms_to_tenants(self):
+        alex = make_tenant("alex", "!a:example.com", ["!ag1:example.com", "!ag2:example.com"])
+        bob = make_tenant("bob", "!b:example.com", ["!bg:example.com"])
+        router = TenantRouter([alex, bob])
+        
+        assert router.for_room(RoomID("!ag2:example.com")) is alex
+        assert router.for_room(RoomID("!b:example.com")) is bob
+        assert router.for_room(RoomID("!unknown:example.com")) is None
+        assert router.get() is alex
+        assert router.get("bob") is bob
+        assert router.get("nobody") is None
+        assert len(router) == 2
+        assert len(router.room_ids) == 5
+
+    def test_shared_room_goes_to_first_tenant(self):
+        log = MagicMock()
+        alex = make_tenant("alex", "!a:example.com", ["!shared:example.com"])
+        bob = make_tenant("bob", "!b:example.com", ["!shared:example.com"])
+        
+        router = TenantRouter([alex, bob], log=log)
+        
+        assert router.for_room(RoomID("!shared:example.com")) is alex
+        log.warning.assert_called_once()
+
+    def test_from_config(self):
+        config = MagicMock()
+        config.activities = create_mock_config()["activities"]
+        config.tenants = [{
+            "id": "default",
+            "user_id": "@alex:example.com",
+            "private_room": "!alexroom:example.com",
+            "group_rooms": ["!grouproom:example.com"],
+        }]
+        
+        router = TenantRouter.from_config(config)
+        
+        assert router.default.id == "default"
+        assert router.default.activities is config.activities
@@ -0,0 +1,72 @@
+from typing import Dict, List, Optional
+
+from mautrix.api import Method, Path
+from mautrix.client import Client
+from mautrix.types import EventType, ReactionEvent, RelationType
+from mautrix.util.async_db import Database
+from mautrix.util.logging import TraceLogger
+
+from .repository import fetch_in
+
+
+class ReactionBackfill:
+    """Fetches reactions that were sent to tracked events while the bot was offline.
+
+    Relations are paged newest-first and paging stops at the checkpoint, which is the
+    timestamp of the newest reaction seen in a previous run, so a restart normally
+    costs a single request per tracked event.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        database: Database,
+        log: TraceLogger,
+        page_size: int = 50,
+    ) -> None:
+        self.client = client
+        self.database = database
+        self.log = log
+        self.page_size = page_size
+
+    async def load_checkpoints(self, event_ids: List[str]) -> Dict[str, int]:
+        rows = await fetch_in(
+            self.database, "SELECT event_id, last_ts FROM backfill_checkpoint WHERE event_id {}",
+            event_ids
+        )
+        return {row['event_id']: row['last_ts'] for row in rows}
+
+    async def save_checkpoint(self, event_id: str, last_ts: int) -> None:
+        await self.database.execute(
+            "INSERT INTO backfill_checkpoint (event_id, last_ts) VALUES ($1, $2) "
+            "ON CONFLICT (event_id) DO UPDATE SET last_ts = excluded.last_ts",
+            event_id, last_ts
+        )
+
+    async def fetch_reactions(
+        self, room_id: str, event_id: str, since_ts: int = 0
+    ) -> List[ReactionEvent]:
+        path = Path.v1.rooms[room_id].relations[event_id][RelationType.ANNOTATION][
+            EventType.REACTION
+        ]
+        reactions: List[ReactionEvent] = []
+        next_batch: Optional[str] = None
+        while True:
+            query = {"limit": str(self.page_size), "dir": "b"}
+            if next_batch:
+                query["from"] = next_batch
+            resp = await self.client.api.request(Method.GET, path, query_params=query)
+            reached_checkpoint = False
+            for raw in resp.get("chunk", []):
+                if raw.get("origin_server_ts", 0) <= since_ts:
+                    reached_checkpoint = True
+                    break
+                raw.setdefault("room_id", room_id)
+                reactions.append(ReactionEvent.deserialize(raw))
+            next_batch = resp.get("next_batch")
+            if reached_checkpoint or not next_batch:
+                break
+        # Pages come newest first, but reactions must be applied in the order they were sent
+        reactions.reverse()
+        self.log.debug(f"Fetched {len(reactions)} missed reactions to {event_id}")
+        return reactions
@@ -1,34 +1,330 @@
 import asyncio
+import hmac
 import json
+import socket
+import time
 import uuid
+from contextlib import aclosing
+from dataclasses import replace
 from datetime import datetime, timedelta
-from typing import Type, Optional
+from typing import Any, Dict, FrozenSet, List, Tuple, Type, Optional
 
-from aiohttp.web import Request, Response
+from aiohttp.web import Request, Response, StreamResponse
 from maubot import Plugin, MessageEvent
 from maubot.handlers import web
 from maubot.handlers.event import on
-from mautrix.types import EventType, ReactionEvent, UserID, RoomID, EventID, RelationType
+from mautrix.types import (
+    Event, EventType, ReactionEvent, RedactionEvent, StateEvent, UserID, RoomID, EventID,
+    RelationType
+)
+from mautrix.util.async_db import Connection
 from mautrix.util.logging import TraceLogger
 
+from .backfill import ReactionBackfill
+from .breaker import CircuitBreaker, GuardedClient
+from .claims import ReminderClaims
+from .clock import Clock
 from .config import Config
 from .db import upgrade_table
+from .delivery import ParticipantNotifier
+from .export import HistoryExport, format_csv, format_ndjson
+from .health import HealthMonitor, isoformat, task_state
+from .intake import EventIntake
+from .leader import LeaderElection
+from .members import MemberCache
+from .metrics import Metrics
+from .outbox import Outbox
+from .profiling import Profiler, ProfilerBusy
+from .recording import EventRecorder
+from .repository import (
+    Reaction, ReactionRepository, Reminder, ReminderRepository, Session, SessionRepository,
+    TrackedEvent, TrackedEventRepository
+)
+from .retention import RetentionJob
+from .session_log import (
+    ANNOUNCED, CHOICE_MADE, CONFIRMATION_REQUESTED, CONFIRMED, REACTION_ADDED, REACTION_REMOVED,
+    REMINDER_SENT, WEBHOOK_RECEIVED, SessionLog, SessionView, fold
+)
+from .shopping import shopping_list
+from .sqlite import apply_profile
+from .state import RuntimeState
+from .stats import ParticipationStats
+from .tenants import Tenant, TenantRouter
 
 
 class WallingfordBot(Plugin):
     config: Config
+    clock: Clock = Clock()
     reminder_task: Optional[asyncio.Task]
+    backfill_task: Optional[asyncio.Task]
+    retention_task: Optional[asyncio.Task]
+    member_task: Optional[asyncio.Task]
+    outbox_task: Optional[asyncio.Task]
+    leader_task: Optional[asyncio.Task]
+    health_task: Optional[asyncio.Task]
+    election: Optional[LeaderElection]
+    intake: Optional[EventIntake]
+    metrics: Metrics
+    health: HealthMonitor
+    state: RuntimeState
+    stats: ParticipationStats
+    members: MemberCache
+    notifier: ParticipantNotifier
+    claims: ReminderClaims
+    breaker: CircuitBreaker
+    recorder: Optional[EventRecorder]
+    outbox: Outbox
+    profiler: Profiler
+    sessions: SessionRepository
+    reactions: ReactionRepository
+    reminders: ReminderRepository
+    tracked_events: TrackedEventRepository
+    session_log: SessionLog
+    tenants: TenantRouter
+    room_allowlist: FrozenSet[RoomID]
     
     async def start(self) -> None:
         self.config.load_and_update()
+        self.setup()
+        sqlite_config = self.config.sqlite
+        if sqlite_config["profile"]:
+            try:
+                await apply_profile(
+                    self.database, self.log.getChild("sqlite"),
+                    cache_mb=sqlite_config["cache_mb"],
+                    mmap_mb=sqlite_config["mmap_mb"],
+                )
+            except Exception:
+                self.log.exception("Failed to apply the SQLite profile, keeping the defaults")
+        cluster_config = self.config.cluster
+        if cluster_config["enabled"]:
+            # Other instances write to the same database, so this one's cache would go stale
+            self.log.info(f"Running as cluster instance {self.instance_id}, reading state from the database")
+        else:
+            try:
+                await self.warm_up()
+            except Exception:
+                self.log.exception("Warm-up failed, falling back to database lookups")
+        # Workers only start once warm-up is done; earlier events wait in the queue
+        self.intake.start()
         self.reminder_task = asyncio.create_task(self.reminder_loop())
+        self.member_task = asyncio.create_task(self.member_loop())
+        self.outbox_task = asyncio.create_task(self.outbox.run())
+        self.health_task = asyncio.create_task(self.health.run())
+        self.backfill_task = None
+        self.retention_task = None
+        self.leader_task = None
+        self.election = None
+        if cluster_config["enabled"]:
+            # Backfill and retention run on whichever instance holds the leader lease
+            self.election = LeaderElection(
+                self.database, self.instance_id, self.metrics, self.log.getChild("leader"),
+                on_elected=self.start_singleton_tasks,
+                on_deposed=self.stop_singleton_tasks,
+                lease_seconds=cluster_config["leader_lease"],
+                clock=self.clock,
+            )
+            self.leader_task = asyncio.create_task(self.election.run())
+        else:
+            self.start_singleton_tasks()
         self.log.info("WallingfordBot started")
     
+    def setup(self) -> None:
+        # Builds everything the handlers need without starting any background work
+        self.load_tenants()
+        self.recorder = None
+        if self.config.recording["enabled"]:
+            self.recorder = EventRecorder(self.config.recording["path"], self.clock)
+        self.metrics = Metrics()
+        health_config = self.config.health
+        self.health = HealthMonitor(
+            self.database, self.metrics, self.log.getChild("health"),
+            interval=health_config["probe_interval"],
+            timeout=health_config["probe_timeout"],
+            stale_after=health_config["stale_after"],
+            clock=self.clock,
+        )
+        self.state = RuntimeState()
+        profiling_config = self.config.profiling
+        self.profiler = Profiler(
+            sample_interval=profiling_config["sample_interval_ms"] / 1000,
+            memory_top=profiling_config["memory_top"],
+        )
+        self.sessions = SessionRepository(self.database)
+        self.reactions = ReactionRepository(self.database)
+        self.reminders = ReminderRepository(self.database)
+        self.tracked_events = TrackedEventRepository(self.database)
+        self.session_log = SessionLog(self.database, clock=self.clock)
+        self.stats = ParticipationStats(self.database)
+        self.members = MemberCache(
+            self.client, self.log.getChild("members"),
+            max_size=self.config.members["cache_size"],
+            ttl=self.config.members["ttl"],
+            clock=self.clock,
+        )
+        breaker_config = self.config.circuit_breaker
+        self.breaker = CircuitBreaker(
+            self.metrics, self.log.getChild("breaker"),
+            failure_threshold=breaker_config["failure_threshold"],
+            reset_timeout=breaker_config["reset_timeout"],
+            call_timeout=breaker_config["call_timeout"],
+        )
+        # Everything that sends goes through the breaker
+        guarded_client = GuardedClient(self.client, self.breaker)
+        participant_config = self.config.participant_reminders
+        self.notifier = ParticipantNotifier(
+            guarded_client, self.database, self.members, self.metrics,
+            self.log.getChild("delivery"),
+            mode=participant_config["mode"],
+            concurrency=participant_config["concurrency"],
+            rate=participant_config["rate"],
+            clock=self.clock,
+        )
+        intake_config = self.config.intake
+        self.intake = EventIntake(
+            handler=self.dispatch_queued_event,
+            is_relevant=self.is_relevant_event,
+            metrics=self.metrics,
+            log=self.log.getChild("intake"),
+            workers=intake_config["workers"],
+            max_size=intake_config["max_size"],
+            overflow_timeout=intake_config["overflow_timeout"],
+        )
+        cluster_config = self.config.cluster
+        self.instance_id = cluster_config["instance_id"] or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.claims = ReminderClaims(
+            self.database, self.instance_id,
+            lease_seconds=cluster_config["reminder_lease"],
+            batch_size=cluster_config["reminder_batch_size"],
+        )
+        outbox_config = self.config.outbox
+        self.outbox = Outbox(
+            self.database, guarded_client, self.metrics, self.log.getChild("outbox"), self.instance_id,
+            on_delivered=self.record_delivery,
+            batch_size=outbox_config["batch_size"],
+            lease_seconds=outbox_config["lease"],
+            base_delay=outbox_config["base_delay"],
+            max_delay=outbox_config["max_delay"],
+            max_attempts=outbox_config["max_attempts"],
+            poll_interval=outbox_config["poll_interval"],
+            txn_prefix=f"wallingfordbot-{self.id}",
+            clock=self.clock,
+        )
+    
     async def stop(self) -> None:
         if self.reminder_task:
             self.reminder_task.cancel()
+        if self.leader_task:
+            self.leader_task.cancel()
+        self.stop_singleton_tasks()
+        if self.member_task:
+            self.member_task.cancel()
+        if self.outbox_task:
+            self.outbox_task.cancel()
+        if self.health_task:
+            self.health_task.cancel()
+        if self.intake:
+            await self.intake.stop()
+        if self.election and self.election.is_leader:
+            try:
+                await self.election.resign()
+            except Exception:
+                self.log.exception("Failed to resign leadership")
+        if self.recorder:
+            self.recorder.close()
         self.log.info("WallingfordBot stopped")
     
+    def start_singleton_tasks(self) -> None:
+        if self.config.backfill["enabled"] and not self.backfill_task:
+            self.backfill_task = asyncio.create_task(self.backfill_reactions())
+        if self.config.retention["enabled"] and not self.retention_task:
+            self.retention_task = asyncio.create_task(self.retention_loop())
+    
+    def stop_singleton_tasks(self) -> None:
+        if self.backfill_task:
+            self.backfill_task.cancel()
+            self.backfill_task = None
+        if self.retention_task:
+            self.retention_task.cancel()
+            self.retention_task = None
+    
+    def reaction_window_start(self) -> str:
+        # Sessions from this date on still accept reactions, and are kept in the runtime state
+        days = self.config.sessions["reaction_window_days"]
+        return (self.clock.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    
+    async def warm_up(self) -> None:
+        started = time.monotonic()
+        since = self.reaction_window_start()
+        
+        async with self.database.acquire() as conn:
+            sessions = await self.sessions.since(since, conn=conn)
+            reactions = await self.reactions.since(since, conn=conn)
+            reminders = await self.reminders.pending(conn=conn)
+            tracked_events = await self.tracked_events.since(since, conn=conn)
+        
+        self.state.load(sessions, reactions, reminders, tracked_events)
+        duration = time.monotonic() - started
+        self.metrics.set("warmup_duration_seconds", duration)
+        self.metrics.set("ready", 1)
+        self.log.info(
+            f"Warm-up loaded {len(sessions)} sessions, {len(reactions)} reactions and "
+            f"{len(reminders)} pending reminders in {duration * 1000:.1f} ms"
+        )
+    
+    async def get_session(self, session_id: str) -> Optional[Session]:
+        if self.state.ready:
+            return self.state.get_session(session_id)
+        return await self.sessions.get(session_id)
+    
+    async def get_sessions(self, session_ids: List[str]) -> Dict[str, Session]:
+        if self.state.ready:
+            sessions = (self.state.get_session(session_id) for session_id in session_ids)
+            return {session.id: session for session in sessions if session}
+        return await self.sessions.get_many(session_ids)
+    
+    async def get_session_for_date(self, tenant_id: str, date: str, conn=None) -> Optional[Session]:
+        if self.state.ready:
+            return self.state.session_for_date(tenant_id, date)
+        return await self.sessions.for_date(tenant_id, date, conn=conn)
+    
+    async def get_reactions(self, session_id: str) -> List[Reaction]:
+        if self.state.ready:
+            return self.state.reaction_rows(session_id)
+        return await self.reactions.for_session(session_id)
+    
+    async def get_participants_by_activity(self, session_id: str) -> Dict[str, List[str]]:
+        if self.state.ready:
+            return self.state.activity_participants(session_id)
+        # A friend who reacted with several emojis for one activity is listed once, as in the state
+        participants: Dict[str, Dict[str, None]] = {}
+        for reaction in await self.get_reactions(session_id):
+            participants.setdefault(reaction.activity, {})[reaction.user_id] = None
+        return {activity: list(users) for activity, users in participants.items()}
+    
+    async def get_session_for_event(self, event_id: str, kind: str) -> Optional[Session]:
+        # Reactions find their session through the tracked message they react to, so
+        # reactions to an earlier day's messages still count while inside the window
+        if self.state.ready:
+            session_id = self.state.tracked_events.get(event_id)
+            session = self.state.get_session(session_id) if session_id else None
+            if session and (event_id == session.confirmation_event_id) != (kind == "confirmation"):
+                return None
+        else:
+            session = await self.tracked_events.session_for(event_id, kind)
+        if session and session.date < self.reaction_window_start():
+            self.log.info(f"Session {session.id} of {session.date} no longer accepts reactions")
+            return None
+        return session
+    
+    def load_tenants(self) -> None:
+        self.tenants = TenantRouter.from_config(self.config, log=self.log)
+        self.room_allowlist = self.tenants.room_ids
+    
+    def on_external_config_update(self) -> None:
+        self.config.load_and_update()
+        self.load_tenants()
+    
     @classmethod
     def get_config_class(cls) -> Type[Config]:
         return Config
@@ -37,132 +333,428 @@ class WallingfordBot(Plugin):
     def get_db_upgrade_table(cls):
         return upgrade_table
     
+    def check_auth(self, request: Request) -> Optional[Response]:
+        # Every endpoint except /metrics is protected by the webhook secret; /health and /ready
+        # answer without it, but only with their status
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return Response(status=401, text="Unauthorized")
+        
+        token = auth_header[7:]  # Remove "Bearer " prefix
+        if not hmac.compare_digest(token.encode(), self.config.webhook_secret.encode()):
+            return Response(status=401, text="Invalid token")
+        return None
+    
     @web.post("/webhook/homeassistant")
     async def homeassistant_webhook(self, request: Request) -> Response:
         try:
             # Verify webhook secret
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                return Response(status=401, text="Unauthorized")
-            
-            token = auth_header[7:]  # Remove "Bearer " prefix
-            if token != self.config.webhook_secret:
-                return Response(status=401, text="Invalid token")
+            unauthorized = self.check_auth(request)
+            if unauthorized:
+                return unauthorized
             
             # Parse request
             data = await request.json()
             self.log.info(f"Received Home Assistant webhook: {data}")
             
-            # Check if this is a test request
-            is_test = data.get('test', False)
-            
-            # Start workflow
-            await self.start_office_workflow(is_test=is_test)
-            
-            return Response(status=200, text="OK")
+            return await self.process_webhook(data)
             
         except Exception as e:
             self.log.exception("Error handling Home Assistant webhook")
             return Response(status=500, text="Internal Server Error")
     
-    async def start_office_workflow(self, is_test: bool = False) -> None:
-        today = datetime.now().strftime("%Y-%m-%d")
-        session_id = f"office-{today}-{uuid.uuid4().hex[:8]}"
+    async def process_webhook(self, data: dict) -> Response:
+        started_at = self.clock.now()
+        started = time.monotonic()
         
-        self.log.info(f"DEBUG: Starting office workflow for date {today}, test mode: {is_test}")
+        # Check if this is a test request
+        is_test = data.get('test', False)
         
-        # If this is a test, clear any existing sessions for today
-        if is_test:
-            self.log.info(f"DEBUG: Test mode - clearing existing sessions for {today}")
-            await self.database.execute(
-                "DELETE FROM activity_reaction WHERE session_id IN (SELECT id FROM workflow_session WHERE date = $1)",
-                today
-            )
-            await self.database.execute(
-                "DELETE FROM scheduled_reminder WHERE session_id IN (SELECT id FROM workflow_session WHERE date = $1)",
-                today
-            )
-            await self.database.execute(
-                "DELETE FROM workflow_session WHERE date = $1",
-                today
-            )
+        # Households other than the first are selected by id
+        tenant = self.tenants.get(data.get('tenant'))
+        if not tenant:
+            return Response(status=404, text="Unknown tenant")
         
-        # Check if we already have a session for today
-        existing_session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE date = $1", today
-        )
+        # Start workflow
+        await self.start_office_workflow(is_test=is_test, tenant=tenant)
         
-        if existing_session:
-            self.log.info(f"DEBUG: Found existing session: {existing_session}")
-            if existing_session['confirmed']:
-                self.log.info(f"Workflow already completed today: {existing_session['id']}")
-                return
-            else:
-                self.log.info(f"DEBUG: Session exists but not confirmed, proceeding with new request")
-        else:
-            self.log.info(f"DEBUG: No existing session found for {today}")
+        if self.recorder:
+            self.recorder.record("webhook", data, started_at, time.monotonic() - started)
+        return Response(status=200, text="OK")
+    
+    @web.get("/stats")
+    async def stats_endpoint(self, request: Request) -> Response:
+        unauthorized = self.check_auth(request)
+        if unauthorized:
+            return unauthorized
+        
+        tenant = self.tenants.get(request.query.get("tenant"))
+        if not tenant:
+            return Response(status=404, text="Unknown tenant")
         
-        # Create new workflow session
-        await self.database.execute(
-            "INSERT INTO workflow_session (id, date) VALUES ($1, $2)",
-            session_id, today
+        # Pollers that already have the current data are answered from the version row
+        # alone, one primary-key lookup per poll
+        etag = await self.stats.etag(tenant.id)
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status=304, headers={"ETag": etag})
+        
+        etag, body = await self.stats.snapshot(tenant.id)
+        return Response(
+            status=200,
+            text=body,
+            content_type="application/json",
+            headers={"ETag": etag, "Cache-Control": "no-cache"},
         )
-        self.log.info(f"Started new office workflow: {session_id}")
+    
+    @web.get("/export")
+    async def export_endpoint(self, request: Request) -> StreamResponse:
+        unauthorized = self.check_auth(request)
+        if unauthorized:
+            return unauthorized
+        
+        tenant = self.tenants.get(request.query.get("tenant"))
+        if not tenant:
+            return Response(status=404, text="Unknown tenant")
+        export_format = request.query.get("format", "ndjson")
+        if export_format not in ("ndjson", "csv"):
+            return Response(status=400, text="Unsupported format")
+        try:
+            since = datetime.strptime(request.query.get("from", "0001-01-01"), "%Y-%m-%d")
+            until = datetime.strptime(request.query.get("to", "9999-12-31"), "%Y-%m-%d")
+        except ValueError:
+            return Response(status=400, text="Dates must be YYYY-MM-DD")
+        
+        response = StreamResponse(status=200, headers={
+            "Content-Type": "text/csv" if export_format == "csv" else "application/x-ndjson",
+            "Content-Disposition": f'attachment; filename="{tenant.id}-history.{export_format}"',
+        })
+        response.enable_chunked_encoding()
+        await response.prepare(request)
         
-        # Send confirmation request to Alex
-        await self.send_confirmation_request(session_id)
+        export = HistoryExport(self.database, chunk_size=self.config.export["chunk_size"])
+        exported = 0
+        if export_format == "csv":
+            await response.write(format_csv([], header=True))
+        # Each chunk is written before the next one is read, so memory use stays flat
+        async with aclosing(export.chunks(
+            tenant.id, since.strftime("%Y-%m-%d"), until.strftime("%Y-%m-%d")
+        )) as chunks:
+            async for chunk in chunks:
+                await response.write(
+                    format_csv(chunk) if export_format == "csv" else format_ndjson(chunk)
+                )
+                exported += len(chunk)
+        await response.write_eof()
+        self.log.info(f"Exported {exported} history rows for {tenant.id}")
+        return response
     
-    async def send_confirmation_request(self, session_id: str) -> None:
-        message = self.config.messages["confirmation_request"]
+    @web.post("/debug/profile")
+    async def profile_endpoint(self, request: Request) -> Response:
+        unauthorized = self.check_auth(request)
+        if unauthorized:
+            return unauthorized
         
+        kind = request.query.get("kind", "cpu")
+        if kind not in ("cpu", "stacks", "memory"):
+            return Response(status=400, text="kind must be cpu, stacks or memory")
+        max_seconds = self.config.profiling["max_seconds"]
         try:
-            event = await self.client.send_text(
-                room_id=RoomID(self.config.alex_private_room),
-                text=message
-            )
+            seconds = float(request.query.get("seconds", "10"))
+        except ValueError:
+            return Response(status=400, text="seconds must be a number")
+        if not 0 < seconds <= max_seconds:
+            return Response(status=400, text=f"seconds must be between 0 and {max_seconds}")
+        
+        self.log.info(f"Running a {seconds:g}s {kind} profile")
+        try:
+            if kind == "cpu":
+                body = await self.profiler.cpu_profile(seconds)
+                filename, content_type = "wallingfordbot.pstats", "application/octet-stream"
+            elif kind == "stacks":
+                body = (await self.profiler.sample_stacks(seconds)).encode()
+                filename, content_type = "wallingfordbot.collapsed", "text/plain"
+            else:
+                body = (await self.profiler.memory_diff(seconds)).encode()
+                filename, content_type = "wallingfordbot-memory.txt", "text/plain"
+        except ProfilerBusy as e:
+            return Response(status=409, text=str(e))
+        return Response(
+            status=200,
+            body=body,
+            content_type=content_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    
+    @web.get("/debug/session")
+    async def session_history_endpoint(self, request: Request) -> Response:
+        unauthorized = self.check_auth(request)
+        if unauthorized:
+            return unauthorized
+        
+        session_id = request.query.get("id")
+        if not session_id:
+            return Response(status=400, text="id is required")
+        events = await self.session_log.events(session_id)
+        view = fold(None, events)
+        if not view:
+            # Sessions started before the log existed have only part of their history
+            # there, so their state comes from the rows
+            session = await self.sessions.get(session_id)
+            if not session:
+                return Response(status=404, text="Unknown session")
+            view = SessionView(session)
+            for reaction in await self.reactions.for_session(session_id):
+                view.reactions.setdefault(reaction.activity, {})[reaction.user_id] = reaction.event_id
+        return Response(
+            status=200,
+            text=json.dumps({
+                "id": session_id,
+                "state": json.loads(view.to_json()),
+                "events": [
+                    {"id": e.id, "kind": e.kind, "at": isoformat(e.created_at), **e.data}
+                    for e in events
+                ],
+            }, ensure_ascii=False),
+            content_type="application/json",
+        )
+    
+    @web.get("/metrics")
+    async def metrics_endpoint(self, request: Request) -> Response:
+        return Response(
+            status=200,
+            text=self.metrics.render(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+    
+    @web.get("/health")
+    async def health_endpoint(self, request: Request) -> Response:
+        # Liveness: only a reminder loop that has exited needs a restart to recover
+        problems = []
+        if task_state(self.reminder_task) != "running":
+            problems.append("reminder loop is not running")
+        return self.health_response(request, problems)
+    
+    @web.get("/ready")
+    async def ready_endpoint(self, request: Request) -> Response:
+        return self.health_response(request, self.readiness_problems())
+    
+    def readiness_problems(self) -> List[str]:
+        problems = []
+        # Cluster instances skip warm-up and read everything from the database
+        if not self.state.ready and not self.config.cluster["enabled"]:
+            problems.append("warm-up has not finished")
+        if not self.health.database_healthy:
+            problems.append("database is unreachable" if self.health.checked_at else "database not probed yet")
+        if task_state(self.reminder_task) != "running":
+            problems.append("reminder loop is not running")
+        elif self.health.is_stalled("reminder"):
+            problems.append("reminder loop has stalled")
+        return problems
+    
+    def health_response(self, request: Request, problems: List[str]) -> Response:
+        # Built from in-memory state only, so polling every second costs no queries. Probes
+        # get the status alone; the problems and the report, with error messages and
+        # instance details, need the webhook secret
+        body = {"status": "unavailable" if problems else "ok"}
+        if not self.check_auth(request):
+            body.update(problems=problems, **self.health_report())
+        return Response(
+            status=503 if problems else 200,
+            text=json.dumps(body),
+            content_type="application/json",
+            headers={"Cache-Control": "no-store"},
+        )
+    
+    def health_report(self) -> Dict[str, Any]:
+        tasks = {
+            "reminder": self.reminder_task, "outbox": self.outbox_task, "member": self.member_task,
+            "backfill": self.backfill_task, "retention": self.retention_task, "leader": self.leader_task,
+        }
+        next_reminder = self.state.next_reminder_time() if self.state.ready else self.health.next_reminder
+        return {
+            "instance_id": self.instance_id,
+            "warmed_up": self.state.ready,
+            "leader": self.election.is_leader if self.election else None,
+            "database": self.health.database_report(),
+            "tasks": {name: task_state(task) for name, task in tasks.items()},
+            "heartbeats": {
+                name: round(self.health.heartbeat_age(name), 1) for name in self.health.heartbeats
+            },
+            "errors": self.health.errors,
+            "queues": {"intake": self.intake.depth, "outbox_pending": self.health.outbox_pending},
+            "next_reminder": isoformat(next_reminder),
+            "circuit": self.breaker.state,
+            "caches": {
+                "sessions": len(self.state.sessions),
+                "tracked_events": len(self.state.tracked_events),
+                "reactions": len(self.state.reaction_index),
+                "pending_reminders": len(self.state.pending_reminders),
+                "member_names": len(self.members),
+            },
+        }
+    
+    async def start_office_workflow(
+        self, is_test: bool = False, tenant: Optional[Tenant] = None
+    ) -> None:
+        tenant = tenant or self.tenants.default
+        today = self.clock.now().strftime("%Y-%m-%d")
+        session_id = f"office-{today}-{uuid.uuid4().hex[:8]}"
+        
+        self.log.info(f"DEBUG: Starting office workflow for {tenant.id} on {today}, test mode: {is_test}")
+        
+        async with self.database.acquire() as conn, conn.transaction():
+            # If this is a test, clear any existing sessions for today
+            if is_test:
+                self.log.info(f"DEBUG: Test mode - clearing existing sessions for {today}")
+                # Reactions and reminders are removed by ON DELETE CASCADE
+                cleared = await self.reactions.for_date(conn, tenant.id, today)
+                await self.stats.record(conn, [
+                    (r.tenant_id, r.user_id, r.activity, r.date, -1) for r in cleared
+                ])
+                await self.sessions.delete_for_date(conn, tenant.id, today)
             
-            # React with available options to show Alex what to choose from
-            for emoji in self.config.confirmation_emojis:
-                await self.client.react(
-                    room_id=RoomID(self.config.alex_private_room), 
-                    event_id=event,
-                    key=emoji
-                )
+            # Check if we already have a session for today; a test has just cleared them, and
+            # the runtime state only forgets them once that has committed
+            existing_session = None
+            if not is_test:
+                existing_session = await self.get_session_for_date(tenant.id, today, conn=conn)
             
-            # Add thumbs up for confirmation
-            await self.client.react(
-                room_id=RoomID(self.config.alex_private_room),
-                event_id=event,
-                key="👍"
-            )
+            if existing_session:
+                self.log.info(f"DEBUG: Found existing session: {existing_session}")
+                if existing_session.confirmed:
+                    self.log.info(f"Workflow already completed today: {existing_session.id}")
+                    return
+                else:
+                    self.log.info(f"DEBUG: Session exists but not confirmed, proceeding with new request")
+            else:
+                self.log.info(f"DEBUG: No existing session found for {today}")
             
+            # Create new workflow session, with the confirmation request to Alex
+            session = Session(session_id, tenant.id, today)
+            await self.sessions.insert(conn, session)
+            await self.session_log.append(
+                conn, session_id, WEBHOOK_RECEIVED, tenant_id=tenant.id, date=today, test=is_test
+            )
+            await self.send_confirmation_request(session_id, tenant, conn)
+        self.outbox.wake()
+        
+        if is_test:
+            self.state.drop_sessions_for_date(tenant.id, today)
+        if self.state.ready:
+            self.state.prune(self.reaction_window_start())
+            self.state.put_session(session)
+        self.log.info(f"Started new office workflow: {session_id}")
+    
+    async def send_confirmation_request(self, session_id: str, tenant: Tenant, conn: Connection) -> None:
+        # React with available options to show Alex what to choose from, then thumbs up to confirm
+        await self.outbox.enqueue(
+            conn, tenant.private_room, self.config.messages["confirmation_request"],
+            kind="confirmation_request", session_id=session_id,
+            reactions=[*self.config.confirmation_emojis, "👍"], tenant_id=tenant.id,
+        )
+    
+    async def record_delivery(self, conn: Connection, message: dict, event_id: EventID) -> None:
+        # Runs in the transaction that marks the outbox message sent
+        session_id = message['session_id']
+        if self.recorder:
+            self.recorder.record("delivered", {
+                "room_id": message['room_id'], "kind": message['kind'], "event_id": str(event_id),
+            })
+        if message['kind'] == "confirmation_request":
+            # Track the request so reactions missed during downtime can be backfilled
+            await self.sessions.set_confirmation_event(conn, session_id, str(event_id))
+            await self.tracked_events.insert(
+                conn, TrackedEvent(str(event_id), session_id, message['room_id']), kind="confirmation"
+            )
+            await self.session_log.append(conn, session_id, CONFIRMATION_REQUESTED, event_id=str(event_id))
+            self.state.update_session(session_id, confirmation_event_id=str(event_id))
             self.log.info(f"Sent confirmation request for session {session_id}")
-            
-        except Exception as e:
-            self.log.exception(f"Failed to send confirmation request: {e}")
+        elif message['kind'] == "announcement":
+            # The announcement in the tenant's first group room is the session's primary group
+            # message, whichever room's delivery happens to finish first
+            tenant = self.tenants.for_room(message['room_id'])
+            primary = (
+                tenant is not None and message['room_id'] == tenant.group_room
+                and await self.sessions.set_group_message(conn, session_id, str(event_id))
+            )
+            await self.tracked_events.insert(
+                conn, TrackedEvent(str(event_id), session_id, message['room_id']), kind="announcement"
+            )
+            await self.session_log.append(
+                conn, session_id, ANNOUNCED, event_id=str(event_id), room_id=message['room_id']
+            )
+            if primary:
+                self.state.update_session(session_id, group_message_id=str(event_id))
+            self.state.track_event(str(event_id), session_id)
+            self.log.info(f"Sent group announcement for session {session_id} to {message['room_id']}")
     
+    # The allowlist check comes first so events from unrelated rooms cost one set lookup
     @on(EventType.REACTION)
     async def handle_reaction_event(self, event: ReactionEvent) -> None:
-        await self.handle_reaction(event)
+        if event.room_id not in self.room_allowlist:
+            return
+        await self.intake.submit(event)
+    
+    @on(EventType.ROOM_REDACTION)
+    async def handle_redaction_event(self, event: RedactionEvent) -> None:
+        if event.room_id not in self.room_allowlist:
+            return
+        await self.intake.submit(event)
+    
+    @on(EventType.ROOM_MEMBER)
+    async def handle_member_event(self, event: StateEvent) -> None:
+        if event.room_id not in self.room_allowlist:
+            return
+        self.members.handle_member_event(event)
+    
+    def is_relevant_event(self, event: Event) -> bool:
+        # Relevant events are the ones a full intake queue waits for: reactions to a
+        # tracked session message and redactions of stored reactions
+        if event.room_id not in self.room_allowlist or event.sender == self.client.mxid:
+            return False
+        if not self.state.ready:
+            # Without the runtime state (cluster mode) this can't be told without a query
+            return True
+        if event.type == EventType.ROOM_REDACTION:
+            return str(event.redacts) in self.state.reaction_index
+        relates_to = event.content.relates_to
+        return bool(relates_to) and str(relates_to.event_id) in self.state.tracked_events
+    
+    async def dispatch_queued_event(self, event: Event) -> None:
+        started_at = self.clock.now()
+        started = time.monotonic()
+        if event.type == EventType.ROOM_REDACTION:
+            kind = "redaction"
+            await self.handle_redaction(event)
+        else:
+            kind = "reaction"
+            await self.handle_reaction(event)
+        if self.recorder:
+            self.recorder.record(kind, event.serialize(), started_at, time.monotonic() - started)
     
     async def handle_reaction(self, event: ReactionEvent) -> None:
-        self.log.info(f"DEBUG: Handle reaction called - sender: {event.sender}, alex_user_id: {self.config.alex_user_id}")
+        self.log.debug("Handle reaction called - sender: %s, room: %s", event.sender, event.room_id)
         
         # Only handle annotation reactions (not other relation types)
         if event.content.relates_to.rel_type != RelationType.ANNOTATION:
             self.log.info(f"DEBUG: Skipping non-annotation reaction: {event.content.relates_to.rel_type}")
             return
+        
+        tenant = self.tenants.for_room(event.room_id)
+        if not tenant:
+            return
             
         # Check if this is in Alex's private room (confirmation reactions)
-        if str(event.room_id) == self.config.alex_private_room and event.sender == UserID(self.config.alex_user_id):
+        if event.room_id == tenant.private_room and event.sender == tenant.user_id:
             self.log.info(f"DEBUG: Handling Alex's confirmation reaction")
-            await self.handle_confirmation_reaction(event)
+            await self.handle_confirmation_reaction(event, tenant)
         else:
             # All other reactions (including Alex's activity reactions) go to activity handler
             self.log.info(f"DEBUG: Reaction not Alex confirmation, checking if it's activity reaction")
-            await self.handle_activity_reaction(event)
+            await self.handle_activity_reaction(event, tenant)
     
-    async def handle_confirmation_reaction(self, event: ReactionEvent) -> None:
+    async def handle_confirmation_reaction(self, event: ReactionEvent, tenant: Tenant) -> None:
         emoji = event.content.relates_to.key
         self.log.info(f"DEBUG: Handling confirmation reaction {emoji}")
         
@@ -172,71 +764,90 @@ class WallingfordBot(Plugin):
             if emoji == "👍":
                 self.log.info(f"DEBUG: Detected thumbs up ({emoji}), calling confirm_previous_reaction")
                 # This might be confirming a previous choice
-                await self.confirm_previous_reaction(event)
+                await self.confirm_previous_reaction(event, tenant)
             return
         
         # Store the emoji choice (not yet confirmed)
-        today = datetime.now().strftime("%Y-%m-%d")
-        self.log.info(f"DEBUG: Looking for session on date {today}")
-        session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE date = $1", today
-        )
-        if session:
-            self.log.info(f"DEBUG: Found session {session['id']}, updating with choice {emoji}")
-            await self.database.execute(
-                "UPDATE workflow_session SET alex_confirmation = $1, confirmed = $2 WHERE id = $3",
-                emoji, False, session['id']
-            )
-            self.log.info(f"Alex chose {emoji} for session {session['id']}")
+        target = str(event.content.relates_to.event_id)
+        self.log.info(f"DEBUG: Looking for session of confirmation request {target}")
+        session = await self.get_session_for_event(target, "confirmation")
+        if session and session.tenant_id == tenant.id:
+            self.log.info(f"DEBUG: Found session {session.id}, updating with choice {emoji}")
+            await self.record_choice(session.id, emoji, str(event.event_id))
+            self.state.update_session(session.id, alex_confirmation=emoji, confirmed=False)
+            self.log.info(f"Alex chose {emoji} for session {session.id}")
         else:
-            self.log.warning(f"DEBUG: No session found for date {today}")
+            self.log.warning(f"DEBUG: No session found for confirmation request {target}")
     
-    async def confirm_previous_reaction(self, event: ReactionEvent) -> None:
-        today = datetime.now().strftime("%Y-%m-%d") 
-        self.log.info(f"DEBUG: Confirming previous reaction for date {today}")
-        session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE date = $1", today
-        )
+    async def confirm_previous_reaction(self, event: ReactionEvent, tenant: Tenant) -> None:
+        target = str(event.content.relates_to.event_id)
+        self.log.info(f"DEBUG: Confirming previous reaction to {target}")
+        session = await self.get_session_for_event(target, "confirmation")
         
-        if not session:
-            self.log.warning(f"DEBUG: No session found for confirmation on {today}")
+        if not session or session.tenant_id != tenant.id:
+            self.log.warning(f"DEBUG: No session found for confirmation request {target}")
             return
             
-        if not session['alex_confirmation']:
-            self.log.warning(f"DEBUG: Session {session['id']} has no alex_confirmation set")
+        if not session.alex_confirmation:
+            self.log.warning(f"DEBUG: Session {session.id} has no alex_confirmation set")
             return
         
-        self.log.info(f"DEBUG: Found session {session['id']} with alex_confirmation={session['alex_confirmation']}")
-        
-        # Confirm the choice and proceed
-        await self.database.execute(
-            "UPDATE workflow_session SET alex_confirmation = $1, confirmed = $2 WHERE id = $3",
-            session['alex_confirmation'], True, session['id']
-        )
-        self.log.info(f"Alex confirmed {session['alex_confirmation']} for session {session['id']}")
+        self.log.info(f"DEBUG: Found session {session.id} with alex_confirmation={session.alex_confirmation}")
+        await self.confirm_session(session, tenant, str(event.event_id))
+    
+    async def confirm_session(
+        self, session: Session, tenant: Tenant, event_id: Optional[str] = None
+    ) -> None:
+        staying = session.alex_confirmation in ["🏠", "🏢", "🕒"]
+        reminders = []
         
-        # Proceed if Alex is staying in Wallingford (🏠, 🏢, or 🕒)
-        if session['alex_confirmation'] in ["🏠", "🏢", "🕒"]:
-            self.log.info(f"DEBUG: Alex staying in Wallingford ({session['alex_confirmation']}), checking what to announce")
-            
-            # Always send group announcement when Alex is staying
-            await self.send_group_announcement(session['id'], session['alex_confirmation'])
+        # Confirm the choice, schedule its reminders and queue its announcement atomically.
+        # Only the call that flips the session to confirmed does the rest, however many
+        # times the 👍 is seen live, by backfill or by other instances.
+        async with self.database.acquire() as conn, conn.transaction():
+            if not await self.sessions.confirm(conn, session.id, session.alex_confirmation):
+                self.log.info(f"Session {session.id} is already confirmed")
+                return
+            await self.session_log.append(
+                conn, session.id, CONFIRMED, choice=session.alex_confirmation, event_id=event_id
+            )
+            # Proceed if Alex is staying in Wallingford (🏠, 🏢, or 🕒)
+            if staying:
+                reminders = await self.schedule_reminders(
+                    session.id, session.alex_confirmation, conn=conn, date=session.date
+                )
+                self.log.info(f"DEBUG: Alex staying in Wallingford ({session.alex_confirmation}), checking what to announce")
                 
-            await self.schedule_reminders(session['id'], session['alex_confirmation'])
-        else:
-            self.log.info(f"DEBUG: Alex not staying in Wallingford ({session['alex_confirmation']}), not sending group announcement")
+                # Always send group announcement when Alex is staying
+                await self.send_group_announcement(
+                    session.id, session.alex_confirmation, tenant, conn
+                )
+            else:
+                self.log.info(f"DEBUG: Alex not staying in Wallingford ({session.alex_confirmation}), not sending group announcement")
+        self.outbox.wake()
+        self.state.update_session(session.id, confirmed=True)
+        for reminder_type, scheduled_time in reminders:
+            self.state.add_reminder(session.id, reminder_type, scheduled_time)
+        self.log.info(f"Alex confirmed {session.alex_confirmation} for session {session.id}")
+    
+    async def record_choice(self, session_id: str, choice: str, event_id: Optional[str] = None) -> None:
+        async with self.database.acquire() as conn, conn.transaction():
+            await self.sessions.set_choice(session_id, choice, confirmed=False, conn=conn)
+            await self.session_log.append(conn, session_id, CHOICE_MADE, choice=choice, event_id=event_id)
     
-    async def send_group_announcement(self, session_id: str, alex_confirmation: str) -> None:
+    async def send_group_announcement(
+        self, session_id: str, alex_confirmation: str, tenant: Tenant, conn: Connection
+    ) -> None:
         # Build activity options text based on Alex's availability
         activity_options = []
         
         # Always include lunch
-        lunch_config = self.config.activities["lunch"]
+        lunch_config = tenant.activities["lunch"]
         activity_options.append(f"{lunch_config['emoji']} if you'd like {lunch_config['text']}")
         
         # Only include evening activities if Alex is fully available (🏠)
         if alex_confirmation == "🏠":
-            for activity_key, activity_config in self.config.activities.items():
+            for activity_key, activity_config in tenant.activities.items():
                 if activity_key != "lunch":  # Skip lunch as we already added it
                     emoji = activity_config["emoji"]
                     text = activity_config["text"]
@@ -246,52 +857,38 @@ class WallingfordBot(Plugin):
         
         # Customize message based on Alex's availability
         if alex_confirmation == "🏠":
-            base_message = "Alex is here and free for activities!"
+            base_message = f"{tenant.name} is here and free for activities!"
             message = f"{base_message} React with {options_text}"
         elif alex_confirmation == "🏢": 
-            base_message = "Alex is here but busy this evening, lunch only!"
+            base_message = f"{tenant.name} is here but busy this evening, lunch only!"
             message = f"{base_message} React with {options_text}"
         else:  # 🕒 - busy all day
-            message = "Alex is here but busy all day. No activities today, but he's staying the night!"
+            message = f"{tenant.name} is here but busy all day. No activities today, but staying the night!"
         
-        try:
-            event = await self.client.send_text(
-                room_id=RoomID(self.config.group_chat_room),
-                text=message
-            )
+        # React with activity emojis based on Alex's availability
+        emojis = []
+        if alex_confirmation in ["🏠", "🏢"]:  # Only add emojis if there are activities
+            # Always add lunch emoji for 🏠 and 🏢
+            emojis.append(tenant.activities["lunch"]["emoji"])
             
-            # Store group message ID
-            await self.database.execute(
-                "UPDATE workflow_session SET group_message_id = $1 WHERE id = $2",
-                str(event), session_id
+            # Only add evening activity emojis if Alex is fully available (🏠)
+            if alex_confirmation == "🏠":
+                for activity_key, activity_config in tenant.activities.items():
+                    if activity_key != "lunch":  # Skip lunch as we already added it
+                        emojis.append(activity_config["emoji"])
+        # For 🕒 (busy all day), no activity emojis are added
+        
+        # Each group room gets its own outbox message, so one unreachable room holds up no other
+        for room_id in tenant.group_rooms:
+            await self.outbox.enqueue(
+                conn, room_id, message,
+                kind="announcement", session_id=session_id, reactions=emojis, tenant_id=tenant.id,
             )
-            
-            # React with activity emojis based on Alex's availability
-            if alex_confirmation in ["🏠", "🏢"]:  # Only add emojis if there are activities
-                # Always add lunch emoji for 🏠 and 🏢
-                await self.client.react(
-                    room_id=RoomID(self.config.group_chat_room),
-                    event_id=event,
-                    key=self.config.activities["lunch"]["emoji"]
-                )
-                
-                # Only add evening activity emojis if Alex is fully available (🏠)
-                if alex_confirmation == "🏠":
-                    for activity_key, activity_config in self.config.activities.items():
-                        if activity_key != "lunch":  # Skip lunch as we already added it
-                            await self.client.react(
-                                room_id=RoomID(self.config.group_chat_room),
-                                event_id=event,
-                                key=activity_config["emoji"]
-                            )
-            # For 🕒 (busy all day), no activity emojis are added
-            
-            self.log.info(f"Sent group announcement for session {session_id}")
-            
-        except Exception as e:
-            self.log.exception(f"Failed to send group announcement: {e}")
+        self.log.info(
+            f"Queued group announcement for session {session_id} to {len(tenant.group_rooms)} rooms"
+        )
     
-    async def handle_activity_reaction(self, event: ReactionEvent) -> None:
+    async def handle_activity_reaction(self, event: ReactionEvent, tenant: Tenant) -> None:
         self.log.info(f"DEBUG: Activity reaction handler called - room: {event.room_id}, sender: {event.sender}, emoji: {event.content.relates_to.key}")
         
         # Don't respond to the bot's own reactions
@@ -300,8 +897,8 @@ class WallingfordBot(Plugin):
             return
         
         # Check if this is a reaction to a group message
-        if str(event.room_id) != self.config.group_chat_room:
-            self.log.info(f"DEBUG: Room {event.room_id} != group chat room {self.config.group_chat_room}")
+        if event.room_id not in tenant.group_rooms:
+            self.log.info(f"DEBUG: Room {event.room_id} is not a group room of {tenant.id}")
             return
         
         # Only handle annotation reactions 
@@ -309,34 +906,18 @@ class WallingfordBot(Plugin):
             self.log.info(f"DEBUG: Relation type {event.content.relates_to.rel_type} != ANNOTATION")
             return
             
-        today = datetime.now().strftime("%Y-%m-%d")
-        session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE date = $1", today
-        )
-        if not session:
-            self.log.info(f"DEBUG: No session found for date {today}")
-            return
-        if not session['group_message_id']:
-            self.log.info(f"DEBUG: Session {session['id']} has no group_message_id")
-            return
-        
-        self.log.info(f"DEBUG: Checking if reaction event {event.content.relates_to.event_id} == session group_message_id {session['group_message_id']}")
-        
-        # Check if reaction is to our group message
-        if str(event.content.relates_to.event_id) != session['group_message_id']:
-            self.log.info(f"DEBUG: Event ID mismatch: {event.content.relates_to.event_id} != {session['group_message_id']}")
+        # Only reactions to one of our group announcements count
+        target = str(event.content.relates_to.event_id)
+        session = await self.get_session_for_event(target, "announcement")
+        if not session or session.tenant_id != tenant.id:
+            self.log.info(f"DEBUG: Event {target} is not an announcement of an open session")
             return
         
         emoji = event.content.relates_to.key
         self.log.info(f"DEBUG: Processing activity emoji: {emoji}")
         
         # Find which activity this emoji corresponds to
-        activity_key = None
-        for key, config in self.config.activities.items():
-            self.log.info(f"DEBUG: Checking activity {key} with emoji {config['emoji']} against {emoji}")
-            if config["emoji"] == emoji:
-                activity_key = key
-                break
+        activity_key = tenant.activity_for_emoji(emoji)
         
         if not activity_key:
             self.log.info(f"DEBUG: No activity found for emoji {emoji}")
@@ -344,107 +925,312 @@ class WallingfordBot(Plugin):
         
         self.log.info(f"DEBUG: Found activity {activity_key} for emoji {emoji}, storing reaction")
         
-        # Store the reaction
-        await self.database.execute(
-            "INSERT INTO activity_reaction (session_id, user_id, activity, emoji) VALUES ($1, $2, $3, $4)",
-            session['id'], str(event.sender), activity_key, emoji
-        )
+        # Store the reaction, counting it in the rollups and responding only if it is new
+        activity_config = tenant.activities[activity_key]
+        async with self.database.acquire() as conn, conn.transaction():
+            inserted = await self.reactions.insert(conn, Reaction(
+                session.id, str(event.sender), activity_key, str(event.event_id), emoji, target
+            ))
+            if inserted:
+                await self.session_log.append(
+                    conn, session.id, REACTION_ADDED,
+                    user_id=str(event.sender), activity=activity_key, event_id=str(event.event_id),
+                )
+                await self.stats.record(conn, [
+                    (tenant.id, str(event.sender), activity_key, session.date, 1)
+                ])
+                # Send automatic response for the activity
+                if 'response' in activity_config:
+                    await self.outbox.enqueue(
+                        conn, event.room_id, activity_config['response'],
+                        session_id=session.id, tenant_id=tenant.id,
+                    )
+        self.outbox.wake()
+        self.state.add_reaction(session.id, str(event.sender), activity_key, str(event.event_id))
         
         self.log.info(f"User {event.sender} reacted with {emoji} for {activity_key}")
+    
+    async def handle_redaction(self, event: RedactionEvent) -> None:
+        if not event.redacts:
+            return
         
-        # Send automatic response for the activity
-        activity_config = self.config.activities[activity_key]
-        if 'response' in activity_config:
-            response_message = activity_config['response']
-            try:
-                await self.client.send_text(
-                    room_id=RoomID(self.config.group_chat_room),
-                    text=response_message
+        # A removed reaction withdraws the user from that activity
+        async with self.database.acquire() as conn, conn.transaction():
+            reaction = await self.reactions.by_event(conn, str(event.redacts))
+            if not reaction:
+                return
+            await self.reactions.delete(conn, str(event.redacts))
+            await self.session_log.append(
+                conn, reaction.session_id, REACTION_REMOVED, event_id=str(event.redacts)
+            )
+            await self.stats.record(conn, [(
+                reaction.tenant_id, reaction.user_id, reaction.activity, reaction.date, -1
+            )])
+        self.state.remove_reaction(str(event.redacts))
+        self.log.info(f"Processed redaction of {event.redacts} by {event.sender}")
+    
+    async def backfill_reactions(self) -> None:
+        try:
+            await self._backfill_reactions()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.log.exception("Reaction backfill failed")
+    
+    async def _backfill_reactions(self) -> None:
+        started = time.monotonic()
+        backfill_config = self.config.backfill
+        backfill = ReactionBackfill(
+            self.client, self.database, self.log.getChild("backfill"),
+            page_size=backfill_config["page_size"]
+        )
+        since = self.reaction_window_start()
+        sessions = await self.sessions.since(since)
+        announcements = await self.tracked_events.announcements_since(since)
+        sessions_by_id = {session.id: session for session in sessions}
+        tracked = []
+        for session in sessions:
+            tenant = self.tenants.get(session.tenant_id)
+            if tenant and session.confirmation_event_id and not session.confirmed:
+                tracked.append((
+                    session, tenant, tenant.private_room, session.confirmation_event_id, "confirmation"
+                ))
+        for announcement in announcements:
+            session = sessions_by_id.get(announcement.session_id)
+            tenant = session and self.tenants.get(session.tenant_id)
+            if not tenant:
+                continue
+            # Announcements tracked before per-room tracking went to the first group room
+            room_id = announcement.room_id or tenant.group_room
+            tracked.append((session, tenant, room_id, announcement.event_id, "announcement"))
+        checkpoints = await backfill.load_checkpoints([t[3] for t in tracked])
+        
+        # Fetch all tracked events' relations concurrently, then apply them in order
+        results = await asyncio.gather(*[
+            backfill.fetch_reactions(room_id, event_id, checkpoints.get(event_id, 0))
+            for _, _, room_id, event_id, _ in tracked
+        ])
+        applied = 0
+        for (session, tenant, room_id, event_id, kind), reactions in zip(tracked, results):
+            if not reactions:
+                continue
+            if kind == "announcement":
+                applied += await self._apply_backfilled_activity_reactions(
+                    session, reactions, backfill_config["batch_size"], tenant
                 )
-                self.log.info(f"Sent activity response: {response_message}")
-            except Exception as e:
-                self.log.exception(f"Failed to send activity response: {e}")
+            else:
+                applied += await self._apply_backfilled_confirmation(session, reactions, tenant)
+            await backfill.save_checkpoint(event_id, max(r.timestamp for r in reactions))
+        
+        duration = time.monotonic() - started
+        self.metrics.set("backfill_duration_seconds", duration)
+        self.metrics.inc("backfill_reactions_total", applied)
+        self.log.info(
+            f"Backfilled {applied} reactions for {len(tracked)} tracked events "
+            f"in {duration * 1000:.1f} ms"
+        )
+    
+    async def _apply_backfilled_activity_reactions(
+        self, session: Session, reactions: list, batch_size: int, tenant: Tenant
+    ) -> int:
+        rows = []
+        for reaction in reactions:
+            if str(reaction.sender) == str(self.client.mxid):
+                continue
+            activity_key = tenant.activity_for_emoji(reaction.content.relates_to.key)
+            if activity_key:
+                rows.append(Reaction(
+                    session.id, str(reaction.sender), activity_key,
+                    str(reaction.event_id), reaction.content.relates_to.key,
+                    str(reaction.content.relates_to.event_id),
+                ))
+        
+        # Reactions seen live or in an earlier run are already stored and counted
+        inserted = 0
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            async with self.database.acquire() as conn, conn.transaction():
+                existing = await self.reactions.existing(conn, [row.event_id for row in batch])
+                batch = [row for row in batch if row.event_id not in existing]
+                if not batch:
+                    continue
+                await self.reactions.insert_many(conn, batch)
+                inserted += len(batch)
+                await self.session_log.append_many(conn, [
+                    (row.session_id, REACTION_ADDED, {
+                        "user_id": row.user_id, "activity": row.activity, "event_id": row.event_id,
+                    })
+                    for row in batch
+                ])
+                await self.stats.record(conn, [
+                    (tenant.id, row.user_id, row.activity, session.date, 1) for row in batch
+                ])
+        for row in rows:
+            self.state.add_reaction(row.session_id, row.user_id, row.activity, row.event_id)
+        return inserted
+    
+    async def _apply_backfilled_confirmation(self, session: Session, reactions: list, tenant: Tenant) -> int:
+        # Reactions seen live or in an earlier run are already applied; replaying a
+        # choice would reset the confirmation it led to
+        seen = await self.session_log.applied_reactions(session.id)
+        choice = session.alex_confirmation
+        choice_event_id = confirm_event_id = None
+        applied = 0
+        for reaction in reactions:
+            if reaction.sender != tenant.user_id or str(reaction.event_id) in seen:
+                continue
+            emoji = reaction.content.relates_to.key
+            if emoji in self.config.confirmation_emojis:
+                choice, choice_event_id = emoji, str(reaction.event_id)
+                applied += 1
+            elif emoji == "👍" and choice:
+                confirm_event_id = str(reaction.event_id)
+                applied += 1
+        
+        if choice_event_id and choice != session.alex_confirmation:
+            await self.record_choice(session.id, choice, choice_event_id)
+            self.state.update_session(session.id, alex_confirmation=choice, confirmed=False)
+            self.log.info(f"Backfilled Alex's choice {choice} for session {session.id}")
+        if confirm_event_id:
+            await self.confirm_session(replace(session, alex_confirmation=choice), tenant, confirm_event_id)
+        return applied
     
-    async def schedule_reminders(self, session_id: str, alex_confirmation: str) -> None:
-        now = datetime.now()
+    async def schedule_reminders(
+        self, session_id: str, alex_confirmation: str, conn=None, date: Optional[str] = None
+    ) -> List[Tuple[str, datetime]]:
+        now = self.clock.now()
+        # Reminders fall on the session's own day, which a late confirmation may have left
+        day = datetime.strptime(date, "%Y-%m-%d") if date else now
         timing = self.config.timing
+        reminders = []
         
         # Only schedule lunch reminders if Alex is available for lunch (🏠 or 🏢)
         if alex_confirmation in ["🏠", "🏢"]:
             # Parse lunch time
             lunch_time_str = timing["lunch_time"]  # "12:30"
             lunch_hour, lunch_minute = map(int, lunch_time_str.split(":"))
-            lunch_time = now.replace(hour=lunch_hour, minute=lunch_minute, second=0, microsecond=0)
+            lunch_time = day.replace(hour=lunch_hour, minute=lunch_minute, second=0, microsecond=0)
             
             # Schedule lunch reminder
             lunch_reminder_time = lunch_time - timedelta(minutes=timing["lunch_reminder_offset"])
             if lunch_reminder_time > now:
-                await self.database.execute(
-                    "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) VALUES ($1, $2, $3)",
-                    session_id, "lunch", lunch_reminder_time
-                )
+                reminders.append(("lunch", lunch_reminder_time))
         
         # Only schedule evening reminders if Alex is fully available (🏠)
         if alex_confirmation == "🏠":
             # Parse work end time  
             work_end_str = timing["work_end_time"]  # "17:30"
             work_hour, work_minute = map(int, work_end_str.split(":"))
-            work_end_time = now.replace(hour=work_hour, minute=work_minute, second=0, microsecond=0)
+            work_end_time = day.replace(hour=work_hour, minute=work_minute, second=0, microsecond=0)
             
             # Schedule evening reminder
             evening_reminder_time = work_end_time - timedelta(minutes=timing["evening_reminder_offset"])
             if evening_reminder_time > now:
-                await self.database.execute(
-                    "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) VALUES ($1, $2, $3)",
-                    session_id, "evening", evening_reminder_time
-                )
+                reminders.append(("evening", evening_reminder_time))
+        
+        if reminders:
+            await self.reminders.insert_many([
+                Reminder(session_id, reminder_type, scheduled_time)
+                for reminder_type, scheduled_time in reminders
+            ], conn=conn)
         
         self.log.info(f"Scheduled reminders for session {session_id} with availability {alex_confirmation}")
+        return reminders
     
     async def reminder_loop(self) -> None:
         while True:
+            # Readiness reports the loop as stalled when this stops being refreshed
+            self.health.heartbeat("reminder")
             try:
-                await asyncio.sleep(60)  # Check every minute
+                await self.clock.sleep(60)  # Check every minute
                 await self.check_pending_reminders()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 self.log.exception("Error in reminder loop")
+                self.health.record_error("reminder", e)
     
-    async def check_pending_reminders(self) -> None:
-        now = datetime.now()
-        pending_reminders = await self.database.fetch(
-            "SELECT * FROM scheduled_reminder WHERE scheduled_time <= $1 AND sent = FALSE",
-            now
+    async def member_loop(self) -> None:
+        # Names are refreshed in bulk, before cached entries start to expire
+        while True:
+            try:
+                await self.members.populate(self.room_allowlist)
+                await self.clock.sleep(self.config.members["ttl"] * 0.9)
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                self.log.exception("Error refreshing member names")
+                await self.clock.sleep(60)
+    
+    def participants_text(self, user_ids: List[str]) -> str:
+        template = self.config.messages.get("participants", "Coming: {names}")
+        return template.format(names=", ".join(self.members.names(user_ids)))
+    
+    async def retention_loop(self) -> None:
+        while True:
+            try:
+                await self.clock.sleep(self.config.retention["interval_hours"] * 3600)
+                await self.run_retention()
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                self.log.exception("Error in retention job")
+    
+    async def run_retention(self) -> int:
+        retention_config = self.config.retention
+        job = RetentionJob(
+            self.database, self.metrics, self.log.getChild("retention"),
+            days=retention_config["days"],
+            reaction_window_days=self.config.sessions["reaction_window_days"],
+            batch_size=retention_config["batch_size"],
+            clock=self.clock,
         )
+        return await job.run()
+    
+    async def check_pending_reminders(self) -> None:
+        now = self.clock.now()
+        if self.state.ready:
+            next_reminder = self.state.next_reminder_time()
+            if next_reminder is None or next_reminder > now:
+                return
+        
+        # Claimed reminders are ours alone until sent or until the lease expires
+        pending_reminders = await self.claims.claim_due(now)
+        if not pending_reminders:
+            return
+        # One lookup for the whole batch rather than one per reminder
+        sessions = await self.get_sessions([reminder['session_id'] for reminder in pending_reminders])
         
         for reminder in pending_reminders:
             try:
+                session = sessions.get(reminder['session_id'])
                 if reminder['reminder_type'] == "lunch":
-                    await self.send_lunch_reminder(reminder['session_id'])
+                    await self.send_lunch_reminder(reminder['session_id'], session)
                 elif reminder['reminder_type'] == "evening":
-                    await self.send_evening_reminder(reminder['session_id'])
+                    await self.send_evening_reminder(reminder['session_id'], session)
                 
-                await self.database.execute(
-                    "UPDATE scheduled_reminder SET sent = TRUE WHERE id = $1",
-                    reminder['id']
-                )
+                await self.claims.mark_sent(reminder['id'])
+                self.state.remove_reminder(reminder['session_id'], reminder['reminder_type'])
                 
             except Exception as e:
                 self.log.exception(f"Failed to send {reminder['reminder_type']} reminder")
+                try:
+                    # Retry on the next check rather than once the lease expires
+                    await self.claims.release(reminder['id'])
+                except Exception:
+                    self.log.exception(f"Failed to release reminder {reminder['id']}")
     
-    async def send_lunch_reminder(self, session_id: str) -> None:
-        session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE id = $1", session_id
-        )
-        if not session or session['lunch_reminder_sent']:
+    async def send_lunch_reminder(self, session_id: str, session: Optional[Session] = None) -> None:
+        session = session or await self.get_session(session_id)
+        if not session or session.lunch_reminder_sent:
+            return
+        tenant = self.tenants.get(session.tenant_id)
+        if not tenant:
             return
         
         # Check if anyone wants lunch
-        reactions = await self.database.fetch(
-            "SELECT * FROM activity_reaction WHERE session_id = $1", session_id
-        )
-        lunch_people = [r for r in reactions if r['activity'] == "lunch"]
+        reactions = await self.get_reactions(session_id)
+        lunch_people = [r for r in reactions if r.activity == "lunch"]
         
         if not lunch_people:
             return
@@ -452,51 +1238,106 @@ class WallingfordBot(Plugin):
         message = self.config.messages["lunch_reminder"].format(
             lunch_time=self.config.timing["lunch_time"]
         )
+        message = f"{message}\n{self.participants_text([r.user_id for r in lunch_people])}"
         
-        await self.client.send_text(
-            room_id=RoomID(self.config.alex_private_room),
-            text=message
-        )
+        # The flag and the message are committed together, so the reminder goes out exactly once
+        async with self.database.acquire() as conn, conn.transaction():
+            if not await self.sessions.mark_reminder_sent(conn, session_id, "lunch"):
+                self.log.info(f"Lunch reminder for session {session_id} was already sent")
+                return
+            await self.session_log.append(conn, session_id, REMINDER_SENT, reminder_type="lunch")
+            await self.outbox.enqueue(
+                conn, tenant.private_room, message, session_id=session_id, tenant_id=tenant.id
+            )
+        self.outbox.wake()
+        self.state.update_session(session_id, lunch_reminder_sent=True)
+        self.log.info(f"Queued lunch reminder for session {session_id}")
         
-        await self.database.execute(
-            "UPDATE workflow_session SET lunch_reminder_sent = TRUE WHERE id = $1",
-            session_id
+        await self.remind_participants(
+            session, tenant, {r.user_id: message for r in lunch_people}
         )
-        self.log.info(f"Sent lunch reminder for session {session_id}")
     
-    async def send_evening_reminder(self, session_id: str) -> None:
-        session = await self.database.fetchrow(
-            "SELECT * FROM workflow_session WHERE id = $1", session_id
-        )
-        if not session or session['evening_reminder_sent']:
+    async def send_evening_reminder(self, session_id: str, session: Optional[Session] = None) -> None:
+        session = session or await self.get_session(session_id)
+        if not session or session.evening_reminder_sent:
+            return
+        tenant = self.tenants.get(session.tenant_id)
+        if not tenant:
             return
         
-        # Get evening activities that people want
-        reactions = await self.database.fetch(
-            "SELECT * FROM activity_reaction WHERE session_id = $1", session_id
-        )
-        evening_activities = []
-        
-        for reaction in reactions:
-            if reaction['activity'] in ["picnic_dinner", "pub_dinner", "evening_walk", "evening_cycle", "other_fun"]:
-                activity_text = self.config.activities[reaction['activity']]["text"]
-                evening_activities.append(activity_text)
+        # Get evening activities that people want, and who wants them
+        participants = await self.get_participants_by_activity(session_id)
+        evening_activities = {
+            activity: user_ids for activity, user_ids in participants.items()
+            if activity != "lunch" and activity in tenant.activities
+        }
         
         if not evening_activities:
             return
         
-        plans_text = ", ".join(set(evening_activities))  # Remove duplicates
+        plans_text = ", ".join(
+            f"{tenant.activities[activity]['text']} ({', '.join(self.members.names(user_ids))})"
+            for activity, user_ids in evening_activities.items()
+        )
         message = self.config.messages["evening_reminder"].format(
             evening_plans=plans_text
         )
         
-        await self.client.send_text(
-            room_id=RoomID(self.config.alex_private_room),
-            text=message
+        # Quantities follow each activity's headcount
+        items = shopping_list(
+            tenant.activities,
+            {activity: len(user_ids) for activity, user_ids in evening_activities.items()}
         )
+        if items:
+            items_text = "\n".join(f"- {item}" for item in items)
+            template = self.config.messages.get("shopping_list", "Shopping list:\n{items}")
+            message = f"{message}\n{template.format(items=items_text)}"
+        
+        async with self.database.acquire() as conn, conn.transaction():
+            if not await self.sessions.mark_reminder_sent(conn, session_id, "evening"):
+                self.log.info(f"Evening reminder for session {session_id} was already sent")
+                return
+            await self.session_log.append(conn, session_id, REMINDER_SENT, reminder_type="evening")
+            await self.outbox.enqueue(
+                conn, tenant.private_room, message, session_id=session_id, tenant_id=tenant.id
+            )
+        self.outbox.wake()
+        self.state.update_session(session_id, evening_reminder_sent=True)
+        self.log.info(f"Queued evening reminder for session {session_id}")
         
-        await self.database.execute(
-            "UPDATE workflow_session SET evening_reminder_sent = TRUE WHERE id = $1",
-            session_id
+        plans_by_user = {}
+        for activity, user_ids in evening_activities.items():
+            for user_id in user_ids:
+                plans_by_user.setdefault(user_id, []).append(tenant.activities[activity]["text"])
+        template = self.config.messages.get(
+            "participant_evening_reminder", "See you this evening for {plans}!"
         )
-        self.log.info(f"Sent evening reminder for session {session_id}")
\ No newline at end of file
+        await self.remind_participants(session, tenant, {
+            user_id: template.format(plans=", ".join(plans))
+            for user_id, plans in plans_by_user.items()
+        })
+    
+    async def remind_participants(self, session: Session, tenant: Tenant, messages: Dict[str, str]) -> None:
+        if not self.config.participant_reminders["enabled"]:
+            return
+        messages = {
+            UserID(user_id): text for user_id, text in messages.items()
+            if user_id not in (tenant.user_id, self.client.mxid)
+        }
+        if not messages:
+            return
+        default = None
+        if session.group_message_id:
+            default = (tenant.group_room, EventID(session.group_message_id))
+        # Friends are answered under the announcement they reacted to, in its own room
+        threads = await self.reactions.threads(session.id) if self.notifier.mode == "thread" else {}
+        by_thread: Dict[Optional[Tuple[RoomID, EventID]], Dict[UserID, str]] = {}
+        for user_id, text in messages.items():
+            by_thread.setdefault(threads.get(user_id, default), {})[user_id] = text
+        try:
+            delivered = 0
+            for thread, group in by_thread.items():
+                delivered += await self.notifier.notify(group, thread)
+            self.log.info(f"Reminded {delivered} of {len(messages)} participants of session {session.id}")
+        except Exception:
+            self.log.exception(f"Failed to remind participants of session {session.id}")
\ No newline at end of file
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from mautrix.client import Client
+from mautrix.errors import MatrixRequestError
+from mautrix.util.logging import TraceLogger
+
+from .metrics import Metrics
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the homeserver while the circuit is open."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_homeserver_failure(error: BaseException) -> bool:
+    # A rejected request means the homeserver is up and answering
+    if isinstance(error, MatrixRequestError) and 400 <= error.http_status < 500:
+        return error.http_status == 429
+    return True
+
+
+class CircuitBreaker:
+    """Stops calling the homeserver after it has failed repeatedly.
+
+    The circuit starts closed. After ``failure_threshold`` consecutive failures it
+    opens, and calls raise :class:`CircuitOpenError` without touching the network.
+    Once ``reset_timeout`` seconds have passed it is half-open: a single trial call
+    goes through, closing the circuit if it succeeds and opening it again if it
+    fails. Calls slower than ``call_timeout`` count as failures. Client errors such
+    as 403 or 404 are passed on without counting against the homeserver.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        log: TraceLogger,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        call_timeout: Optional[float] = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.metrics = metrics
+        self.log = log
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout or None
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.metrics.set("circuit_state", STATE_VALUES[self.state])
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        trial = self._admit()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), self.call_timeout)
+        except asyncio.CancelledError:
+            if trial:
+                self._trial_in_flight = False
+            raise
+        except Exception as e:
+            if is_homeserver_failure(e):
+                self._record_failure(trial)
+            else:
+                self._record_success(trial)
+            raise
+        self._record_success(trial)
+        return result
+
+    def _admit(self) -> bool:
+        if self.state == "closed":
+            return False
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0:
+                self.metrics.inc("circuit_rejected_total")
+                raise CircuitOpenError(remaining)
+            self._set_state("half_open")
+        if self._trial_in_flight:
+            # Only one trial call at a time while half-open
+            self.metrics.inc("circuit_rejected_total")
+            raise CircuitOpenError(self.reset_timeout)
+        self._trial_in_flight = True
+        return True
+
+    def _record_success(self, trial: bool) -> None:
+        self.failures = 0
+        if trial:
+            self._trial_in_flight = False
+            self._set_state("closed")
+
+    def _record_failure(self, trial: bool) -> None:
+        self.failures += 1
+        if trial:
+            self._trial_in_flight = False
+        if trial or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.opened_at = self.clock()
+            self._set_state("open")
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.log.warning(f"Homeserver circuit {self.state} -> {state}")
+        self.state = state
+        self.metrics.set("circuit_state", STATE_VALUES[state])
+        if state == "open":
+            self.metrics.inc("circuit_opened_total")
+
+
+class GuardedClient:
+    """Sends through a :class:`CircuitBreaker`; everything else goes to the client as is."""
+
+    def __init__(self, client: Client, breaker: CircuitBreaker) -> None:
+        self._client = client
+        self.breaker = breaker
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    async def send_text(self, *args, **kwargs):
+        return await self.breaker.call(self._client.send_text, *args, **kwargs)
+
+    async def send_message(self, *args, **kwargs):
+        return await self.breaker.call(self._client.send_message, *args, **kwargs)
+
+    async def react(self, *args, **kwargs):
+        return await self.breaker.call(self._client.react, *args, **kwargs)
+
+    async def create_room(self, *args, **kwargs):
+        return await self.breaker.call(self._client.create_room, *args, **kwargs)
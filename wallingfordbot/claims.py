@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from typing import List
+
+from mautrix.util.async_db import Database, Scheme
+
+
+class ReminderClaims:
+    """Hands out due reminders so that each is sent by exactly one bot instance.
+
+    Claiming is a single ``UPDATE ... RETURNING``, so two instances can't both take the
+    same reminder; on Postgres ``FOR UPDATE SKIP LOCKED`` also lets them claim disjoint
+    batches without waiting on each other. A claim is a lease: if its instance dies
+    before marking the reminder sent, another instance claims it again once
+    ``lease_seconds`` have passed.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        instance_id: str,
+        lease_seconds: float = 300,
+        batch_size: int = 20,
+    ) -> None:
+        self.database = database
+        self.instance_id = instance_id
+        self.lease = timedelta(seconds=lease_seconds)
+        self.batch_size = max(1, batch_size)
+
+    async def claim_due(self, now: datetime) -> List:
+        skip_locked = "" if self.database.scheme == Scheme.SQLITE else " FOR UPDATE SKIP LOCKED"
+        return await self.database.fetch(
+            "UPDATE scheduled_reminder SET claimed_by = $1, claimed_at = $2 WHERE id IN ("
+            "SELECT id FROM scheduled_reminder WHERE sent = FALSE AND scheduled_time <= $2 "
+            "AND (claimed_by IS NULL OR claimed_at < $3) "
+            f"ORDER BY scheduled_time LIMIT $4{skip_locked}) "
+            "RETURNING id, session_id, reminder_type, scheduled_time",
+            self.instance_id, now, now - self.lease, self.batch_size
+        )
+
+    async def mark_sent(self, reminder_id: int) -> None:
+        await self.database.execute(
+            "UPDATE scheduled_reminder SET sent = TRUE WHERE id = $1 AND claimed_by = $2",
+            reminder_id, self.instance_id
+        )
+
+    async def release(self, reminder_id: int) -> None:
+        await self.database.execute(
+            "UPDATE scheduled_reminder SET claimed_by = NULL, claimed_at = NULL "
+            "WHERE id = $1 AND claimed_by = $2 AND sent = FALSE",
+            reminder_id, self.instance_id
+        )
@@ -0,0 +1,85 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+# Loop passes drain_ready() gives the tasks woken before it: one for a task's own
+# step and one each for two hand-offs it makes, such as completing a future another
+# task awaits, or putting to a queue another task reads
+DRAIN_PASSES = 3
+
+
+async def drain_ready(passes: int = DRAIN_PASSES) -> None:
+    """Runs the callbacks made ready before the call, and those they make ready in turn.
+
+    Resolving a future only schedules the task awaiting it, and whatever that task
+    wakes is scheduled for the event loop's next pass. Each ``sleep(0)`` yields one
+    pass, so when this returns every chain of up to ``passes`` hand-offs has run.
+    """
+    for _ in range(passes):
+        await asyncio.sleep(0)
+
+
+class Clock:
+    """The time of day, deadlines, and the sleeping of background loops.
+
+    Everything that reads the clock or waits goes through a clock, so tests and
+    simulations can substitute a :class:`VirtualClock`. Durations reported as metrics
+    keep using ``time.monotonic``, since they measure real work.
+    """
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def monotonic(self) -> float:
+        # For expiry times and rate limits, which must not move when the wall clock is set
+        return time.monotonic()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when told to.
+
+    ``sleep`` parks the caller until the clock has been advanced past its deadline.
+    ``advance`` wakes sleepers in deadline order, letting each run until it next
+    waits, so a loop that sleeps a minute at a time runs once per simulated minute.
+    """
+
+    def __init__(self, start: datetime) -> None:
+        self._start = start
+        self._now = start
+        self._sleepers: List[Tuple[datetime, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return (self._now - self._start).total_seconds()
+
+    async def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._sleepers, (self._now + timedelta(seconds=seconds), next(self._order), future)
+        )
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        await self.advance_to(self._now + timedelta(seconds=seconds))
+
+    async def advance_to(self, when: datetime) -> None:
+        while self._sleepers and self._sleepers[0][0] <= when:
+            deadline, _, future = heapq.heappop(self._sleepers)
+            self._now = max(self._now, deadline)
+            if not future.done():
+                future.set_result(None)
+            # Let the woken task run up to its next wait before time moves on
+            await drain_ready()
+        self._now = max(self._now, when)
@@ -1,5 +1,8 @@
 from mautrix.util.config import BaseProxyConfig, ConfigUpdateHelper
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+# The tenant that the top-level rooms and users sections describe
+DEFAULT_TENANT_ID = "default"
 
 
 class Config(BaseProxyConfig):
@@ -11,6 +14,21 @@ class Config(BaseProxyConfig):
         helper.copy("confirmation_emojis")
         helper.copy("timing")
         helper.copy("messages")
+        helper.copy("intake")
+        helper.copy("backfill")
+        helper.copy("tenants")
+        helper.copy("retention")
+        helper.copy("export")
+        helper.copy("members")
+        helper.copy("participant_reminders")
+        helper.copy("cluster")
+        helper.copy("outbox")
+        helper.copy("circuit_breaker")
+        helper.copy("recording")
+        helper.copy("sqlite")
+        helper.copy("health")
+        helper.copy("profiling")
+        helper.copy("sessions")
 
     @property
     def alex_private_room(self) -> str:
@@ -42,4 +60,72 @@ class Config(BaseProxyConfig):
     
     @property
     def messages(self) -> Dict[str, str]:
-        return self["messages"]
\ No newline at end of file
+        return self["messages"]
+
+    @property
+    def intake(self) -> Dict[str, Any]:
+        return self["intake"]
+
+    @property
+    def backfill(self) -> Dict[str, Any]:
+        return self["backfill"]
+
+    @property
+    def retention(self) -> Dict[str, Any]:
+        return self["retention"]
+
+    @property
+    def export(self) -> Dict[str, Any]:
+        return self["export"]
+
+    @property
+    def members(self) -> Dict[str, Any]:
+        return self["members"]
+
+    @property
+    def participant_reminders(self) -> Dict[str, Any]:
+        return self["participant_reminders"]
+
+    @property
+    def cluster(self) -> Dict[str, Any]:
+        return self["cluster"]
+
+    @property
+    def outbox(self) -> Dict[str, Any]:
+        return self["outbox"]
+
+    @property
+    def circuit_breaker(self) -> Dict[str, Any]:
+        return self["circuit_breaker"]
+
+    @property
+    def recording(self) -> Dict[str, Any]:
+        return self["recording"]
+
+    @property
+    def sqlite(self) -> Dict[str, Any]:
+        return self["sqlite"]
+
+    @property
+    def health(self) -> Dict[str, Any]:
+        return self["health"]
+
+    @property
+    def profiling(self) -> Dict[str, Any]:
+        return self["profiling"]
+
+    @property
+    def sessions(self) -> Dict[str, Any]:
+        return self["sessions"]
+
+    @property
+    def tenants(self) -> List[Dict[str, Any]]:
+        # Without an explicit tenant list, the rooms and users sections describe one household
+        if self["tenants"]:
+            return self["tenants"]
+        return [{
+            "id": DEFAULT_TENANT_ID,
+            "user_id": self.alex_user_id,
+            "private_room": self.alex_private_room,
+            "group_rooms": self["rooms"].get("group_chats") or [self.group_chat_room],
+        }]
\ No newline at end of file
@@ -0,0 +1,139 @@
+import asyncio
+import html
+import time
+from typing import Dict, Optional, Tuple
+
+from mautrix.client import Client
+from mautrix.types import (
+    EventID, Format, MessageType, RoomCreatePreset, RoomID, TextMessageEventContent, UserID
+)
+from mautrix.util.async_db import Database
+from mautrix.util.logging import TraceLogger
+
+from .clock import Clock
+from .members import MemberCache
+from .metrics import Metrics
+
+
+class RateLimiter:
+    """Spaces out operations so that at most ``rate`` of them start per second."""
+
+    def __init__(self, rate: float, clock: Optional[Clock] = None) -> None:
+        self.interval = 1 / rate if rate > 0 else 0
+        self.clock = clock or Clock()
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        # Each caller reserves the next free slot before sleeping, so no lock is needed
+        now = self.clock.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await self.clock.sleep(slot - now)
+
+
+class ParticipantNotifier:
+    """Delivers reminders to the friends who signed up for an activity.
+
+    In ``dm`` mode each friend gets a direct message; in ``thread`` mode they are
+    mentioned in a thread under the group announcement. Deliveries run concurrently,
+    bounded by ``concurrency`` and spaced by ``rate`` per second to stay clear of
+    homeserver rate limits. DM room IDs are cached in memory and in ``dm_room``, so a
+    room is only ever created once per friend.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        database: Database,
+        members: MemberCache,
+        metrics: Metrics,
+        log: TraceLogger,
+        mode: str = "dm",
+        concurrency: int = 5,
+        rate: float = 10.0,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        self.client = client
+        self.database = database
+        self.members = members
+        self.metrics = metrics
+        self.log = log
+        self.mode = mode
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._limiter = RateLimiter(rate, clock)
+        self._dm_rooms: Dict[UserID, RoomID] = {}
+        self._dm_locks: Dict[UserID, asyncio.Lock] = {}
+
+    async def dm_room(self, user_id: UserID) -> RoomID:
+        room_id = self._dm_rooms.get(user_id)
+        if room_id:
+            return room_id
+        async with self._dm_locks.setdefault(user_id, asyncio.Lock()):
+            if user_id in self._dm_rooms:
+                return self._dm_rooms[user_id]
+            room_id = await self.database.fetchval(
+                "SELECT room_id FROM dm_room WHERE user_id = $1", user_id
+            )
+            if not room_id:
+                await self._limiter.wait()
+                room_id = await self.client.create_room(
+                    preset=RoomCreatePreset.TRUSTED_PRIVATE, is_direct=True, invitees=[user_id]
+                )
+                await self.database.execute(
+                    "INSERT INTO dm_room (user_id, room_id) VALUES ($1, $2) "
+                    "ON CONFLICT (user_id) DO UPDATE SET room_id = excluded.room_id",
+                    user_id, room_id
+                )
+                self.log.info(f"Created DM room {room_id} for {user_id}")
+            self._dm_rooms[user_id] = RoomID(room_id)
+            return self._dm_rooms[user_id]
+
+    async def notify(
+        self,
+        messages: Dict[UserID, str],
+        thread: Optional[Tuple[RoomID, EventID]] = None,
+    ) -> int:
+        started = time.monotonic()
+        # Friends are messaged directly unless in thread mode with an announcement to thread under
+        thread = thread if self.mode == "thread" else None
+        results = await asyncio.gather(*[
+            self._deliver(user_id, text, thread) for user_id, text in messages.items()
+        ], return_exceptions=True)
+        delivered = 0
+        for user_id, result in zip(messages, results):
+            if isinstance(result, Exception):
+                self.log.warning(f"Failed to remind {user_id}: {result}")
+                self.metrics.inc("participant_reminders_failed_total")
+            else:
+                delivered += 1
+        self.metrics.inc("participant_reminders_sent_total", delivered)
+        self.metrics.observe("participant_reminder_fanout_seconds", time.monotonic() - started)
+        return delivered
+
+    async def _deliver(
+        self, user_id: UserID, text: str, thread: Optional[Tuple[RoomID, EventID]]
+    ) -> None:
+        async with self._semaphore:
+            if thread is None:
+                room_id = await self.dm_room(user_id)
+                await self._limiter.wait()
+                await self.client.send_text(room_id=room_id, text=text)
+                return
+            room_id, event_id = thread
+            name = self.members.name(user_id)
+            content = TextMessageEventContent(
+                msgtype=MessageType.TEXT,
+                body=f"{name}: {text}",
+                format=Format.HTML,
+                formatted_body=(
+                    f'<a href="https://matrix.to/#/{html.escape(user_id)}">{html.escape(name)}</a>: '
+                    f"{html.escape(text)}"
+                ),
+            )
+            content["m.mentions"] = {"user_ids": [user_id]}
+            content.set_thread_parent(event_id)
+            await self._limiter.wait()
+            await self.client.send_message(room_id, content)
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from mautrix.util.async_db import Database, Scheme
+
+COLUMNS = [
+    "session_id", "tenant_id", "date", "alex_confirmation", "confirmed",
+    "reaction_id", "user_id", "activity", "emoji", "reacted_at",
+]
+
+_SELECT = (
+    "SELECT s.id AS session_id, s.tenant_id, s.date, s.alex_confirmation, s.confirmed, "
+    "r.id AS reaction_id, r.user_id, r.activity, r.emoji, r.created_at AS reacted_at "
+    "FROM workflow_session s LEFT JOIN activity_reaction r ON r.session_id = s.id "
+    "WHERE s.tenant_id = $1 AND s.date >= $2 AND s.date <= $3"
+)
+_ORDER = " ORDER BY s.date, s.id, COALESCE(r.id, 0)"
+
+
+class HistoryExport:
+    """Streams a household's sessions joined with their reactions, oldest first.
+
+    Sessions without reactions appear once with empty reaction columns. On Postgres
+    the rows come from a server-side cursor. SQLite shares a single connection with
+    event handling, so there the rows are read in keyset-paginated chunks instead,
+    and the connection is released between chunks. Either way only one chunk is held
+    in memory at a time.
+    """
+
+    def __init__(self, database: Database, chunk_size: int = 500) -> None:
+        self.database = database
+        self.chunk_size = max(1, chunk_size)
+
+    async def chunks(
+        self, tenant_id: str, since: str, until: str
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        if self.database.scheme == Scheme.SQLITE:
+            rows = self._paginate(tenant_id, since, until)
+        else:
+            rows = self._cursor(tenant_id, since, until)
+        async for chunk in rows:
+            yield [dict(zip(COLUMNS, row)) for row in chunk]
+
+    async def _cursor(self, tenant_id: str, since: str, until: str) -> AsyncIterator[list]:
+        async with self.database.acquire() as conn, conn.transaction():
+            cursor = await conn.wrapped.cursor(_SELECT + _ORDER, tenant_id, since, until)
+            while chunk := await cursor.fetch(self.chunk_size):
+                yield chunk
+
+    async def _paginate(self, tenant_id: str, since: str, until: str) -> AsyncIterator[list]:
+        last: Optional[tuple] = None
+        while True:
+            if last is None:
+                chunk = await self.database.fetch(
+                    _SELECT + _ORDER + " LIMIT $4", tenant_id, since, until, self.chunk_size
+                )
+            else:
+                chunk = await self.database.fetch(
+                    _SELECT + " AND (s.date, s.id, COALESCE(r.id, 0)) > ($4, $5, $6)"
+                    + _ORDER + " LIMIT $7",
+                    tenant_id, since, until, *last, self.chunk_size
+                )
+            if not chunk:
+                return
+            yield chunk
+            tail = chunk[-1]
+            last = (tail['date'], tail['session_id'], tail['reaction_id'] or 0)
+            if len(chunk) < self.chunk_size:
+                return
+
+
+def format_ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows).encode("utf-8")
+
+
+def format_csv(rows: List[Dict[str, Any]], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
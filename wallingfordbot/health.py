@@ -0,0 +1,132 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from mautrix.util.async_db import Database
+from mautrix.util.logging import TraceLogger
+
+from .clock import Clock
+from .metrics import Metrics
+
+
+def task_state(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "not_started"
+    if not task.done():
+        return "running"
+    if task.cancelled():
+        return "cancelled"
+    return "failed" if task.exception() else "finished"
+
+
+def isoformat(value: Any) -> Optional[str]:
+    # SQLite hands timestamps back as text, Postgres as datetimes
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class HealthMonitor:
+    """Keeps what ``/health`` and ``/ready`` report, so answering them runs no queries.
+
+    :meth:`run` probes the database every ``interval`` seconds: it times a trivial
+    query, then reads the outbox backlog and the next pending reminder. Background
+    loops call :meth:`heartbeat` once per iteration; one that has not done so for
+    ``stale_after`` seconds is reported as stalled even while its task is alive.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        metrics: Metrics,
+        log: TraceLogger,
+        interval: float = 5,
+        timeout: float = 2,
+        stale_after: float = 180,
+        clock: Clock = Clock(),
+    ) -> None:
+        self.database = database
+        self.metrics = metrics
+        self.log = log
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.clock = clock
+        self.db_ok = False
+        self.db_latency: Optional[float] = None
+        self.db_error: Optional[str] = None
+        self.checked_at: Optional[datetime] = None
+        self.outbox_pending: Optional[int] = None
+        self.next_reminder: Any = None
+        self.heartbeats: Dict[str, datetime] = {}
+        self.errors: Dict[str, str] = {}
+
+    def heartbeat(self, name: str) -> None:
+        self.heartbeats[name] = self.clock.now()
+
+    def record_error(self, name: str, error: BaseException) -> None:
+        self.errors[name] = f"{type(error).__name__}: {error}"
+        self.metrics.inc("loop_errors_total", loop=name)
+
+    def heartbeat_age(self, name: str) -> Optional[float]:
+        beat = self.heartbeats.get(name)
+        return (self.clock.now() - beat).total_seconds() if beat else None
+
+    def is_stalled(self, name: str) -> bool:
+        age = self.heartbeat_age(name)
+        return age is None or age > self.stale_after
+
+    @property
+    def probe_age(self) -> Optional[float]:
+        return (self.clock.now() - self.checked_at).total_seconds() if self.checked_at else None
+
+    @property
+    def database_healthy(self) -> bool:
+        # A probe that stopped running says nothing about the database any more
+        age = self.probe_age
+        return self.db_ok and age is not None and age <= max(3 * self.interval, self.timeout)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.probe()
+                await self.clock.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                self.log.exception("Error in health probe")
+                await self.clock.sleep(self.interval)
+
+    async def probe(self) -> None:
+        started = time.monotonic()
+        try:
+            async with self.database.acquire() as conn:
+                await asyncio.wait_for(conn.fetchval("SELECT 1"), self.timeout)
+                latency = time.monotonic() - started
+                self.outbox_pending = await conn.fetchval(
+                    "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+                )
+                self.next_reminder = await conn.fetchval(
+                    "SELECT MIN(scheduled_time) FROM scheduled_reminder WHERE sent = FALSE"
+                )
+        except Exception as e:
+            if self.db_ok:
+                self.log.warning(f"Database probe failed: {e!r}")
+            self.db_ok = False
+            self.db_error = f"{type(e).__name__}: {e}"
+        else:
+            self.db_ok = True
+            self.db_error = None
+            self.db_latency = latency
+            self.metrics.set("db_latency_seconds", latency)
+        self.checked_at = self.clock.now()
+        self.metrics.set("db_up", 1 if self.db_ok else 0)
+
+    def database_report(self) -> Dict[str, Any]:
+        return {
+            "ok": self.database_healthy,
+            "latency_ms": round(self.db_latency * 1000, 3) if self.db_latency is not None else None,
+            "checked_seconds_ago": round(self.probe_age, 1) if self.probe_age is not None else None,
+            "error": self.db_error,
+        }
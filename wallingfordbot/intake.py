@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Tuple
+
+from mautrix.types import Event
+from mautrix.util.logging import TraceLogger
+
+from .metrics import Metrics
+
+QueuedEvent = Tuple[float, bool, Event]
+
+
+class _Shard:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.items: Deque[QueuedEvent] = deque()
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.items) >= self.capacity
+
+    def put(self, item: QueuedEvent) -> None:
+        self.items.append(item)
+        self.not_empty.set()
+        if self.full:
+            self.not_full.clear()
+
+    async def get(self) -> QueuedEvent:
+        while not self.items:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        item = self.items.popleft()
+        self.not_full.set()
+        return item
+
+    async def wait_not_full(self) -> None:
+        while self.full:
+            await self.not_full.wait()
+
+    def evict_irrelevant(self) -> bool:
+        for item in self.items:
+            if not item[1]:
+                self.items.remove(item)
+                self.not_full.set()
+                return True
+        return False
+
+
+class EventIntake:
+    """Bounded queue in front of the event handlers, served by a pool of workers.
+
+    Events are sharded by room ID, and each shard is drained by exactly one worker, so
+    the events of a room are handled in the order they arrived: a reaction and its
+    later redaction share a room, though not a target event. A session spans several
+    rooms (Alex's and each group room), and its events in different rooms may be handled
+    concurrently; every handler makes its change in its own transaction, and reactions
+    find their session through the message they react to. When a shard is full,
+    irrelevant events are shed first; a relevant event may evict a queued irrelevant
+    one, and otherwise waits up to ``overflow_timeout`` seconds for space before it is
+    dropped.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Event], Awaitable[None]],
+        is_relevant: Callable[[Event], bool],
+        metrics: Metrics,
+        log: TraceLogger,
+        workers: int = 4,
+        max_size: int = 1000,
+        overflow_timeout: float = 5.0,
+    ) -> None:
+        self.handler = handler
+        self.is_relevant = is_relevant
+        self.metrics = metrics
+        self.log = log
+        self.overflow_timeout = overflow_timeout
+        workers = max(1, workers)
+        capacity = max(1, -(-max_size // workers))
+        self._shards: List[_Shard] = [_Shard(capacity) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(len(shard.items) for shard in self._shards)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work(shard)) for shard in self._shards]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, event: Event) -> bool:
+        relevant = self.is_relevant(event)
+        shard = self._shards[hash(event.room_id) % len(self._shards)]
+        try:
+            async with asyncio.timeout(self.overflow_timeout):
+                # Freeing a slot wakes every waiter, so capacity is checked again
+                # before each put: another waiter may already have taken it
+                while shard.full:
+                    if not relevant:
+                        self._shed("irrelevant")
+                        return False
+                    if shard.evict_irrelevant():
+                        self._shed("evicted")
+                    else:
+                        await shard.wait_not_full()
+        except TimeoutError:
+            self.log.warning(f"Intake queue full, dropping event {event.event_id}")
+            self._shed("overflow")
+            return False
+        shard.put((time.monotonic(), relevant, event))
+        self.metrics.set("intake_queue_depth", self.depth)
+        return True
+
+    def _shed(self, reason: str) -> None:
+        self.metrics.inc("intake_shed_total", reason=reason)
+
+    async def _work(self, shard: _Shard) -> None:
+        while True:
+            enqueued_at, _, event = await shard.get()
+            self.metrics.observe("intake_lag_seconds", time.monotonic() - enqueued_at)
+            self.metrics.set("intake_queue_depth", self.depth)
+            try:
+                await self.handler(event)
+            except Exception:
+                self.log.exception(f"Error handling queued event {event.event_id}")
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable
+
+from mautrix.util.async_db import Database
+from mautrix.util.logging import TraceLogger
+
+from .clock import Clock
+from .metrics import Metrics
+
+
+class LeaderElection:
+    """Elects one instance to run the singleton background tasks.
+
+    Leadership is a lease row in ``leader_lease`` that the leader renews every third of
+    the lease. Taking or renewing the lease is a single upsert that only succeeds for
+    the current holder or once the lease has expired, so at most one instance holds it.
+    If the leader dies, another instance takes over within ``lease_seconds``; a leader
+    that stops cleanly resigns so the takeover is immediate.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        instance_id: str,
+        metrics: Metrics,
+        log: TraceLogger,
+        on_elected: Callable[[], None],
+        on_deposed: Callable[[], None],
+        name: str = "singleton",
+        lease_seconds: float = 30,
+        clock: Clock = Clock(),
+    ) -> None:
+        self.database = database
+        self.instance_id = instance_id
+        self.metrics = metrics
+        self.log = log
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.name = name
+        self.lease = timedelta(seconds=lease_seconds)
+        self.clock = clock
+        self.is_leader = False
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self._set_leader(await self.campaign(self.clock.now()))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Without a renewal the lease may be lost at any moment, so step down
+                self.log.exception("Leader election failed")
+                self._set_leader(False)
+            await self.clock.sleep(self.lease.total_seconds() / 3)
+
+    async def campaign(self, now: datetime) -> bool:
+        holder = await self.database.fetchval(
+            "INSERT INTO leader_lease (name, holder, expires_at) VALUES ($1, $2, $3) "
+            "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leader_lease.holder = excluded.holder OR leader_lease.expires_at < $4 "
+            "RETURNING holder",
+            self.name, self.instance_id, now + self.lease, now
+        )
+        return holder == self.instance_id
+
+    async def resign(self) -> None:
+        self._set_leader(False)
+        await self.database.execute(
+            "DELETE FROM leader_lease WHERE name = $1 AND holder = $2", self.name, self.instance_id
+        )
+
+    def _set_leader(self, is_leader: bool) -> None:
+        self.metrics.set("leader", int(is_leader))
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        self.metrics.inc("leader_changes_total")
+        if is_leader:
+            self.log.info(f"Instance {self.instance_id} is now the leader")
+            self.on_elected()
+        else:
+            self.log.info(f"Instance {self.instance_id} is no longer the leader")
+            self.on_deposed()
@@ -0,0 +1,85 @@
+import asyncio
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from mautrix.client import Client
+from mautrix.types import Membership, RoomID, StateEvent, UserID
+from mautrix.util.logging import TraceLogger
+
+from .clock import Clock
+
+
+class MemberCache:
+    """LRU cache of member display names with a time-to-live.
+
+    Names are loaded in bulk from the joined member lists of the configured rooms and
+    kept current from ``m.room.member`` events, so rendering a message never waits on
+    a profile lookup. Users that aren't cached are named by their localpart.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        log: TraceLogger,
+        max_size: int = 1000,
+        ttl: float = 3600,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        self.client = client
+        self.log = log
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.clock = clock or Clock()
+        self._names: "OrderedDict[UserID, Tuple[str, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def put(self, user_id: UserID, displayname: Optional[str]) -> None:
+        if not displayname:
+            self._names.pop(user_id, None)
+            return
+        self._names[user_id] = (displayname, self.clock.monotonic() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    def get(self, user_id: UserID) -> Optional[str]:
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        displayname, expires_at = entry
+        if expires_at < self.clock.monotonic():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return displayname
+
+    def name(self, user_id: UserID) -> str:
+        return self.get(user_id) or user_id.lstrip("@").split(":", 1)[0]
+
+    def names(self, user_ids: Iterable[UserID]) -> List[str]:
+        return [self.name(user_id) for user_id in dict.fromkeys(user_ids)]
+
+    def handle_member_event(self, event: StateEvent) -> None:
+        user_id = UserID(event.state_key)
+        if event.content.membership == Membership.JOIN:
+            self.put(user_id, event.content.displayname)
+        else:
+            self._names.pop(user_id, None)
+
+    async def populate(self, room_ids: Iterable[RoomID]) -> int:
+        room_ids = list(room_ids)
+        results = await asyncio.gather(*[
+            self.client.get_joined_members(room_id) for room_id in room_ids
+        ], return_exceptions=True)
+        loaded = 0
+        for room_id, members in zip(room_ids, results):
+            if isinstance(members, Exception):
+                self.log.warning(f"Failed to load members of {room_id}: {members}")
+                continue
+            for user_id, member in members.items():
+                self.put(user_id, member.displayname)
+                loaded += 1
+        self.log.debug(f"Loaded {loaded} member names from {len(room_ids)} rooms")
+        return loaded
@@ -0,0 +1,80 @@
+from typing import Dict, List, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+MetricKey = Tuple[str, LabelSet]
+
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{{{inner}}}"
+
+
+class Metrics:
+    def __init__(self, prefix: str = "wallingfordbot") -> None:
+        self.prefix = prefix
+        self.counters: Dict[MetricKey, float] = {}
+        self.gauges: Dict[MetricKey, float] = {}
+        # name -> [count, sum, max]
+        self.summaries: Dict[MetricKey, List[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _key(name, labels)
+        summary = self.summaries.get(key)
+        if summary is None:
+            self.summaries[key] = [1, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            if value > summary[2]:
+                summary[2] = value
+
+    def get(self, name: str, **labels: str) -> float:
+        key = _key(name, labels)
+        if key in self.counters:
+            return self.counters[key]
+        if key in self.gauges:
+            return self.gauges[key]
+        if key in self.summaries:
+            return self.summaries[key][0]
+        return 0.0
+
+    def render(self) -> str:
+        lines: List[str] = []
+        seen_types = set()
+
+        def type_line(name: str, kind: str) -> None:
+            if name not in seen_types:
+                seen_types.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            full_name = f"{self.prefix}_{name}"
+            type_line(full_name, "counter")
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            full_name = f"{self.prefix}_{name}"
+            type_line(full_name, "gauge")
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for (name, labels), (count, total, maximum) in sorted(self.summaries.items()):
+            full_name = f"{self.prefix}_{name}"
+            type_line(full_name, "summary")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+        for (name, labels), (count, total, maximum) in sorted(self.summaries.items()):
+            full_name = f"{self.prefix}_{name}_max"
+            type_line(full_name, "gauge")
+            lines.append(f"{full_name}{_format_labels(labels)} {maximum}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from mautrix.client import Client
+from mautrix.errors import MatrixRequestError
+from mautrix.types import EventID, RoomID
+from mautrix.util.async_db import Connection, Database, Scheme
+from mautrix.util.logging import TraceLogger
+
+from .breaker import CircuitOpenError
+from .clock import Clock
+from .metrics import Metrics
+
+DeliveryHook = Callable[[Connection, dict, EventID], Awaitable[None]]
+
+
+def is_permanent(error: Exception) -> bool:
+    # The homeserver rejected the message itself; sending it again won't help
+    return (
+        isinstance(error, MatrixRequestError)
+        and 400 <= error.http_status < 500
+        and error.http_status != 429
+    )
+
+
+class Outbox:
+    """Delivers outgoing messages that were written to the ``outbox`` table.
+
+    Messages are enqueued on the caller's connection, in the same transaction as the
+    state change that caused them, so either both are committed or neither is. The
+    drainer claims due messages in batches and sends them, one room at a time in order
+    and different rooms concurrently. A failed message is retried with exponential
+    backoff; once it has failed ``max_attempts`` times, or the homeserver rejects it
+    outright, it is parked with status ``parked`` for someone to look at. Delivery is
+    at-least-once, but retries reuse the transaction ID so the homeserver can drop
+    duplicates. Transaction IDs are drawn when a message is enqueued and carry
+    ``txn_prefix``, so they never repeat across plugin instances sharing a client or
+    across a rebuilt outbox table.
+
+    Claiming works like reminder claims: ``next_attempt_at`` doubles as the lease, so
+    several instances can drain the same table.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        client: Client,
+        metrics: Metrics,
+        log: TraceLogger,
+        instance_id: str,
+        on_delivered: Optional[DeliveryHook] = None,
+        batch_size: int = 20,
+        lease_seconds: float = 60,
+        base_delay: float = 5,
+        max_delay: float = 900,
+        max_attempts: int = 8,
+        poll_interval: float = 30,
+        txn_prefix: str = "wallingfordbot",
+        clock: Clock = Clock(),
+    ) -> None:
+        self.database = database
+        self.client = client
+        self.metrics = metrics
+        self.log = log
+        self.instance_id = instance_id
+        self.on_delivered = on_delivered
+        self.batch_size = max(1, batch_size)
+        self.lease = timedelta(seconds=lease_seconds)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.txn_prefix = txn_prefix
+        self.clock = clock
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(
+        self,
+        conn: Connection,
+        room_id: RoomID,
+        body: str,
+        kind: str = "text",
+        session_id: Optional[str] = None,
+        reactions: Iterable[str] = (),
+        tenant_id: Optional[str] = None,
+    ) -> None:
+        txn_id = "-".join(filter(None, (self.txn_prefix, tenant_id, uuid.uuid4().hex)))
+        await conn.execute(
+            "INSERT INTO outbox (session_id, room_id, kind, body, reactions, next_attempt_at, txn_id) "
+            "VALUES ($1, $2, $3, $4, $5, $6, $7)",
+            session_id, room_id, kind, body, json.dumps(list(reactions)), self.clock.now(), txn_id
+        )
+
+    def wake(self) -> None:
+        # Called once the enqueuing transaction has committed
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._wait_for_work()
+                self._wakeup.clear()
+                # A full batch means more may be waiting
+                while await self.drain(self.clock.now()) == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                self.log.exception("Error draining outbox")
+
+    async def _wait_for_work(self) -> None:
+        waits = [
+            asyncio.ensure_future(self._wakeup.wait()),
+            asyncio.ensure_future(self.clock.sleep(self.poll_interval)),
+        ]
+        try:
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+
+    async def claim(self, now: datetime) -> List:
+        skip_locked = "" if self.database.scheme == Scheme.SQLITE else " FOR UPDATE SKIP LOCKED"
+        return await self.database.fetch(
+            "UPDATE outbox SET claimed_by = $1, next_attempt_at = $2 WHERE id IN ("
+            "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= $3 "
+            f"ORDER BY id LIMIT $4{skip_locked}) "
+            "RETURNING id, session_id, room_id, kind, body, reactions, attempts, txn_id",
+            self.instance_id, now + self.lease, now, self.batch_size
+        )
+
+    async def drain(self, now: datetime) -> int:
+        messages = sorted(await self.claim(now), key=lambda message: message['id'])
+        by_room: Dict[str, List] = {}
+        for message in messages:
+            by_room.setdefault(message['room_id'], []).append(message)
+        await asyncio.gather(*[self._deliver_in_order(batch) for batch in by_room.values()])
+        return len(messages)
+
+    async def _deliver_in_order(self, messages: List) -> None:
+        for message in messages:
+            try:
+                await self.deliver(message)
+            except Exception:
+                # Its lease runs out and it is claimed again
+                self.log.exception(f"Failed to record outcome of outbox message {message['id']}")
+
+    async def deliver(self, message) -> bool:
+        message = dict(message)
+        started = time.monotonic()
+        try:
+            event_id = await self.client.send_text(
+                room_id=message['room_id'],
+                text=message['body'],
+                # Messages queued before transaction IDs were stored fall back to their row ID
+                txn_id=message['txn_id'] or f"{self.txn_prefix}-outbox-{message['id']}",
+            )
+        except Exception as e:
+            await self._failed(message, e)
+            return False
+        self.metrics.observe("outbox_delivery_seconds", time.monotonic() - started)
+
+        # The message counts as delivered even if seeding its reactions fails
+        try:
+            for emoji in json.loads(message['reactions']):
+                await self.client.react(room_id=message['room_id'], event_id=event_id, key=emoji)
+        except Exception as e:
+            self.log.exception(f"Failed to seed reactions in {message['room_id']}: {e}")
+
+        async with self.database.acquire() as conn, conn.transaction():
+            await conn.execute(
+                "UPDATE outbox SET status = 'sent', event_id = $1, sent_at = $2 WHERE id = $3",
+                str(event_id), self.clock.now(), message['id']
+            )
+            if self.on_delivered:
+                await self.on_delivered(conn, message, event_id)
+        self.metrics.inc("outbox_sent_total", kind=message['kind'])
+        return True
+
+    async def _failed(self, message: dict, error: Exception) -> None:
+        if isinstance(error, CircuitOpenError):
+            # The homeserver is being left to recover, which is no fault of the message
+            await self.database.execute(
+                "UPDATE outbox SET next_attempt_at = $1 WHERE id = $2 AND claimed_by = $3",
+                self.clock.now() + timedelta(seconds=error.retry_after), message['id'], self.instance_id
+            )
+            return
+        attempts = message['attempts'] + 1
+        if attempts >= self.max_attempts or is_permanent(error):
+            self.log.error(
+                f"Parking outbox message {message['id']} to {message['room_id']} after "
+                f"{attempts} attempts: {error}"
+            )
+            await self.database.execute(
+                "UPDATE outbox SET status = 'parked', attempts = $1, last_error = $2 "
+                "WHERE id = $3 AND claimed_by = $4",
+                attempts, str(error), message['id'], self.instance_id
+            )
+            self.metrics.inc("outbox_parked_total", kind=message['kind'])
+            return
+        # Jittered so that messages failing together don't retry together
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+        self.log.warning(
+            f"Failed to send outbox message {message['id']} to {message['room_id']}, "
+            f"retrying in {delay:.0f}s: {error}"
+        )
+        await self.database.execute(
+            "UPDATE outbox SET attempts = $1, last_error = $2, next_attempt_at = $3 "
+            "WHERE id = $4 AND claimed_by = $5",
+            attempts, str(error), self.clock.now() + timedelta(seconds=delay), message['id'], self.instance_id
+        )
+        self.metrics.inc("outbox_failures_total", kind=message['kind'])
@@ -0,0 +1,120 @@
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def format_collapsed(counts: Counter) -> str:
+    # One "outermost;...;innermost count" line per stack, as flamegraph.pl and speedscope read it
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class Profiler:
+    """Profiles the running bot on request, one profile at a time.
+
+    Nothing is hooked in between requests, so there is no overhead while idle. A
+    profile covers ``seconds`` of whatever the event loop does meanwhile:
+
+    * :meth:`cpu_profile` runs ``cProfile`` and returns its stats in the format
+      ``pstats`` and snakeviz load.
+    * :meth:`sample_stacks` reads the event loop thread's stack from a second thread
+      every ``sample_interval`` seconds and returns collapsed stacks for flame graphs.
+      Sampling costs far less than ``cProfile``, so it suits longer windows.
+    * :meth:`memory_diff` compares two ``tracemalloc`` snapshots taken ``seconds``
+      apart. Tracing is stopped again afterwards unless it was already running.
+    """
+
+    def __init__(self, sample_interval: float = 0.005, memory_top: int = 50) -> None:
+        self.sample_interval = sample_interval
+        self.memory_top = memory_top
+        self.busy = False
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        # A second request is refused rather than queued behind the first
+        if self.busy:
+            raise ProfilerBusy("A profile is already running")
+        self.busy = True
+        try:
+            yield
+        finally:
+            self.busy = False
+
+    async def cpu_profile(self, seconds: float) -> bytes:
+        with self._exclusive():
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Another profiler, such as a debugger or coverage, owns the hooks
+                raise ProfilerBusy(str(e)) from e
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+            profile.create_stats()
+            return marshal.dumps(profile.stats)
+
+    async def sample_stacks(self, seconds: float) -> str:
+        with self._exclusive():
+            counts: Counter = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(), stop, counts),
+                name="wallingfordbot-sampler", daemon=True,
+            )
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+            return format_collapsed(counts)
+
+    def _sample(self, thread_id: int, stop: threading.Event, counts: Counter) -> None:
+        while not stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                counts[";".join(reversed(stack))] += 1
+
+    async def memory_diff(self, seconds: float) -> str:
+        with self._exclusive():
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start()
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if not was_tracing:
+                    tracemalloc.stop()
+            # Allocations made by tracemalloc itself would dominate the diff otherwise
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+            lines = [
+                f"Traced memory: {current / 1024:.1f} KiB current, {peak / 1024:.1f} KiB peak",
+                f"Top {self.memory_top} allocation sites by growth over {seconds:g}s:",
+            ]
+            lines.extend(str(stat) for stat in stats[:self.memory_top])
+            return "\n".join(lines) + "\n"
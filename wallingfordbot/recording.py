@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from .clock import Clock
+
+
+class EventRecorder:
+    """Appends what the bot handles to an NDJSON file, one record per line.
+
+    Each record has the time handling started (``at``, the recorder's clock at the
+    time of recording unless given), a ``kind`` (``webhook``, ``reaction``,
+    ``redaction`` or ``delivered``), the handler's ``latency`` in seconds and the
+    ``data`` needed to feed it back in: the webhook body or the serialised event.
+    ``delivered`` records map outgoing messages to the event IDs the homeserver gave
+    them, so a replay can hand out the same IDs and recorded reactions still point at
+    the bot's messages. The file is only ever appended to.
+    """
+
+    def __init__(self, path: str, clock: Optional[Clock] = None) -> None:
+        self.path = path
+        self.clock = clock or Clock()
+        # Line buffered, so a record is on disk as soon as it is complete
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def record(
+        self, kind: str, data: Dict[str, Any], at: Optional[datetime] = None, latency: float = 0.0
+    ) -> None:
+        at = at or self.clock.now()
+        self._file.write(json.dumps(
+            {"at": at.isoformat(), "kind": kind, "latency": round(latency, 6), "data": data},
+            ensure_ascii=False, separators=(",", ":"),
+        ) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_recording(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record["at"] = datetime.fromisoformat(record["at"])
+            yield record
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from mautrix.types import ReactionEvent, RedactionEvent
+from mautrix.util.async_db import Database
+
+from .db import upgrade_table
+from .recording import read_recording
+from .simulation import DaySimulation, load_config
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {"count": len(ordered), "p50": percentile(0.5), "p95": percentile(0.95), "max": ordered[-1]}
+
+
+class Replay:
+    """Feeds a recording back into a simulated bot and times its handlers.
+
+    Webhook calls go to ``process_webhook`` and room events to the same dispatcher the
+    intake workers use, against SQLite and a fake homeserver that hands out the event
+    IDs the real one did. The virtual clock follows the recorded timestamps, so handlers
+    see the same dates as in the original run. With ``speed`` 1 the events arrive with
+    their recorded spacing, with ``speed`` N that spacing is divided by N, and with 0
+    they are fed in as fast as the handlers take them.
+    """
+
+    def __init__(self, simulation: DaySimulation, speed: float = 1.0) -> None:
+        self.simulation = simulation
+        self.speed = speed
+
+    async def run(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        inputs = [record for record in records if record["kind"] != "delivered"]
+        recorded: Dict[str, List[float]] = {}
+        replayed: Dict[str, List[float]] = {}
+        started = time.monotonic()
+        for record in inputs:
+            if self.speed > 0:
+                # Scheduled from the start rather than the previous event, so delays don't add up
+                offset = (record["at"] - inputs[0]["at"]).total_seconds() / self.speed
+                await asyncio.sleep(max(0.0, started + offset - time.monotonic()))
+            await self.simulation.clock.advance_to(record["at"])
+            handled = time.monotonic()
+            await self.dispatch(record)
+            replayed.setdefault(record["kind"], []).append(time.monotonic() - handled)
+            recorded.setdefault(record["kind"], []).append(record["latency"])
+            await self.simulation.deliver()
+        elapsed = time.monotonic() - started
+
+        span = (inputs[-1]["at"] - inputs[0]["at"]).total_seconds() if inputs else 0.0
+        return {
+            "events": len(inputs),
+            "recorded_seconds": span,
+            "replay_seconds": elapsed,
+            "recorded_throughput": len(inputs) / span if span else 0.0,
+            "replay_throughput": len(inputs) / elapsed if elapsed else 0.0,
+            "latency": {
+                kind: {"recorded": latency_summary(recorded[kind]), "replay": latency_summary(replayed[kind])}
+                for kind in recorded
+            },
+        }
+
+    async def dispatch(self, record: Dict[str, Any]) -> None:
+        bot = self.simulation.bot
+        if record["kind"] == "webhook":
+            await bot.process_webhook(record["data"])
+        elif record["kind"] == "reaction":
+            await bot.dispatch_queued_event(ReactionEvent.deserialize(record["data"]))
+        elif record["kind"] == "redaction":
+            await bot.dispatch_queued_event(RedactionEvent.deserialize(record["data"]))
+
+
+def delivered_event_ids(records: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    event_ids: Dict[str, List[str]] = {}
+    for record in records:
+        if record["kind"] == "delivered":
+            event_ids.setdefault(record["data"]["room_id"], []).append(record["data"]["event_id"])
+    return event_ids
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a WallingfordBot recording against SQLite")
+    parser.add_argument("recording")
+    parser.add_argument("--config", help="instance config the recording was made with")
+    parser.add_argument("--base-config", default="base-config.yaml")
+    parser.add_argument("--speed", type=float, default=1.0, help="N times recorded speed, 0 for unpaced")
+    args = parser.parse_args()
+
+    records = list(read_recording(args.recording))
+    if not records:
+        parser.error("The recording is empty")
+    config = load_config(args.base_config, args.config)
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database.create(f"sqlite:{directory}/replay.db", upgrade_table=upgrade_table)
+        await database.start()
+        try:
+            simulation = await DaySimulation.create(
+                config, database, records[0]["at"].date(), event_ids=delivered_event_ids(records)
+            )
+            report = await Replay(simulation, args.speed).run(records)
+        finally:
+            await database.stop()
+
+    print(
+        f"{report['events']} events: recorded over {report['recorded_seconds']:.1f}s "
+        f"({report['recorded_throughput']:.2f}/s), replayed in {report['replay_seconds']:.2f}s "
+        f"({report['replay_throughput']:.2f}/s)"
+    )
+    for kind, latency in report["latency"].items():
+        for run in ("recorded", "replay"):
+            summary = latency[run]
+            print(
+                f"  {kind:<10} {run:<9} n={summary['count']:<6} p50={summary['p50'] * 1000:.2f}ms "
+                f"p95={summary['p95'] * 1000:.2f}ms max={summary['max'] * 1000:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,333 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from mautrix.util.async_db import Connection, Database, Scheme
+
+# One statement per operation, so each is prepared once per connection and cached by its
+# text; lists are bound through fetch_in, whose text doesn't depend on their length
+_SESSION_COLUMNS = (
+    "id, tenant_id, date, alex_confirmation, confirmed, group_message_id, "
+    "confirmation_event_id, lunch_reminder_sent, evening_reminder_sent"
+)
+_GET_SESSION = f"SELECT {_SESSION_COLUMNS} FROM workflow_session WHERE id = $1"
+_GET_SESSIONS = f"SELECT {_SESSION_COLUMNS} FROM workflow_session WHERE id {{}}"
+_SESSION_FOR_DATE = f"SELECT {_SESSION_COLUMNS} FROM workflow_session WHERE tenant_id = $1 AND date = $2"
+_SESSIONS_SINCE = f"SELECT {_SESSION_COLUMNS} FROM workflow_session WHERE date >= $1"
+_INSERT_SESSION = "INSERT INTO workflow_session (id, tenant_id, date) VALUES ($1, $2, $3)"
+_DELETE_SESSIONS_FOR_DATE = "DELETE FROM workflow_session WHERE tenant_id = $1 AND date = $2"
+_SET_CHOICE = "UPDATE workflow_session SET alex_confirmation = $1, confirmed = $2 WHERE id = $3"
+_CONFIRM = (
+    "UPDATE workflow_session SET alex_confirmation = $1, confirmed = TRUE "
+    "WHERE id = $2 AND confirmed = FALSE RETURNING id"
+)
+_SET_CONFIRMATION_EVENT = "UPDATE workflow_session SET confirmation_event_id = $1 WHERE id = $2"
+_SET_GROUP_MESSAGE = (
+    "UPDATE workflow_session SET group_message_id = $1 "
+    "WHERE id = $2 AND group_message_id IS NULL RETURNING id"
+)
+_MARK_REMINDER_SENT = {
+    "lunch": (
+        "UPDATE workflow_session SET lunch_reminder_sent = TRUE "
+        "WHERE id = $1 AND lunch_reminder_sent = FALSE RETURNING id"
+    ),
+    "evening": (
+        "UPDATE workflow_session SET evening_reminder_sent = TRUE "
+        "WHERE id = $1 AND evening_reminder_sent = FALSE RETURNING id"
+    ),
+}
+
+_REACTIONS_FOR_SESSION = (
+    "SELECT session_id, user_id, activity, event_id FROM activity_reaction WHERE session_id = $1"
+)
+_REACTIONS_SINCE = (
+    "SELECT r.session_id, r.user_id, r.activity, r.event_id FROM activity_reaction r "
+    "JOIN workflow_session s ON s.id = r.session_id WHERE s.date >= $1"
+)
+_REACTIONS_FOR_DATE = (
+    "SELECT r.session_id, s.tenant_id, r.user_id, r.activity, s.date FROM activity_reaction r "
+    "JOIN workflow_session s ON s.id = r.session_id WHERE s.tenant_id = $1 AND s.date = $2"
+)
+_REACTION_BY_EVENT = (
+    "SELECT r.session_id, s.tenant_id, r.user_id, r.activity, s.date FROM activity_reaction r "
+    "JOIN workflow_session s ON s.id = r.session_id WHERE r.event_id = $1"
+)
+_EXISTING_REACTIONS = "SELECT event_id FROM activity_reaction WHERE event_id {}"
+_INSERT_REACTION = (
+    "INSERT INTO activity_reaction (session_id, user_id, activity, emoji, event_id, target_event_id) "
+    "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (event_id) DO NOTHING"
+)
+_REACTION_THREADS = (
+    "SELECT r.user_id, t.room_id, t.event_id FROM activity_reaction r "
+    "JOIN tracked_event t ON t.event_id = r.target_event_id "
+    "WHERE r.session_id = $1 AND t.room_id IS NOT NULL ORDER BY r.id"
+)
+_DELETE_REACTION = "DELETE FROM activity_reaction WHERE event_id = $1"
+
+_PENDING_REMINDERS = (
+    "SELECT session_id, reminder_type, scheduled_time FROM scheduled_reminder WHERE sent = FALSE"
+)
+_INSERT_REMINDER = (
+    "INSERT INTO scheduled_reminder (session_id, reminder_type, scheduled_time) VALUES ($1, $2, $3)"
+)
+
+_TRACKED_EVENTS_SINCE = (
+    "SELECT t.event_id, t.session_id, t.room_id FROM tracked_event t "
+    "JOIN workflow_session s ON s.id = t.session_id WHERE s.date >= $1"
+)
+_ANNOUNCEMENTS_SINCE = _TRACKED_EVENTS_SINCE + " AND t.kind = 'announcement'"
+# Looked up by primary key, so resolving any tracked message costs one index probe
+_SESSION_FOR_EVENT = (
+    f"SELECT {_SESSION_COLUMNS} FROM tracked_event t JOIN workflow_session s ON s.id = t.session_id "
+    "WHERE t.event_id = $1 AND t.kind = $2"
+)
+_INSERT_TRACKED_EVENT = (
+    "INSERT INTO tracked_event (event_id, session_id, room_id, kind) VALUES ($1, $2, $3, $4) "
+    "ON CONFLICT (event_id) DO NOTHING"
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Session:
+    id: str
+    tenant_id: str
+    date: str
+    alex_confirmation: Optional[str] = None
+    confirmed: bool = False
+    group_message_id: Optional[str] = None
+    confirmation_event_id: Optional[str] = None
+    lunch_reminder_sent: bool = False
+    evening_reminder_sent: bool = False
+
+    @classmethod
+    def from_row(cls, row) -> "Session":
+        return cls(
+            row["id"], row["tenant_id"], row["date"], row["alex_confirmation"], bool(row["confirmed"]),
+            row["group_message_id"], row["confirmation_event_id"],
+            bool(row["lunch_reminder_sent"]), bool(row["evening_reminder_sent"]),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Reaction:
+    session_id: str
+    user_id: str
+    activity: str
+    event_id: Optional[str]
+    # Only needed when inserting, so these are not read back
+    emoji: Optional[str] = None
+    # The announcement reacted to
+    target_event_id: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "Reaction":
+        return cls(row["session_id"], row["user_id"], row["activity"], row["event_id"])
+
+
+@dataclass(frozen=True, slots=True)
+class DatedReaction:
+    """A reaction with what the participation rollups count it under."""
+
+    tenant_id: str
+    user_id: str
+    activity: str
+    date: str
+    session_id: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "DatedReaction":
+        return cls(row["tenant_id"], row["user_id"], row["activity"], row["date"], row["session_id"])
+
+
+@dataclass(frozen=True, slots=True)
+class Reminder:
+    session_id: str
+    reminder_type: str
+    scheduled_time: datetime
+
+    @classmethod
+    def from_row(cls, row) -> "Reminder":
+        return cls(row["session_id"], row["reminder_type"], row["scheduled_time"])
+
+
+@dataclass(frozen=True, slots=True)
+class TrackedEvent:
+    event_id: str
+    session_id: str
+    room_id: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "TrackedEvent":
+        return cls(row["event_id"], row["session_id"], row["room_id"])
+
+
+def _placeholders(count: int) -> str:
+    return "(" + ", ".join(f"${n}" for n in range(1, count + 1)) + ")"
+
+
+# SQLite has no arrays, so lists are bound this many values at a time, the last chunk
+# padded with NULLs, which match nothing; Postgres takes a whole list as one array
+IN_CHUNK_SIZE = 50
+_IN_CHUNK = "IN " + _placeholders(IN_CHUNK_SIZE)
+
+
+async def fetch_in(conn: Union[Connection, Database], query: str, values: Iterable[Any]) -> List:
+    """Fetches the rows ``query`` matches for any of ``values``.
+
+    ``query`` has ``{}`` where the list condition goes, e.g. ``WHERE id {}``, so each
+    query keeps a single text however many values it is given.
+    """
+    values = list(dict.fromkeys(values))
+    if not values:
+        return []
+    if conn.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
+        return list(await conn.fetch(query.format("= ANY($1)"), values))
+    rows = []
+    for i in range(0, len(values), IN_CHUNK_SIZE):
+        chunk = values[i:i + IN_CHUNK_SIZE]
+        chunk += [None] * (IN_CHUNK_SIZE - len(chunk))
+        rows.extend(await conn.fetch(query.format(_IN_CHUNK), *chunk))
+    return rows
+
+
+class _Repository:
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def _conn(self, conn: Optional[Connection]) -> Union[Connection, Database]:
+        return conn or self.database
+
+
+class SessionRepository(_Repository):
+    """Reads and writes ``workflow_session`` rows as :class:`Session` records."""
+
+    async def get(self, session_id: str, conn: Optional[Connection] = None) -> Optional[Session]:
+        row = await self._conn(conn).fetchrow(_GET_SESSION, session_id)
+        return Session.from_row(row) if row else None
+
+    async def get_many(
+        self, session_ids: Iterable[str], conn: Optional[Connection] = None
+    ) -> Dict[str, Session]:
+        rows = await fetch_in(self._conn(conn), _GET_SESSIONS, session_ids)
+        return {row["id"]: Session.from_row(row) for row in rows}
+
+    async def for_date(
+        self, tenant_id: str, date: str, conn: Optional[Connection] = None
+    ) -> Optional[Session]:
+        row = await self._conn(conn).fetchrow(_SESSION_FOR_DATE, tenant_id, date)
+        return Session.from_row(row) if row else None
+
+    async def since(self, date: str, conn: Optional[Connection] = None) -> List[Session]:
+        return [Session.from_row(row) for row in await self._conn(conn).fetch(_SESSIONS_SINCE, date)]
+
+    async def insert(self, conn: Connection, session: Session) -> None:
+        await conn.execute(_INSERT_SESSION, session.id, session.tenant_id, session.date)
+
+    async def delete_for_date(self, conn: Connection, tenant_id: str, date: str) -> None:
+        await conn.execute(_DELETE_SESSIONS_FOR_DATE, tenant_id, date)
+
+    async def set_choice(
+        self, session_id: str, choice: str, confirmed: bool, conn: Optional[Connection] = None
+    ) -> None:
+        await self._conn(conn).execute(_SET_CHOICE, choice, confirmed, session_id)
+
+    async def confirm(self, conn: Connection, session_id: str, choice: str) -> bool:
+        # Returns whether this call confirmed it, so a 👍 seen twice doesn't announce twice
+        return await conn.fetchval(_CONFIRM, choice, session_id) is not None
+
+    async def set_confirmation_event(self, conn: Connection, session_id: str, event_id: str) -> None:
+        await conn.execute(_SET_CONFIRMATION_EVENT, event_id, session_id)
+
+    async def set_group_message(self, conn: Connection, session_id: str, event_id: str) -> bool:
+        # Only the first announcement delivered becomes the session's group message
+        return await conn.fetchval(_SET_GROUP_MESSAGE, event_id, session_id) is not None
+
+    async def mark_reminder_sent(self, conn: Connection, session_id: str, reminder_type: str) -> bool:
+        # Returns whether this call marked it, so a reminder another caller sent isn't repeated
+        return await conn.fetchval(_MARK_REMINDER_SENT[reminder_type], session_id) is not None
+
+
+class ReactionRepository(_Repository):
+    """Reads and writes ``activity_reaction`` rows as :class:`Reaction` records."""
+
+    async def for_session(self, session_id: str, conn: Optional[Connection] = None) -> List[Reaction]:
+        rows = await self._conn(conn).fetch(_REACTIONS_FOR_SESSION, session_id)
+        return [Reaction.from_row(row) for row in rows]
+
+    async def since(self, date: str, conn: Optional[Connection] = None) -> List[Reaction]:
+        return [Reaction.from_row(row) for row in await self._conn(conn).fetch(_REACTIONS_SINCE, date)]
+
+    async def for_date(self, conn: Connection, tenant_id: str, date: str) -> List[DatedReaction]:
+        rows = await conn.fetch(_REACTIONS_FOR_DATE, tenant_id, date)
+        return [DatedReaction.from_row(row) for row in rows]
+
+    async def by_event(self, conn: Connection, event_id: str) -> Optional[DatedReaction]:
+        row = await conn.fetchrow(_REACTION_BY_EVENT, event_id)
+        return DatedReaction.from_row(row) if row else None
+
+    async def existing(self, conn: Connection, event_ids: List[str]) -> Set[str]:
+        rows = await fetch_in(conn, _EXISTING_REACTIONS, event_ids)
+        return {row["event_id"] for row in rows}
+
+    async def insert(self, conn: Connection, reaction: Reaction) -> bool:
+        # Reactions are unique by event ID; returns whether this one is new
+        inserted = await conn.fetchval(
+            _INSERT_REACTION + " RETURNING id",
+            reaction.session_id, reaction.user_id, reaction.activity, reaction.emoji, reaction.event_id,
+            reaction.target_event_id,
+        )
+        return inserted is not None
+
+    async def insert_many(self, conn: Connection, reactions: List[Reaction]) -> None:
+        await conn.executemany(_INSERT_REACTION, [
+            (r.session_id, r.user_id, r.activity, r.emoji, r.event_id, r.target_event_id)
+            for r in reactions
+        ])
+
+    async def threads(
+        self, session_id: str, conn: Optional[Connection] = None
+    ) -> Dict[str, Tuple[str, str]]:
+        # Each friend's (room ID, announcement event ID), from their first reaction
+        threads = {}
+        for row in await self._conn(conn).fetch(_REACTION_THREADS, session_id):
+            threads.setdefault(row["user_id"], (row["room_id"], row["event_id"]))
+        return threads
+
+    async def delete(self, conn: Connection, event_id: str) -> None:
+        await conn.execute(_DELETE_REACTION, event_id)
+
+
+class ReminderRepository(_Repository):
+    """Reads and writes ``scheduled_reminder`` rows as :class:`Reminder` records.
+
+    Claiming and completing due reminders is left to :class:`~.claims.ReminderClaims`.
+    """
+
+    async def pending(self, conn: Optional[Connection] = None) -> List[Reminder]:
+        return [Reminder.from_row(row) for row in await self._conn(conn).fetch(_PENDING_REMINDERS)]
+
+    async def insert_many(self, reminders: List[Reminder], conn: Optional[Connection] = None) -> None:
+        await self._conn(conn).executemany(_INSERT_REMINDER, [
+            (r.session_id, r.reminder_type, r.scheduled_time) for r in reminders
+        ])
+
+
+class TrackedEventRepository(_Repository):
+    """Reads and writes ``tracked_event`` rows as :class:`TrackedEvent` records."""
+
+    async def since(self, date: str, conn: Optional[Connection] = None) -> List[TrackedEvent]:
+        rows = await self._conn(conn).fetch(_TRACKED_EVENTS_SINCE, date)
+        return [TrackedEvent.from_row(row) for row in rows]
+
+    async def announcements_since(self, date: str, conn: Optional[Connection] = None) -> List[TrackedEvent]:
+        rows = await self._conn(conn).fetch(_ANNOUNCEMENTS_SINCE, date)
+        return [TrackedEvent.from_row(row) for row in rows]
+
+    async def session_for(
+        self, event_id: str, kind: str, conn: Optional[Connection] = None
+    ) -> Optional[Session]:
+        row = await self._conn(conn).fetchrow(_SESSION_FOR_EVENT, event_id, kind)
+        return Session.from_row(row) if row else None
+
+    async def insert(self, conn: Connection, event: TrackedEvent, kind: str) -> None:
+        await conn.execute(_INSERT_TRACKED_EVENT, event.event_id, event.session_id, event.room_id, kind)
@@ -0,0 +1,141 @@
+import json
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from mautrix.util.async_db import Database, Scheme
+from mautrix.util.logging import TraceLogger
+
+from .clock import Clock
+from .metrics import Metrics
+
+SummaryRow = Tuple[str, str, str, int, int, str]
+
+# Every table an archive run deletes from or writes to; the plugin may share its
+# database with others, whose tables are theirs to maintain
+ARCHIVE_TABLES = (
+    "workflow_session", "activity_reaction", "scheduled_reminder", "tracked_event",
+    "backfill_checkpoint", "outbox", "session_event", "daily_summary",
+)
+
+
+class RetentionJob:
+    """Rolls old sessions up into ``daily_summary`` and deletes their raw rows.
+
+    Sessions are archived a few dates at a time, each batch in its own short
+    transaction, so the job never holds the database long enough to delay event
+    handling. Deleting a session cascades to its reactions, reminders and tracked
+    events.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        metrics: Metrics,
+        log: TraceLogger,
+        days: int = 90,
+        reaction_window_days: int = 1,
+        batch_size: int = 20,
+        pause: float = 0.1,
+        vacuum_ratio: float = 0.25,
+        clock: Clock = Clock(),
+    ) -> None:
+        self.database = database
+        self.metrics = metrics
+        self.log = log
+        # Sessions still accepting reactions must keep their rows, as must the day before
+        # the reaction window, which a reaction around midnight may still reach
+        self.days = max(max(0, reaction_window_days) + 1, days)
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        # VACUUM rewrites the whole file, so it only runs once this share of it is free
+        self.vacuum_ratio = vacuum_ratio
+        self.clock = clock
+
+    async def run(self) -> int:
+        started = time.monotonic()
+        cutoff = (self.clock.now() - timedelta(days=self.days)).strftime("%Y-%m-%d")
+        archived = 0
+        while True:
+            batch = await self._archive_batch(cutoff)
+            if not batch:
+                break
+            archived += batch
+            self.metrics.inc("retention_sessions_archived_total", batch)
+            self.log.info(f"Archived {archived} sessions from before {cutoff} so far")
+            await self.clock.sleep(self.pause)
+        if archived:
+            await self._compact()
+        
+        duration = time.monotonic() - started
+        self.metrics.set("retention_duration_seconds", duration)
+        self.metrics.set("retention_last_run_timestamp", self.clock.now().timestamp())
+        self.log.info(
+            f"Retention archived {archived} sessions from before {cutoff} "
+            f"in {duration * 1000:.1f} ms"
+        )
+        return archived
+
+    async def _archive_batch(self, cutoff: str) -> int:
+        async with self.database.acquire() as conn, conn.transaction():
+            dates = await conn.fetch(
+                "SELECT DISTINCT date FROM workflow_session WHERE date < $1 ORDER BY date LIMIT $2",
+                cutoff, self.batch_size
+            )
+            if not dates:
+                return 0
+            through = dates[-1]['date']
+            reactions = await conn.fetch(
+                "SELECT s.tenant_id, s.date, r.activity, r.user_id FROM activity_reaction r "
+                "JOIN workflow_session s ON s.id = r.session_id WHERE s.date <= $1",
+                through
+            )
+            summaries = self.summarise(reactions)
+            if summaries:
+                await conn.executemany(
+                    "INSERT INTO daily_summary "
+                    "(tenant_id, date, activity, reaction_count, participant_count, participants) "
+                    "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (tenant_id, date, activity) "
+                    "DO UPDATE SET reaction_count = excluded.reaction_count, "
+                    "participant_count = excluded.participant_count, "
+                    "participants = excluded.participants",
+                    summaries
+                )
+            # Checkpoints aren't tied to sessions by a foreign key, so remove them explicitly
+            await conn.execute(
+                "DELETE FROM backfill_checkpoint WHERE event_id IN ("
+                "SELECT t.event_id FROM tracked_event t "
+                "JOIN workflow_session s ON s.id = t.session_id WHERE s.date <= $1 "
+                "UNION SELECT confirmation_event_id FROM workflow_session WHERE date <= $1)",
+                through
+            )
+            count = await conn.fetchval(
+                "SELECT COUNT(*) FROM workflow_session WHERE date <= $1", through
+            )
+            # Reactions, reminders and tracked events are removed by ON DELETE CASCADE
+            await conn.execute("DELETE FROM workflow_session WHERE date <= $1", through)
+        return count
+
+    @staticmethod
+    def summarise(reactions: Iterable[Dict]) -> List[SummaryRow]:
+        counts: Dict[Tuple[str, str, str], int] = {}
+        participants: Dict[Tuple[str, str, str], set] = {}
+        for reaction in reactions:
+            key = (reaction['tenant_id'], reaction['date'], reaction['activity'])
+            counts[key] = counts.get(key, 0) + 1
+            participants.setdefault(key, set()).add(reaction['user_id'])
+        return [
+            (*key, count, len(participants[key]), json.dumps(sorted(participants[key])))
+            for key, count in counts.items()
+        ]
+
+    async def _compact(self) -> None:
+        if self.database.scheme == Scheme.SQLITE:
+            # SQLite never shrinks its file on its own; Postgres relies on autovacuum
+            free = await self.database.fetchval("PRAGMA freelist_count")
+            pages = await self.database.fetchval("PRAGMA page_count")
+            if pages and free >= pages * self.vacuum_ratio:
+                self.log.info(f"Vacuuming {free} free pages of {pages}")
+                await self.database.execute("VACUUM")
+        for table in ARCHIVE_TABLES:
+            await self.database.execute(f"ANALYZE {table}")
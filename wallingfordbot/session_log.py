@@ -0,0 +1,157 @@
+import json
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from mautrix.util.async_db import Connection, Database
+
+from .clock import Clock
+from .repository import Session
+
+WEBHOOK_RECEIVED = "webhook_received"
+CONFIRMATION_REQUESTED = "confirmation_requested"
+CHOICE_MADE = "choice_made"
+CONFIRMED = "confirmed"
+ANNOUNCED = "announced"
+REACTION_ADDED = "reaction_added"
+REACTION_REMOVED = "reaction_removed"
+REMINDER_SENT = "reminder_sent"
+
+_APPEND_EVENT = (
+    "INSERT INTO session_event (session_id, kind, data, created_at) VALUES ($1, $2, $3, $4)"
+)
+_EVENTS = (
+    "SELECT id, session_id, kind, data, created_at FROM session_event "
+    "WHERE session_id = $1 ORDER BY id"
+)
+_APPLIED_REACTIONS = (
+    "SELECT data FROM session_event WHERE session_id = $1 AND kind IN ($2, $3)"
+)
+
+Reactions = Dict[str, Dict[str, Optional[str]]]
+
+
+@dataclass(frozen=True, slots=True)
+class SessionEvent:
+    id: int
+    session_id: str
+    kind: str
+    data: Dict[str, Any]
+    created_at: Any = None
+
+    @classmethod
+    def from_row(cls, row) -> "SessionEvent":
+        return cls(row["id"], row["session_id"], row["kind"], json.loads(row["data"]), row["created_at"])
+
+
+@dataclass(slots=True)
+class SessionView:
+    """A session's state as folded from its events."""
+
+    session: Session
+    # activity -> user id -> reaction event id, as in the runtime state
+    reactions: Reactions = field(default_factory=dict)
+    # announcement event id -> room id
+    announcements: Dict[str, Optional[str]] = field(default_factory=dict)
+    last_event_id: int = 0
+
+    def apply(self, event: SessionEvent) -> None:
+        data = event.data
+        session = self.session
+        if event.kind == CONFIRMATION_REQUESTED:
+            self.session = replace(session, confirmation_event_id=data["event_id"])
+        elif event.kind == CHOICE_MADE:
+            self.session = replace(session, alex_confirmation=data["choice"], confirmed=False)
+        elif event.kind == CONFIRMED:
+            self.session = replace(session, alex_confirmation=data["choice"], confirmed=True)
+        elif event.kind == ANNOUNCED:
+            self.announcements[data["event_id"]] = data.get("room_id")
+            if not session.group_message_id:
+                self.session = replace(session, group_message_id=data["event_id"])
+        elif event.kind == REACTION_ADDED:
+            users = self.reactions.setdefault(data["activity"], {})
+            users[data["user_id"]] = data["event_id"]
+        elif event.kind == REACTION_REMOVED:
+            for users in self.reactions.values():
+                for user_id, event_id in list(users.items()):
+                    if event_id == data["event_id"]:
+                        del users[user_id]
+        elif event.kind == REMINDER_SENT:
+            self.session = replace(session, **{f"{data['reminder_type']}_reminder_sent": True})
+        self.last_event_id = event.id
+
+    def to_json(self) -> str:
+        session = self.session
+        return json.dumps({
+            "session": {
+                "tenant_id": session.tenant_id,
+                "date": session.date,
+                "alex_confirmation": session.alex_confirmation,
+                "confirmed": session.confirmed,
+                "group_message_id": session.group_message_id,
+                "confirmation_event_id": session.confirmation_event_id,
+                "lunch_reminder_sent": session.lunch_reminder_sent,
+                "evening_reminder_sent": session.evening_reminder_sent,
+            },
+            "reactions": self.reactions,
+            "announcements": self.announcements,
+        }, ensure_ascii=False)
+
+
+def fold(view: Optional[SessionView], events: Iterable[SessionEvent]) -> Optional[SessionView]:
+    """Applies ``events`` in order to ``view``, which may be ``None`` before the first event.
+
+    A session comes into existence with its :data:`WEBHOOK_RECEIVED` event, so
+    anything logged for it earlier is skipped.
+    """
+    for event in events:
+        if event.kind == WEBHOOK_RECEIVED:
+            view = SessionView(
+                Session(event.session_id, event.data["tenant_id"], event.data["date"]),
+                last_event_id=event.id,
+            )
+        elif view is not None:
+            view.apply(event)
+    return view
+
+
+class SessionLog:
+    """Append-only history of every session transition, in ``session_event``.
+
+    Appends run inside the transaction making the change they record, so the log
+    and the ``workflow_session`` rows that date and reminder queries read never
+    disagree. The log is an audit trail: nothing reads it on the event path,
+    :meth:`load` folds a session's events only when asked to explain it, and
+    backfill asks :meth:`applied_reactions` which of Alex's reactions it has seen.
+    """
+
+    def __init__(self, database: Database, clock: Clock = Clock()) -> None:
+        self.database = database
+        self.clock = clock
+
+    async def append(self, conn: Connection, session_id: str, kind: str, **data: Any) -> None:
+        await conn.execute(
+            _APPEND_EVENT, session_id, kind, json.dumps(data, ensure_ascii=False), self.clock.now()
+        )
+
+    async def append_many(
+        self, conn: Connection, events: List[Tuple[str, str, Dict[str, Any]]]
+    ) -> None:
+        now = self.clock.now()
+        await conn.executemany(_APPEND_EVENT, [
+            (session_id, kind, json.dumps(data, ensure_ascii=False), now)
+            for session_id, kind, data in events
+        ])
+
+    async def events(self, session_id: str, conn: Optional[Connection] = None) -> List[SessionEvent]:
+        rows = await (conn or self.database).fetch(_EVENTS, session_id)
+        return [SessionEvent.from_row(row) for row in rows]
+
+    async def applied_reactions(self, session_id: str, conn: Optional[Connection] = None) -> Set[str]:
+        """Returns the event IDs of Alex's reactions already applied to the session."""
+        rows = await (conn or self.database).fetch(_APPLIED_REACTIONS, session_id, CHOICE_MADE, CONFIRMED)
+        # Entries logged before reactions carried their event ID have none to skip
+        data = [json.loads(row["data"]) for row in rows]
+        return {entry["event_id"] for entry in data if entry.get("event_id")}
+
+    async def load(self, session_id: str, conn: Optional[Connection] = None) -> Optional[SessionView]:
+        return fold(None, await self.events(session_id, conn=conn))
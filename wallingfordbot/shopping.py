@@ -0,0 +1,27 @@
+import math
+from typing import Any, Dict, List
+
+
+def shopping_list(activities: Dict[str, Any], headcounts: Dict[str, int]) -> List[str]:
+    """Item lines for the evening activities people chose.
+
+    Each activity may list ``shopping`` rules of the form ``{item, per_head, fixed, unit}``;
+    the quantity is ``per_head`` times the activity's headcount plus ``fixed``, rounded
+    up. Quantities of the same item from different activities are added together.
+    """
+    quantities: Dict[str, float] = {}
+    units: Dict[str, str] = {}
+    for activity, heads in headcounts.items():
+        if not heads:
+            continue
+        for rule in activities.get(activity, {}).get("shopping", []):
+            item = rule["item"]
+            quantities[item] = (
+                quantities.get(item, 0) + rule.get("per_head", 1) * heads + rule.get("fixed", 0)
+            )
+            units.setdefault(item, rule.get("unit", ""))
+    return [
+        " ".join(filter(None, [str(math.ceil(quantity)), units[item], item]))
+        for item, quantity in quantities.items()
+        if quantity > 0
+    ]
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import tempfile
+import time as timer
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import Dict, List, Optional
+
+from mautrix.types import (
+    EventID, EventType, ReactionEvent, ReactionEventContent, RelatesTo, RelationType, RoomID,
+    UserID
+)
+from mautrix.util.async_db import Database
+from mautrix.util.config import RecursiveDict
+from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap
+
+from .bot import WallingfordBot
+from .clock import Clock, VirtualClock
+from .config import Config
+from .db import upgrade_table
+
+
+@dataclass(frozen=True)
+class SimulatedMessage:
+    time: datetime
+    room_id: RoomID
+    text: str
+    event_id: EventID
+
+
+class FakeClient:
+    """Stands in for the Matrix client, recording what the bot sends at what simulated time.
+
+    Messages get made-up event IDs, unless ``event_ids`` lists the IDs to hand out, in
+    order, for messages to each room.
+    """
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        mxid: UserID = UserID("@wallingfordbot:simulation"),
+        event_ids: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        self.clock = clock
+        self.mxid = mxid
+        self.sent: List[SimulatedMessage] = []
+        self.reactions: List[tuple] = []
+        self._ids = itertools.count(1)
+        self._event_ids = {room_id: list(ids) for room_id, ids in (event_ids or {}).items()}
+
+    def next_event_id(self) -> EventID:
+        return EventID(f"$simulated{next(self._ids)}")
+
+    async def send_text(self, room_id: RoomID, text: Optional[str] = None, **kwargs) -> EventID:
+        scripted = self._event_ids.get(room_id)
+        event_id = EventID(scripted.pop(0)) if scripted else self.next_event_id()
+        self.sent.append(SimulatedMessage(self.clock.now(), room_id, text or kwargs.get("html", ""), event_id))
+        return event_id
+
+    async def send_message(self, room_id: RoomID, content, **kwargs) -> EventID:
+        return await self.send_text(room_id, content.body)
+
+    async def react(self, room_id: RoomID, event_id: EventID, key: str) -> EventID:
+        self.reactions.append((room_id, event_id, key))
+        return self.next_event_id()
+
+    async def create_room(self, invitees=(), **kwargs) -> RoomID:
+        return RoomID(f"!dm{next(self._ids)}:simulation")
+
+    async def get_joined_members(self, room_id: RoomID) -> Dict:
+        return {}
+
+
+class DaySimulation:
+    """Runs a whole workflow day against the real handlers in a fraction of a second.
+
+    The bot gets a :class:`VirtualClock`, a :class:`FakeClient` and its own SQLite
+    database, but none of its background loops: the simulation makes the webhook
+    call, feeds in Alex's confirmation and the friends' reactions, then jumps the
+    clock from one due reminder to the next, draining the outbox after every step.
+    """
+
+    def __init__(self, bot: WallingfordBot, clock: VirtualClock, client: FakeClient) -> None:
+        self.bot = bot
+        self.clock = clock
+        self.client = client
+
+    @classmethod
+    async def create(
+        cls,
+        config: Config,
+        database: Database,
+        day: date,
+        event_ids: Optional[Dict[str, List[str]]] = None,
+    ) -> "DaySimulation":
+        clock = VirtualClock(datetime.combine(day, time(0, 0)))
+        client = FakeClient(clock, event_ids=event_ids)
+        # A simulation must never append to the instance's real recording
+        config["recording.enabled"] = False
+        bot = WallingfordBot(
+            client=client, loop=asyncio.get_running_loop(), http=None,
+            instance_id="simulation", log=logging.getLogger("wallingfordbot.simulation"),
+            config=config, database=database, webapp=None, webapp_url=None, loader=None,
+        )
+        bot.clock = clock
+        bot.setup()
+        await bot.warm_up()
+        return cls(bot, clock, client)
+
+    async def run(
+        self,
+        arrival: time = time(9, 0),
+        confirmation: str = "🏠",
+        reactions: Optional[Dict[str, List[str]]] = None,
+        tenant_id: Optional[str] = None,
+    ) -> List[SimulatedMessage]:
+        tenant = self.bot.tenants.get(tenant_id)
+        day = self.clock.now().date()
+        await self.clock.advance_to(datetime.combine(day, arrival))
+
+        # Home Assistant reports Alex's arrival
+        await self.bot.process_webhook({"tenant": tenant.id})
+        await self.deliver()
+
+        await self.clock.advance(60)
+        request = self.last_message(tenant.private_room)
+        for emoji in (confirmation, "👍"):
+            await self.bot.dispatch_queued_event(self.reaction(tenant.user_id, request, emoji))
+        await self.deliver()
+
+        await self.clock.advance(60)
+        announcement = self.last_message(tenant.group_room)
+        if announcement:
+            for user_id, activities in (reactions or {}).items():
+                for activity in activities:
+                    emoji = tenant.activities[activity]["emoji"]
+                    await self.bot.dispatch_queued_event(self.reaction(user_id, announcement, emoji))
+            await self.deliver()
+
+        # Jump straight to each reminder rather than ticking through the day
+        end_of_day = datetime.combine(day, time(23, 59))
+        while True:
+            due = self.bot.state.next_reminder_time()
+            if due is None or due > end_of_day:
+                break
+            await self.clock.advance_to(due)
+            await self.bot.check_pending_reminders()
+            await self.deliver()
+            if self.bot.state.next_reminder_time() == due:
+                self.bot.log.warning(f"Reminder due at {due} was not sent, ending the simulation")
+                break
+        await self.clock.advance_to(end_of_day)
+        return self.client.sent
+
+    async def deliver(self) -> None:
+        while await self.bot.outbox.drain(self.clock.now()):
+            pass
+
+    def last_message(self, room_id: RoomID) -> Optional[SimulatedMessage]:
+        return next((message for message in reversed(self.client.sent) if message.room_id == room_id), None)
+
+    def reaction(self, sender: UserID, target: SimulatedMessage, emoji: str) -> ReactionEvent:
+        return ReactionEvent(
+            event_id=self.client.next_event_id(),
+            room_id=target.room_id,
+            sender=UserID(sender),
+            timestamp=int(self.clock.now().timestamp() * 1000),
+            content=ReactionEventContent(relates_to=RelatesTo(
+                rel_type=RelationType.ANNOTATION, event_id=target.event_id, key=emoji
+            )),
+            type=EventType.REACTION,
+        )
+
+
+def load_config(base_path: str, config_path: Optional[str] = None) -> Config:
+    yaml = YAML()
+    with open(base_path) as file:
+        base = RecursiveDict(yaml.load(file), CommentedMap)
+    data = None
+    if config_path:
+        with open(config_path) as file:
+            data = yaml.load(file)
+    config = Config(lambda: data, lambda: base, lambda _: None)
+    config.load_and_update()
+    return config
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Dry-run a WallingfordBot config through a simulated day")
+    parser.add_argument("--config", help="instance config to simulate, defaults to the base config")
+    parser.add_argument("--base-config", default="base-config.yaml")
+    parser.add_argument("--date", type=date.fromisoformat, default=Clock().now().date())
+    parser.add_argument("--confirmation", default="🏠", help="Alex's confirmation emoji")
+    parser.add_argument(
+        "--react", action="append", default=[], metavar="USER=ACTIVITY[,ACTIVITY]",
+        help="a friend's activity reactions, e.g. @bob:example.com=lunch,pub_dinner",
+    )
+    args = parser.parse_args()
+    reactions = {}
+    for spec in args.react:
+        user_id, _, activities = spec.partition("=")
+        reactions[user_id] = activities.split(",")
+
+    config = load_config(args.base_config, args.config)
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database.create(f"sqlite:{directory}/simulation.db", upgrade_table=upgrade_table)
+        await database.start()
+        try:
+            started = timer.monotonic()
+            simulation = await DaySimulation.create(config, database, args.date)
+            messages = await simulation.run(confirmation=args.confirmation, reactions=reactions)
+            elapsed = timer.monotonic() - started
+        finally:
+            await database.stop()
+    for message in messages:
+        print(f"{message.time:%H:%M} {message.room_id}\n  " + message.text.replace("\n", "\n  "))
+    print(f"Simulated {len(messages)} messages in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .repository import Reaction, Reminder, Session, TrackedEvent
+
+ReminderKey = Tuple[str, str]
+SessionKey = Tuple[str, str]
+
+TRACKED_EVENT_FIELDS = ("group_message_id", "confirmation_event_id")
+
+
+class RuntimeState:
+    """In-memory copy of the live workflow state.
+
+    The state is filled in bulk by the startup warm-up and kept current by writing
+    through every change the bot makes to the database. Until :attr:`ready` is set,
+    callers must fall back to querying the database.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.sessions: Dict[str, Session] = {}
+        # (tenant id, date) -> session id
+        self.session_by_date: Dict[SessionKey, str] = {}
+        self.tracked_events: Dict[str, str] = {}
+        # session id -> activity -> user id -> reaction event id
+        self.reactions: Dict[str, Dict[str, Dict[str, Optional[str]]]] = {}
+        self.reaction_index: Dict[str, Tuple[str, str, str]] = {}
+        self.pending_reminders: Dict[ReminderKey, datetime] = {}
+
+    def load(
+        self,
+        sessions: Iterable[Session],
+        reactions: Iterable[Reaction],
+        reminders: Iterable[Reminder],
+        tracked_events: Iterable[TrackedEvent] = (),
+    ) -> None:
+        self.sessions.clear()
+        self.session_by_date.clear()
+        self.tracked_events.clear()
+        self.reactions.clear()
+        self.reaction_index.clear()
+        self.pending_reminders.clear()
+        for session in sessions:
+            self.put_session(session)
+        for reaction in reactions:
+            self.add_reaction(
+                reaction.session_id, reaction.user_id, reaction.activity, reaction.event_id
+            )
+        for reminder in reminders:
+            self.add_reminder(reminder.session_id, reminder.reminder_type, reminder.scheduled_time)
+        for tracked in tracked_events:
+            self.track_event(tracked.event_id, tracked.session_id)
+        self.ready = True
+
+    def put_session(self, session: Session) -> None:
+        self.sessions[session.id] = session
+        self.session_by_date[(session.tenant_id, session.date)] = session.id
+        for field in TRACKED_EVENT_FIELDS:
+            if getattr(session, field):
+                self.tracked_events[getattr(session, field)] = session.id
+
+    def update_session(self, session_id: str, **fields: Any) -> None:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        # Sessions are immutable, so readers holding the old one never see a half-applied update
+        self.sessions[session_id] = replace(session, **fields)
+        for field in TRACKED_EVENT_FIELDS:
+            if fields.get(field):
+                self.tracked_events[fields[field]] = session_id
+
+    def track_event(self, event_id: str, session_id: str) -> None:
+        self.tracked_events[event_id] = session_id
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        return self.sessions.get(session_id)
+
+    def session_for_date(self, tenant_id: str, date: str) -> Optional[Session]:
+        session_id = self.session_by_date.get((tenant_id, date))
+        return self.sessions.get(session_id) if session_id else None
+
+    def drop_sessions_for_date(self, tenant_id: str, date: str) -> None:
+        for session_id in [
+            s.id for s in self.sessions.values() if s.tenant_id == tenant_id and s.date == date
+        ]:
+            self._drop_session(session_id)
+        self.session_by_date.pop((tenant_id, date), None)
+
+    def prune(self, before_date: str) -> None:
+        for session_id in [s.id for s in self.sessions.values() if s.date < before_date]:
+            self._drop_session(session_id)
+
+    def _drop_session(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id)
+        key = (session.tenant_id, session.date)
+        if self.session_by_date.get(key) == session_id:
+            del self.session_by_date[key]
+        for event_id in [e for e, s in self.tracked_events.items() if s == session_id]:
+            del self.tracked_events[event_id]
+        for activity_users in self.reactions.pop(session_id, {}).values():
+            for event_id in activity_users.values():
+                self.reaction_index.pop(event_id, None)
+        for key in [k for k in self.pending_reminders if k[0] == session_id]:
+            del self.pending_reminders[key]
+
+    def add_reaction(
+        self, session_id: str, user_id: str, activity: str, event_id: Optional[str]
+    ) -> None:
+        users = self.reactions.setdefault(session_id, {}).setdefault(activity, {})
+        users[user_id] = event_id
+        if event_id:
+            self.reaction_index[event_id] = (session_id, activity, user_id)
+
+    def remove_reaction(self, event_id: str) -> None:
+        entry = self.reaction_index.pop(event_id, None)
+        if entry is None:
+            return
+        session_id, activity, user_id = entry
+        users = self.reactions.get(session_id, {}).get(activity, {})
+        if users.get(user_id) == event_id:
+            del users[user_id]
+
+    def participants(self, session_id: str, activity: str) -> List[str]:
+        return list(self.reactions.get(session_id, {}).get(activity, {}))
+
+    def activity_participants(self, session_id: str) -> Dict[str, List[str]]:
+        return {
+            activity: list(users)
+            for activity, users in self.reactions.get(session_id, {}).items()
+            if users
+        }
+
+    def reaction_rows(self, session_id: str) -> List[Reaction]:
+        return [
+            Reaction(session_id, user_id, activity, event_id)
+            for activity, users in self.reactions.get(session_id, {}).items()
+            for user_id, event_id in users.items()
+        ]
+
+    def add_reminder(self, session_id: str, reminder_type: str, scheduled_time: datetime) -> None:
+        self.pending_reminders[(session_id, reminder_type)] = scheduled_time
+
+    def remove_reminder(self, session_id: str, reminder_type: str) -> None:
+        self.pending_reminders.pop((session_id, reminder_type), None)
+
+    def next_reminder_time(self) -> Optional[datetime]:
+        return min(self.pending_reminders.values(), default=None)
@@ -0,0 +1,98 @@
+import json
+from datetime import date as Date
+from typing import Any, Dict, Iterable, List, Tuple
+
+from mautrix.util.async_db import Database
+
+# (tenant id, user id, activity, session date, change in count)
+Participation = Tuple[str, str, str, str, int]
+RollupRow = Tuple[str, str, str, str, str, int]
+
+
+def buckets(date: str) -> List[Tuple[str, str]]:
+    day = Date.fromisoformat(date)
+    year, week, _ = day.isocalendar()
+    return [("week", f"{year}-W{week:02d}"), ("month", date[:7])]
+
+
+def rollup_rows(participations: Iterable[Participation]) -> List[RollupRow]:
+    counts: Dict[Tuple[str, str, str, str, str], int] = {}
+    for tenant_id, user_id, activity, date, delta in participations:
+        for period, bucket in buckets(date):
+            key = (tenant_id, user_id, activity, period, bucket)
+            counts[key] = counts.get(key, 0) + delta
+    return [(*key, count) for key, count in counts.items() if count]
+
+
+class ParticipationStats:
+    """Participation counts per friend and activity, rolled up by week and month.
+
+    The rollups are updated in the same transaction as the reactions they count, so
+    reading them never scans ``activity_reaction``. Every update also bumps the tenant's
+    row in ``participation_version``, which is what the ETag is made from: it becomes
+    visible with the rollups it describes, and every instance sharing the database hands
+    out the same ETag for the same data. Rendered summaries are cached until it changes.
+
+    The version is read from the database on every request, so even a conditional GET
+    answered with 304 costs one primary-key lookup. A version cached in process would
+    save it but miss the updates other instances make.
+    """
+
+    def __init__(self, database: Database) -> None:
+        self.database = database
+        self._cache: Dict[str, Tuple[str, str]] = {}
+
+    async def etag(self, tenant_id: str, conn=None) -> str:
+        version = await (conn or self.database).fetchval(
+            "SELECT version FROM participation_version WHERE tenant_id = $1", tenant_id
+        )
+        return f'"{tenant_id}-{version or 0}"'
+
+    async def record(self, conn, participations: Iterable[Participation]) -> None:
+        rows = rollup_rows(participations)
+        if not rows:
+            return
+        await conn.executemany(
+            "INSERT INTO participation_rollup (tenant_id, user_id, activity, period, bucket, count) "
+            "VALUES ($1, $2, $3, $4, $5, $6) "
+            "ON CONFLICT (tenant_id, user_id, activity, period, bucket) "
+            "DO UPDATE SET count = participation_rollup.count + excluded.count",
+            rows
+        )
+        await conn.executemany(
+            "INSERT INTO participation_version (tenant_id, version) VALUES ($1, 1) "
+            "ON CONFLICT (tenant_id) DO UPDATE SET version = participation_version.version + 1",
+            [(tenant_id,) for tenant_id in sorted({row[0] for row in rows})]
+        )
+
+    async def snapshot(self, tenant_id: str) -> Tuple[str, str]:
+        # Taken before querying, so an update that lands meanwhile invalidates the result
+        etag = await self.etag(tenant_id)
+        cached = self._cache.get(tenant_id)
+        if cached and cached[0] == etag:
+            return cached
+        body = json.dumps(await self.summary(tenant_id))
+        self._cache[tenant_id] = (etag, body)
+        return etag, body
+
+    async def summary(self, tenant_id: str) -> Dict[str, Any]:
+        rows = await self.database.fetch(
+            "SELECT user_id, activity, period, bucket, count FROM participation_rollup "
+            "WHERE tenant_id = $1 AND count > 0",
+            tenant_id
+        )
+        friends: Dict[str, Dict[str, int]] = {}
+        trends: Dict[str, Dict[str, Dict[str, int]]] = {"week": {}, "month": {}}
+        for row in rows:
+            activities = trends[row['period']].setdefault(row['bucket'], {})
+            activities[row['activity']] = activities.get(row['activity'], 0) + row['count']
+            # Every participation is in exactly one month, so those add up to the totals
+            if row['period'] == "month":
+                totals = friends.setdefault(row['user_id'], {})
+                totals[row['activity']] = totals.get(row['activity'], 0) + row['count']
+        return {
+            "tenant": tenant_id,
+            "friends": friends,
+            "weekly": dict(sorted(trends["week"].items())),
+            "monthly": dict(sorted(trends["month"].items())),
+        }
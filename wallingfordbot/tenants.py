@@ -0,0 +1,84 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from mautrix.types import RoomID, UserID
+from mautrix.util.logging import TraceLogger
+
+from .config import Config
+
+
+@dataclass(frozen=True, eq=False)
+class Tenant:
+    id: str
+    name: str
+    user_id: UserID
+    private_room: RoomID
+    group_rooms: Tuple[RoomID, ...]
+    activities: Dict[str, Any]
+    emoji_to_activity: Dict[str, str] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "emoji_to_activity",
+            {activity["emoji"]: key for key, activity in self.activities.items()},
+        )
+
+    @property
+    def group_room(self) -> RoomID:
+        return self.group_rooms[0]
+
+    @property
+    def rooms(self) -> Tuple[RoomID, ...]:
+        return (self.private_room, *self.group_rooms)
+
+    def activity_for_emoji(self, emoji: str) -> Optional[str]:
+        return self.emoji_to_activity.get(emoji)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], default_activities: Dict[str, Any]) -> "Tenant":
+        group_rooms = data.get("group_rooms") or [data["group_room"]]
+        return cls(
+            id=data["id"],
+            name=data.get("name", "Alex"),
+            user_id=UserID(data["user_id"]),
+            private_room=RoomID(data["private_room"]),
+            group_rooms=tuple(RoomID(room_id) for room_id in group_rooms),
+            activities=data.get("activities") or default_activities,
+        )
+
+
+class TenantRouter:
+    """Maps households to their rooms so each event is routed with one dict lookup."""
+
+    def __init__(self, tenants: List[Tenant], log: Optional[TraceLogger] = None) -> None:
+        self.by_id: Dict[str, Tenant] = {}
+        self.by_room: Dict[RoomID, Tenant] = {}
+        self.default: Optional[Tenant] = tenants[0] if tenants else None
+        for tenant in tenants:
+            self.by_id[tenant.id] = tenant
+            for room_id in tenant.rooms:
+                owner = self.by_room.setdefault(room_id, tenant)
+                if owner is not tenant and log:
+                    log.warning(
+                        f"Room {room_id} is configured for both {owner.id} and {tenant.id}, "
+                        f"routing it to {owner.id}"
+                    )
+        self.room_ids: FrozenSet[RoomID] = frozenset(self.by_room)
+
+    @classmethod
+    def from_config(cls, config: Config, log: Optional[TraceLogger] = None) -> "TenantRouter":
+        return cls(
+            [Tenant.from_dict(data, config.activities) for data in config.tenants], log=log
+        )
+
+    def get(self, tenant_id: Optional[str] = None) -> Optional[Tenant]:
+        if tenant_id is None:
+            return self.default
+        return self.by_id.get(tenant_id)
+
+    def for_room(self, room_id: RoomID) -> Optional[Tenant]:
+        return self.by_room.get(room_id)
+
+    def __len__(self) -> int:
+        return len(self.by_id)